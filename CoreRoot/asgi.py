@@ -9,14 +9,16 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 
 import os
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-import core.comment.routing  # путь подстрой под себя
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CoreRoot.settings')
 
+# приложение Django должно быть инициализировано до импорта consumers/auth
 django_asgi_app = get_asgi_application()
 
+from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.auth import AuthMiddlewareStack
+import core.comment.routing  # путь подстрой под себя
+
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
@@ -25,4 +27,3 @@ application = ProtocolTypeRouter({
         )
     ),
 })
-
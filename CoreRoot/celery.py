@@ -6,3 +6,5 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CoreRoot.settings')
 app = Celery('CoreRoot')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
+# задачи приложений лежат в <app>/celery_tasks/tasks.py
+app.autodiscover_tasks(related_name='celery_tasks.tasks')
@@ -0,0 +1,6 @@
+from prometheus_client import multiprocess
+
+
+def child_exit(server, worker):
+    # gauge умершего воркера не должен попадать в сумму livesum
+    multiprocess.mark_process_dead(worker.pid)
@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -85,7 +85,7 @@ TEMPLATES = [
 ]
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.auth.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -239,4 +239,119 @@ CACHES = {
     }
 }
 
-ACTIVATION_DOMAIN = "localhost:8000"
\ No newline at end of file
+ACTIVATION_DOMAIN = "localhost:8000"
+
+# Кеш страниц ленты комментариев для анонимов (секунды)
+COMMENT_LIST_CACHE_TIMEOUT = config("COMMENT_LIST_CACHE_TIMEOUT", default=60, cast=int)
+COMMENT_LIST_CACHE_LOCK_TIMEOUT = config("COMMENT_LIST_CACHE_LOCK_TIMEOUT", default=5, cast=int)
+# пока страницу пересчитывает другой запрос: отдается прошлая версия (живет STALE_TIMEOUT),
+# а без нее ждем готовую не дольше WAIT секунд
+COMMENT_LIST_CACHE_STALE_TIMEOUT = config("COMMENT_LIST_CACHE_STALE_TIMEOUT", default=10 * 60, cast=int)
+COMMENT_LIST_CACHE_WAIT = config("COMMENT_LIST_CACHE_WAIT", default=0.5, cast=float)
+
+# Фоновая отправка WebSocket событий
+COMMENT_BROADCAST_BATCH_SIZE = config("COMMENT_BROADCAST_BATCH_SIZE", default=100, cast=int)
+COMMENT_BROADCAST_QUEUE_SIZE = config("COMMENT_BROADCAST_QUEUE_SIZE", default=10000, cast=int)
+
+# Загрузка вложений комментариев: проверки идут потоково, до буферизации файла
+FILE_UPLOAD_HANDLERS = [
+    "core.comment.upload_handlers.AttachmentUploadHandler",
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
+# больше этого размера загрузка пишется во временный файл, а не в память
+FILE_UPLOAD_MAX_MEMORY_SIZE = config("FILE_UPLOAD_MAX_MEMORY_SIZE", default=2621440, cast=int)
+ATTACHMENT_MAX_IMAGE_SIZE = 10 * 1024 * 1024
+ATTACHMENT_MAX_TEXT_SIZE = 100 * 1024
+ATTACHMENT_MAX_HEADER_SIZE = 256 * 1024
+# потолок памяти на декодирование одной картинки, из него считается лимит пикселей
+ATTACHMENT_MAX_DECODE_BYTES = config("ATTACHMENT_MAX_DECODE_BYTES", default=64 * 1024 * 1024, cast=int)
+# варианты картинок для srcset: ширины и дополнительные форматы к исходному кодеку
+ATTACHMENT_VARIANT_WIDTHS = [160, 320, 640, 1280]
+ATTACHMENT_VARIANT_FORMATS = ["webp", "avif"]
+# сколько вложений одного комментария грузится в хранилище параллельно
+ATTACHMENT_UPLOAD_WORKERS = config("ATTACHMENT_UPLOAD_WORKERS", default=4, cast=int)
+
+AWS_S3_MAX_POOL_CONNECTIONS = config("AWS_S3_MAX_POOL_CONNECTIONS", default=20, cast=int)
+# файлы в бакете моложе этого (секунды) сверка сирот не трогает
+ATTACHMENT_ORPHAN_GRACE_PERIOD = 24 * 60 * 60
+# сверка сирот ищет владельца варианта среди вложений, обработанных не позже стольких дней после загрузки
+# (варианты - в каталоге дня загрузки, file - в каталоге дня обработки)
+ATTACHMENT_VARIANT_DIR_LAG_DAYS = config("ATTACHMENT_VARIANT_DIR_LAG_DAYS", default=7, cast=int)
+
+CELERY_BEAT_SCHEDULE = {
+    "sweep-orphaned-attachments": {
+        "task": "core.comment.celery_tasks.tasks.sweep_orphaned_attachments",
+        "schedule": 24 * 60 * 60,
+    },
+    "flush-comment-likes": {
+        "task": "core.comment.celery_tasks.tasks.flush_comment_likes",
+        "schedule": config("COMMENT_LIKES_FLUSH_INTERVAL", default=10, cast=int),
+    },
+    "warm-comment-likes": {
+        "task": "core.comment.celery_tasks.tasks.warm_comment_likes",
+        "schedule": 60,
+    },
+    "purge-expired-captchas": {
+        "task": "core.auth.celery_tasks.tasks.purge_expired_captchas",
+        "schedule": 60 * 60,
+    },
+    "refill-captcha-pool": {
+        "task": "core.auth.celery_tasks.tasks.refill_captcha_pool",
+        "schedule": config("CAPTCHA_POOL_REFILL_INTERVAL", default=10, cast=int),
+    },
+}
+
+# фоновое удаление пользователя (DELETE /api/users/<id>/?mode=async)
+USER_DELETE_BATCH_SIZE = config("USER_DELETE_BATCH_SIZE", default=500, cast=int)
+USER_DELETE_PROGRESS_TIMEOUT = 24 * 60 * 60
+
+# раскладка лайков в Redis: "set" (SET + счетчик) или "bitmap" (битовая карта + hash-бакеты счетчиков),
+# см. manage.py benchmark_likes_storage; после смены кеш прогревается заново
+COMMENT_LIKES_STORAGE = config("COMMENT_LIKES_STORAGE", default="set")
+# bitmap: с какого числа лайков SET переводится в битовую карту. По замерам benchmark_likes_storage
+# SET-hashtable ~60 байт на лайк, карта с учетом аллокатора ~max(id пользователя) / 4 байт,
+# так что порог окупается при ~max(id) / 250: 10000 - для базы до ~2.5M пользователей
+COMMENT_LIKES_BITMAP_THRESHOLD = config("COMMENT_LIKES_BITMAP_THRESHOLD", default=10000, cast=int)
+
+# write-behind лайков: like/unlike пишутся только в Redis, в БД их переносит flush_comment_likes
+COMMENT_LIKES_WRITE_BEHIND = config("COMMENT_LIKES_WRITE_BEHIND", default=False, cast=bool)
+COMMENT_LIKES_FLUSH_BATCH_SIZE = config("COMMENT_LIKES_FLUSH_BATCH_SIZE", default=1000, cast=int)
+COMMENT_LIKES_FLUSH_LOCK_TIMEOUT = 5 * 60
+
+# прогрев кеша лайков после рестарта Redis (warm_comment_likes / manage.py warm_comment_likes):
+# LIMIT комментариев греются первыми, затем вся таблица; до конца прогрева флаги liked читаются из БД
+COMMENT_LIKES_WARMUP_LIMIT = config("COMMENT_LIKES_WARMUP_LIMIT", default=10000, cast=int)
+COMMENT_LIKES_WARMUP_BATCH_SIZE = config("COMMENT_LIKES_WARMUP_BATCH_SIZE", default=500, cast=int)
+COMMENT_LIKES_WARMUP_TIMEOUT = 10 * 60
+
+# read-through кеш Comment/User по public_id (get_cached_by_public_id): LRU процесса -> Redis -> БД
+OBJECT_CACHE_ENABLED = config("OBJECT_CACHE_ENABLED", default=False, cast=bool)
+OBJECT_CACHE_TIMEOUT = config("OBJECT_CACHE_TIMEOUT", default=30, cast=int)
+OBJECT_CACHE_LOCAL_TIMEOUT = config("OBJECT_CACHE_LOCAL_TIMEOUT", default=5, cast=int)
+OBJECT_CACHE_LOCAL_SIZE = config("OBJECT_CACHE_LOCAL_SIZE", default=1024, cast=int)
+
+# кеш пользователя JWT-аутентификации (core.auth.authentication): LRU процесса -> Redis -> БД
+AUTH_USER_CACHE_TIMEOUT = config("AUTH_USER_CACHE_TIMEOUT", default=5 * 60, cast=int)
+AUTH_USER_CACHE_LOCAL_TIMEOUT = config("AUTH_USER_CACHE_LOCAL_TIMEOUT", default=5, cast=int)
+# чтение комментариев по одному токену (TokenUser), без загрузки пользователя
+AUTH_STATELESS_READS = config("AUTH_STATELESS_READS", default=False, cast=bool)
+
+# хранилище капч: "redis" (ключ с TTL, проверка одним GETDEL) или "db" (таблица CaptchaStore),
+# см. manage.py benchmark_captcha_store
+CAPTCHA_STORE = config("CAPTCHA_STORE", default="redis")
+CAPTCHA_PURGE_BATCH_SIZE = config("CAPTCHA_PURGE_BATCH_SIZE", default=5000, cast=int)
+
+# пул заранее отрисованных капч (refill_captcha_pool / manage.py fill_captcha_pool), 0 - не пополнять.
+# Размер - запас выдач между запусками пополнения
+CAPTCHA_POOL_SIZE = config("CAPTCHA_POOL_SIZE", default=1000, cast=int)
+CAPTCHA_POOL_REFILL_LOCK_TIMEOUT = 5 * 60
+
+# /metrics/: с METRICS_TOKEN нужен заголовок "Authorization: Bearer <token>",
+# без него отвечает только адресам из METRICS_ALLOWED_IPS
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+METRICS_ALLOWED_IPS = config("METRICS_ALLOWED_IPS", default="127.0.0.1,::1", cast=Csv())
+
+# DELETE /api/comments/<id>/ скрывает ветку (active=False, очередь модерации) вместо удаления;
+# по умолчанию выключено - удаление остается физическим, как раньше
+COMMENT_SOFT_DELETE = config("COMMENT_SOFT_DELETE", default=False, cast=bool)
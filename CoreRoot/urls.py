@@ -14,16 +14,21 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.urls import path, include
-from core.auth.viewsets.captcha import CaptchaAPIView
+from django.urls import path, re_path, include
+from core.auth.viewsets.captcha import CaptchaAPIView, captcha_image
 from core.auth.viewsets.activate import ActivateUser
+from core.metrics import metrics_view
 urlpatterns = [
     path("api/", include([
         path("users/", include("core.user.routers")),
         path("auth/", include("core.auth.routers")),
         path("comments/", include("core.comment.routers")),
+        # раньше captcha.urls: картинка берется из CAPTCHA_STORE, а не из таблицы
+        re_path(r"captcha/image/(?P<key>\w+)/$", captcha_image, name="api-captcha-image", kwargs={"scale": 1}),
+        re_path(r"captcha/image/(?P<key>\w+)@2/$", captcha_image, name="api-captcha-image-2x", kwargs={"scale": 2}),
         path("captcha/", include("captcha.urls")),
         path("captcha/", CaptchaAPIView.as_view(), name="api-captcha"),
         path("auth/activate/<uidb64>/<token>/", ActivateUser.as_view()),
     ])),
+    path("metrics/", metrics_view, name="metrics"),
 ]
\ No newline at end of file
@@ -2,4 +2,20 @@ import pytest
 from rest_framework.test import APIClient
 @pytest.fixture
 def client():
-    return APIClient()
\ No newline at end of file
+    return APIClient()
+
+
+@pytest.fixture(autouse=True)
+def comment_list_cache():
+    # база откатывается после каждого теста, поэтому закешированные страницы ленты сбрасываем
+    from core.comment.services.comment_list_cache import CommentListCache
+    CommentListCache.invalidate()
+
+
+@pytest.fixture(autouse=True)
+def user_liked_index():
+    # id пользователей и комментариев в тестовой базе переиспользуются, обратные индексы лайков тоже сбрасываем
+    from core.comment.services.comment_likes_cache import USER_LIKED_KEY, redis
+    keys = list(redis.scan_iter(USER_LIKED_KEY.format(user_id="*")))
+    if keys:
+        redis.delete(*keys)
@@ -3,14 +3,25 @@ from django.db import models
 from django.core.exceptions import ObjectDoesNotExist
 import uuid
 from django.http import Http404
+from core.abstract.object_cache import ObjectCache
 
 
-class AbstractModelManager(models.Manager):
+class AbstractQuerySet(models.QuerySet):
     def get_object_by_public_id(self, public_id):
         try:
             return self.get(public_id=public_id)
         except (ObjectDoesNotExist, ValueError, TypeError):
             raise Http404(f"{self.model.__name__} does not exist")
+
+    def get_cached_by_public_id(self, public_id):
+        """get_object_by_public_id через ObjectCache (если OBJECT_CACHE_ENABLED)"""
+        if not ObjectCache.enabled():
+            return self.get_object_by_public_id(public_id)
+        return ObjectCache.get(self.model, public_id, lambda: self.get_object_by_public_id(public_id))
+
+
+class AbstractModelManager(models.Manager.from_queryset(AbstractQuerySet)):
+    pass
         
         
 class AbstractModel(models.Model):
@@ -0,0 +1,144 @@
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from prometheus_client import Counter
+
+LOOKUPS = Counter(
+    "object_cache_lookups_total",
+    "Поиски объектов по public_id: local_hit / redis_hit / miss",
+    ["model", "result"],
+)
+
+
+class LocalLRU:
+    """LRU в памяти процесса с TTL на запись; хранит pickle, чтобы запросы не делили один объект"""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, payload = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def set(self, key, payload, timeout):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.OBJECT_CACHE_LOCAL_SIZE:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self, prefix):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+
+class ObjectCache:
+    """
+    Read-through кеш объектов по public_id: LRU процесса -> Redis -> БД.
+    Запись в Redis живет OBJECT_CACHE_TIMEOUT и сбрасывается сигналами save/delete,
+    массовые UPDATE сбрасывают все объекты модели через поколение.
+    LRU других процессов сигнал не видит, поэтому его TTL (OBJECT_CACHE_LOCAL_TIMEOUT)
+    ограничивает, насколько устаревший объект может быть отдан.
+    """
+    local = LocalLRU()
+
+    @staticmethod
+    def enabled():
+        return settings.OBJECT_CACHE_ENABLED
+
+    @staticmethod
+    def prefix(model):
+        return f"object:{model._meta.label_lower}:"
+
+    @staticmethod
+    def key(model, public_id):
+        return f"{ObjectCache.prefix(model)}{uuid.UUID(str(public_id)).hex}"
+
+    @staticmethod
+    def generation_key(model):
+        return f"{ObjectCache.prefix(model)}generation"
+
+    @staticmethod
+    def get(model, public_id, load):
+        """
+        Объект из кеша или load(). Для одной модели load должен строить объект
+        одинаково (тот же select_related/prefetch), иначе в кеше окажется чужая форма.
+        """
+        label = model._meta.label_lower
+        try:
+            key = ObjectCache.key(model, public_id)
+        except ValueError:
+            # битый public_id - пусть загрузчик ответит 404
+            return load()
+
+        payload = ObjectCache.local.get(key)
+        if payload is not None:
+            LOOKUPS.labels(label, "local_hit").inc()
+            return pickle.loads(payload)
+
+        generation_key = ObjectCache.generation_key(model)
+        values = cache.get_many([generation_key, key])
+        generation = values.get(generation_key, 0)
+        entry = values.get(key)
+        if entry is not None and entry[0] == generation:
+            LOOKUPS.labels(label, "redis_hit").inc()
+            payload = entry[1]
+            ObjectCache.local.set(key, payload, settings.OBJECT_CACHE_LOCAL_TIMEOUT)
+            return pickle.loads(payload)
+
+        LOOKUPS.labels(label, "miss").inc()
+        obj = load()
+        payload = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+        cache.set(key, (generation, payload), settings.OBJECT_CACHE_TIMEOUT)
+        ObjectCache.local.set(key, payload, settings.OBJECT_CACHE_LOCAL_TIMEOUT)
+        return obj
+
+    @staticmethod
+    def invalidate(model, public_id):
+        if not ObjectCache.enabled():
+            return
+        key = ObjectCache.key(model, public_id)
+
+        def drop():
+            ObjectCache.local.pop(key)
+            cache.delete(key)
+
+        # и сразу, и после коммита: иначе параллельный запрос успеет закешировать старую версию
+        drop()
+        transaction.on_commit(drop)
+
+    @staticmethod
+    def invalidate_model(model):
+        """После массового UPDATE: все закешированные объекты модели становятся промахами"""
+        if not ObjectCache.enabled():
+            return
+        generation_key = ObjectCache.generation_key(model)
+
+        def bump():
+            ObjectCache.local.clear(ObjectCache.prefix(model))
+            try:
+                cache.incr(generation_key)
+            except ValueError:
+                cache.set(generation_key, 1, timeout=None)
+
+        bump()
+        transaction.on_commit(bump)
@@ -0,0 +1,172 @@
+import pickle
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.crypto import salted_hmac
+from django.utils.translation import gettext_lazy as _
+from prometheus_client import Counter
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from core.abstract.object_cache import LocalLRU
+
+LOOKUPS = Counter(
+    "auth_user_cache_lookups_total",
+    "Пользователи JWT-запросов: local_hit / redis_hit / miss / stateless",
+    ["result"],
+)
+
+# claim с версией прав пользователя, см. auth_version
+AUTH_VERSION_CLAIM = "auth_version"
+DELETED_VERSION = "deleted"
+
+
+def auth_version(user):
+    """
+    Версия того, от чего зависит доступ: пароль, is_active, is_superuser.
+    Любое их изменение дает новую версию, и выданные раньше токены перестают приниматься.
+    """
+    value = f"{user.password}:{user.is_active}:{user.is_superuser}"
+    return salted_hmac("core.auth.version", value).hexdigest()[:16]
+
+
+class AuthUserCache:
+    """
+    Пользователь JWT-запроса: LRU процесса -> Redis -> БД.
+    Запись хранит (версия, pickle пользователя), версия сверяется с claim токена.
+    Отдельно живет ключ с текущей версией пользователя: его обновляет сигнал post_save,
+    и по нему stateless-режим узнает об отозванных токенах без загрузки пользователя.
+    LRU других процессов сигнал не видит, поэтому AUTH_USER_CACHE_LOCAL_TIMEOUT
+    ограничивает, сколько после смены прав может проработать старая запись.
+    """
+    local = LocalLRU()
+
+    @staticmethod
+    def key(user_id):
+        return f"auth:user:{user_id}"
+
+    @staticmethod
+    def version_key(user_id):
+        return f"auth:user:{user_id}:version"
+
+    @staticmethod
+    def version_timeout():
+        # токен старше времени жизни access все равно не пройдет проверку exp
+        return int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+
+    @staticmethod
+    def get(user_id, load):
+        """Пользователь и его версия из кеша или load()"""
+        key = AuthUserCache.key(user_id)
+
+        entry = AuthUserCache.local.get(key)
+        if entry is not None:
+            LOOKUPS.labels("local_hit").inc()
+            return pickle.loads(entry[1]), entry[0]
+
+        entry = cache.get(key)
+        if entry is not None:
+            LOOKUPS.labels("redis_hit").inc()
+            AuthUserCache.local.set(key, entry, settings.AUTH_USER_CACHE_LOCAL_TIMEOUT)
+            return pickle.loads(entry[1]), entry[0]
+
+        LOOKUPS.labels("miss").inc()
+        user = load()
+        version = auth_version(user)
+        entry = (version, pickle.dumps(user, pickle.HIGHEST_PROTOCOL))
+        cache.set(key, entry, settings.AUTH_USER_CACHE_TIMEOUT)
+        cache.set(AuthUserCache.version_key(user_id), version, AuthUserCache.version_timeout())
+        AuthUserCache.local.set(key, entry, settings.AUTH_USER_CACHE_LOCAL_TIMEOUT)
+        return user, version
+
+    @staticmethod
+    def get_version(user_id):
+        """Текущая версия пользователя без обращения к БД, None - неизвестна"""
+        entry = AuthUserCache.local.get(AuthUserCache.key(user_id))
+        if entry is not None:
+            return entry[0]
+        return cache.get(AuthUserCache.version_key(user_id))
+
+    @staticmethod
+    def invalidate(user_id, version):
+        """После сохранения/удаления пользователя: сбросить запись и записать новую версию"""
+        key = AuthUserCache.key(user_id)
+
+        def drop():
+            AuthUserCache.local.pop(key)
+            cache.delete(key)
+            cache.set(AuthUserCache.version_key(user_id), version, AuthUserCache.version_timeout())
+
+        # и сразу, и после коммита: иначе параллельный запрос успеет закешировать старую версию
+        drop()
+        transaction.on_commit(drop)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication без запроса в users на каждый вызов: пользователь берется из AuthUserCache.
+    Если в токене есть auth_version и она не совпадает с текущей - токен выдан до смены
+    пароля или прав и отклоняется. Токены без claim (выданные раньше) проверяются как прежде.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        def load():
+            return super(CachedJWTAuthentication, self).get_user(validated_token)
+
+        token_version = validated_token.get(AUTH_VERSION_CLAIM)
+        user, version = AuthUserCache.get(user_id, load)
+        if token_version is not None and token_version != version:
+            # запись в LRU процесса могла устареть - решаем по Redis (его сбрасывает сигнал) или БД
+            AuthUserCache.local.pop(AuthUserCache.key(user_id))
+            user, version = AuthUserCache.get(user_id, load)
+            if token_version != version:
+                raise AuthenticationFailed(_("Token is no longer valid"), code="token_outdated")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
+
+
+class StatelessReadJWTAuthentication(CachedJWTAuthentication):
+    """
+    При AUTH_STATELESS_READS чтение (GET/HEAD/OPTIONS) обходится вовсе без пользователя из БД:
+    request.user - TokenUser с id и is_superuser из токена. Отзыв проверяется по версии
+    из кеша; если версия неизвестна, токену верим до его exp (ACCESS_TOKEN_LIFETIME).
+    Запросы на запись идут через CachedJWTAuthentication.
+    """
+
+    def authenticate(self, request):
+        if not settings.AUTH_STATELESS_READS or request.method not in SAFE_METHODS:
+            return super().authenticate(request)
+
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+
+        token_version = validated_token.get(AUTH_VERSION_CLAIM)
+        if token_version is None:
+            # у старого токена нет is_superuser - обычный путь
+            return self.get_user(validated_token), validated_token
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        version = AuthUserCache.get_version(user_id)
+        if version is not None and version != token_version:
+            raise AuthenticationFailed(_("Token is no longer valid"), code="token_outdated")
+
+        LOOKUPS.labels("stateless").inc()
+        return TokenUser(validated_token), validated_token
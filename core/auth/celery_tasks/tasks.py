@@ -1,6 +1,8 @@
 from celery import shared_task
 from django.core.mail import send_mail
 from django.conf import settings
+from core.auth.services.captcha_pool import CaptchaPool
+from core.auth.services.captcha_store import CAPTCHA_STORES
 
 
 @shared_task(queue="test-task")
@@ -12,3 +14,24 @@ def send_activation_email(user_email, subject, message):
         [user_email],
         fail_silently=False,
     )
+
+
+@shared_task(queue="test-task")
+def purge_expired_captchas():
+    """
+    Удаляет просроченные строки CaptchaStore пачками. Нужна и при CAPTCHA_STORE=redis:
+    в таблице остаются капчи, выданные до переключения.
+    """
+    return CAPTCHA_STORES["db"].purge_expired(settings.CAPTCHA_PURGE_BATCH_SIZE)
+
+
+@shared_task(queue="test-task")
+def refill_captcha_pool():
+    """Дорисовывает пул капч до CAPTCHA_POOL_SIZE; второй запуск, пока идет первый, ничего не делает"""
+    lock = CaptchaPool.refill_lock(timeout=settings.CAPTCHA_POOL_REFILL_LOCK_TIMEOUT)
+    if not lock.acquire():
+        return None
+    try:
+        return CaptchaPool.refill(settings.CAPTCHA_POOL_SIZE)
+    finally:
+        lock.release()
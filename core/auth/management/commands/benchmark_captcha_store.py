@@ -0,0 +1,74 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connections
+from core.auth.services.captcha_store import CAPTCHA_STORES
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест хранилищ капч: выдача ключа (CaptchaAPIView) и одноразовая проверка "
+        "(валидация регистрации/гостевого комментария) из нескольких потоков. "
+        "Все выданные ключи проверяются, так что после замера хранилища остаются пустыми."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=5000, help="Пар выдача + проверка на хранилище")
+        parser.add_argument("--concurrency", type=int, default=8, help="Потоков")
+        parser.add_argument("--store", action="append", choices=sorted(CAPTCHA_STORES),
+                            help="Хранилище (можно несколько), по умолчанию все")
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['requests']} captchas, {options['concurrency']} threads"
+        )
+        self.stdout.write(
+            f"{'store':<6} {'ops/s':>8} {'generate p50 us':>16} {'p99 us':>8} "
+            f"{'verify p50 us':>14} {'p99 us':>8}"
+        )
+
+        for name in options["store"] or sorted(CAPTCHA_STORES):
+            store = CAPTCHA_STORES[name]
+            chunks = self.split(options["requests"], options["concurrency"])
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+                results = list(executor.map(lambda count: self.run(store, count), chunks))
+            elapsed = time.perf_counter() - started
+
+            generate = [value for result in results for value in result[0]]
+            verify = [value for result in results for value in result[1]]
+            self.stdout.write(
+                f"{name:<6} {2 * options['requests'] / elapsed:>8.0f} "
+                f"{self.percentile(generate, 50):>16.0f} {self.percentile(generate, 99):>8.0f} "
+                f"{self.percentile(verify, 50):>14.0f} {self.percentile(verify, 99):>8.0f}"
+            )
+
+    def run(self, store, count):
+        generate = []
+        verify = []
+        try:
+            for _ in range(count):
+                started = time.perf_counter()
+                key = store.generate_key()
+                generate.append((time.perf_counter() - started) * 1_000_000)
+
+                # неверный ответ, как у бота: проверка все равно забирает ключ
+                started = time.perf_counter()
+                store.verify(key, "-")
+                verify.append((time.perf_counter() - started) * 1_000_000)
+        finally:
+            # у каждого потока свое соединение с БД
+            connections.close_all()
+        return generate, verify
+
+    @staticmethod
+    def split(total, parts):
+        return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+    @staticmethod
+    def percentile(values, pct):
+        if len(values) < 2:
+            return values[0] if values else 0
+        return statistics.quantiles(values, n=100)[pct - 1]
@@ -0,0 +1,34 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.auth.celery_tasks.tasks import refill_captcha_pool
+from core.auth.services.captcha_pool import CaptchaPool
+
+
+class Command(BaseCommand):
+    help = "Дорисовывает пул готовых капч (картинки + ключи в Redis), которые выдает /api/captcha/"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=None, help="По умолчанию CAPTCHA_POOL_SIZE")
+        parser.add_argument("--async", action="store_true", dest="run_async", help="Поставить задачу в celery")
+
+    def handle(self, *args, **options):
+        if options["run_async"]:
+            refill_captcha_pool.delay()
+            self.stdout.write(self.style.SUCCESS("Refill queued"))
+            return
+
+        size = options["size"] or settings.CAPTCHA_POOL_SIZE
+        lock = CaptchaPool.refill_lock(timeout=settings.CAPTCHA_POOL_REFILL_LOCK_TIMEOUT)
+        if not lock.acquire():
+            raise CommandError("Refill is already running")
+        try:
+            started = time.perf_counter()
+            added = CaptchaPool.refill(size)
+            elapsed = time.perf_counter() - started
+        finally:
+            lock.release()
+        rate = added / elapsed if added else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Added {added} captchas ({rate:.0f}/s), pool depth {CaptchaPool.depth()}"
+        ))
@@ -2,10 +2,20 @@ from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.settings import api_settings
 from django.contrib.auth.models import update_last_login
 
+from core.auth.authentication import AUTH_VERSION_CLAIM, auth_version
 from core.user.serializers import UserSerializer
 
 
 class LoginSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        # по версии CachedJWTAuthentication отклоняет токены, выданные до смены пароля/прав,
+        # а is_superuser нужен TokenUser в stateless-режиме чтения
+        token[AUTH_VERSION_CLAIM] = auth_version(user)
+        token['is_superuser'] = user.is_superuser
+        return token
+
     def validate(self, attrs):
         data = super().validate(attrs)
 
@@ -1,19 +1,19 @@
 from rest_framework import serializers
 from core.user.models import User
 from core.user.serializers import UserSerializer
-from captcha.models import CaptchaStore
+from core.auth.services.captcha_store import get_captcha_store
 class RegisterSerializer(UserSerializer):
     password = serializers.CharField(max_length=256, min_length=8, write_only=True, required=True, style={'input_type': 'password'})
     captcha_key = serializers.CharField(write_only=True)    
     captcha_value = serializers.CharField(write_only=True)
 
     def validate(self, data):
-        try:
-            captcha = CaptchaStore.objects.get(hashkey=data['captcha_key'])
-        except CaptchaStore.DoesNotExist:
+        # ключ одноразовый: GETDEL в Redis (или DELETE строки) при любом ответе
+        verified = get_captcha_store().verify(data['captcha_key'], data['captcha_value'])
+        if verified is None:
             raise serializers.ValidationError({"captcha": "Неверный ключ капчи"})
 
-        if captcha.response != data['captcha_value'].lower():
+        if not verified:
             raise serializers.ValidationError({"captcha": "Неверное значение капчи"})
 
         return data
@@ -0,0 +1,119 @@
+import random
+import threading
+from io import BytesIO
+from PIL import Image, ImageDraw, ImageFont
+from captcha.conf import settings as captcha_settings
+from captcha.views import DISTANCE_FROM_TOP, getsize, makeimg
+from django.core.exceptions import ImproperlyConfigured
+
+# Функции библиотеки (текст, цвет букв, шум, фильтры) берут случайность из глобального random.
+# Отрисовка засевает его ключом, поэтому все, кто пользуется им в этом процессе
+# (render_captcha_image, new_challenge, DatabaseCaptchaStore.generate_key), берут этот lock:
+# иначе параллельный поток получил бы предсказуемый по ключу текст капчи.
+RANDOM_LOCK = threading.Lock()
+
+
+def new_challenge():
+    """(текст, ответ) новой капчи от CAPTCHA_CHALLENGE_FUNCT"""
+    with RANDOM_LOCK:
+        return captcha_settings.get_challenge()()
+
+
+def render_captcha_image(key, challenge, scale=1):
+    """
+    PNG капчи. Повторяет отрисовку captcha.views.captcha_image, но текст передается
+    снаружи, а не читается из CaptchaStore, поэтому работает с любым хранилищем.
+    Для одного ключа картинка всегда одна и та же: random засевается ключом.
+    """
+    with RANDOM_LOCK:
+        state = random.getstate()
+        random.seed(key)
+        try:
+            return _render(challenge, scale)
+        finally:
+            # прежнее состояние, иначе по ключу можно предсказать следующие случайные числа процесса
+            random.setstate(state)
+
+
+# Скопировано из django-simple-captcha 0.6.2, captcha/views.py (captcha_image):
+# вместо чтения CaptchaStore текст передается аргументом. При обновлении библиотеки сверить.
+def _render(challenge, scale):
+    if isinstance(captcha_settings.CAPTCHA_FONT_PATH, str):
+        fontpath = captcha_settings.CAPTCHA_FONT_PATH
+    elif isinstance(captcha_settings.CAPTCHA_FONT_PATH, (list, tuple)):
+        fontpath = random.choice(captcha_settings.CAPTCHA_FONT_PATH)
+    else:
+        raise ImproperlyConfigured(
+            "settings.CAPTCHA_FONT_PATH needs to be a path to a font or list of paths to fonts"
+        )
+
+    if fontpath.lower().strip().endswith("ttf"):
+        font = ImageFont.truetype(fontpath, captcha_settings.CAPTCHA_FONT_SIZE * scale)
+    else:
+        font = ImageFont.load(fontpath)
+
+    if captcha_settings.CAPTCHA_IMAGE_SIZE:
+        size = captcha_settings.CAPTCHA_IMAGE_SIZE
+    else:
+        size = getsize(font, challenge)
+        size = (size[0] * 2, int(size[1] * 1.4))
+
+    image = makeimg(size)
+    xpos = 2
+
+    charlist = []
+    for char in challenge:
+        if char in captcha_settings.CAPTCHA_PUNCTUATION and len(charlist) >= 1:
+            charlist[-1] += char
+        else:
+            charlist.append(char)
+
+    for index, char in enumerate(charlist):
+        fgimage = Image.new("RGB", size, captcha_settings.get_letter_color(index, "".join(charlist)))
+        charimage = Image.new("L", getsize(font, " %s " % char), "#000000")
+        chardraw = ImageDraw.Draw(charimage)
+        chardraw.text((0, 0), " %s " % char, font=font, fill="#ffffff")
+        if captcha_settings.CAPTCHA_LETTER_ROTATION:
+            charimage = charimage.rotate(
+                random.randrange(*captcha_settings.CAPTCHA_LETTER_ROTATION),
+                expand=0,
+                resample=Image.BICUBIC,
+            )
+        charimage = charimage.crop(charimage.getbbox())
+        maskimage = Image.new("L", size)
+        maskimage.paste(
+            charimage,
+            (
+                xpos,
+                DISTANCE_FROM_TOP,
+                xpos + charimage.size[0],
+                DISTANCE_FROM_TOP + charimage.size[1],
+            ),
+        )
+        size = maskimage.size
+        image = Image.composite(fgimage, image, maskimage)
+        xpos = xpos + 2 + charimage.size[0]
+
+    if captcha_settings.CAPTCHA_IMAGE_SIZE:
+        # капча по центру картинки
+        tmpimg = makeimg(size)
+        tmpimg.paste(
+            image,
+            (
+                int((size[0] - xpos) / 2),
+                int((size[1] - charimage.size[1]) / 2 - DISTANCE_FROM_TOP),
+            ),
+        )
+        image = tmpimg.crop((0, 0, size[0], size[1]))
+    else:
+        image = image.crop((0, 0, xpos + 1, size[1]))
+
+    draw = ImageDraw.Draw(image)
+    for f in captcha_settings.noise_functions():
+        draw = f(draw, image)
+    for f in captcha_settings.filter_functions():
+        image = f(image)
+
+    out = BytesIO()
+    image.save(out, "PNG")
+    return out.getvalue()
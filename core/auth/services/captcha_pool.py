@@ -0,0 +1,111 @@
+import pickle
+from prometheus_client import Counter
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from redis.exceptions import RedisError
+from core.auth.services.captcha_image import new_challenge, render_captcha_image
+from core.auth.services.captcha_store import IMAGE_KEY, RedisCaptchaStore, get_captcha_store, new_key, redis
+from core.metrics import register_shared_collector
+
+# очередь заранее отрисованных капч: (ключ, текст, ответ, PNG), берется LPOP с головы
+POOL_KEY = "captcha:pool"
+# сколько капч положил в пул фоновый генератор за все время (для rate() в Prometheus)
+REFILLED_KEY = "captcha:pool:refilled"
+
+POPS = Counter(
+    "captcha_pool_pops_total",
+    "Выдачи капчи: hit - из пула, miss - пул пуст, капча сгенерирована на лету",
+    ["result"],
+)
+
+
+class CaptchaPool:
+    """
+    Пул капч с готовыми картинками. refill_captcha_pool рисует их в celery,
+    CaptchaAPIView забирает одну за O(1) и регистрирует в текущем хранилище с полным TTL:
+    пока капча лежит в пуле, ее ключ никому не выдан, так что срок начинается с выдачи.
+    """
+
+    @staticmethod
+    def depth():
+        return redis.llen(POOL_KEY)
+
+    @staticmethod
+    def refilled():
+        return int(redis.get(REFILLED_KEY) or 0)
+
+    @staticmethod
+    def pop():
+        """Ключ капчи из пула или None, если пул пуст"""
+        entry = redis.lpop(POOL_KEY)
+        if entry is None:
+            POPS.labels("miss").inc()
+            return None
+        POPS.labels("hit").inc()
+
+        key, challenge, response, image = pickle.loads(entry)
+        get_captcha_store().add(key, challenge, response)
+        redis.set(IMAGE_KEY.format(key=key), image, ex=RedisCaptchaStore.timeout())
+        return key
+
+    @staticmethod
+    def image(key):
+        """Готовый PNG выданной из пула капчи, None - ее нужно рисовать"""
+        return redis.get(IMAGE_KEY.format(key=key))
+
+    @staticmethod
+    def refill(size, batch_size=100):
+        """Дорисовывает пул до size капч, возвращает число добавленных"""
+        added = 0
+        while True:
+            missing = min(size - CaptchaPool.depth(), batch_size)
+            if missing <= 0:
+                return added
+
+            entries = []
+            for _ in range(missing):
+                challenge, response = new_challenge()
+                key = new_key()
+                image = render_captcha_image(key, challenge)
+                entries.append(pickle.dumps((key, challenge, response, image), pickle.HIGHEST_PROTOCOL))
+
+            pipe = redis.pipeline()
+            pipe.rpush(POOL_KEY, *entries)
+            pipe.incrby(REFILLED_KEY, len(entries))
+            pipe.execute()
+            added += len(entries)
+
+    @staticmethod
+    def refill_lock(timeout):
+        return redis.lock("captcha:pool:refill-lock", timeout=timeout, blocking=False)
+
+
+class CaptchaPoolCollector:
+    """
+    Глубина пула и счетчик дорисованных капч читаются из Redis при scrape:
+    пул пополняет celery, чьи метрики /metrics веб-процесса не видит.
+    """
+
+    @staticmethod
+    def families():
+        return (
+            GaugeMetricFamily("captcha_pool_depth", "Капч в пуле"),
+            CounterMetricFamily("captcha_pool_refilled", "Капч, добавленных в пул генератором"),
+        )
+
+    def describe(self):
+        # без describe REGISTRY.register вызвал бы collect и сходил в Redis при импорте
+        return self.families()
+
+    def collect(self):
+        depth, refilled = self.families()
+        try:
+            depth.add_metric([], CaptchaPool.depth())
+            refilled.add_metric([], CaptchaPool.refilled())
+        except RedisError:
+            # недоступный Redis не должен ломать остальные метрики
+            return
+        yield depth
+        yield refilled
+
+
+register_shared_collector(CaptchaPoolCollector())
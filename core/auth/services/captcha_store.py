@@ -0,0 +1,131 @@
+import json
+import secrets
+from captcha.conf import settings as captcha_settings
+from captcha.models import CaptchaStore
+from django.conf import settings
+from django.utils import timezone
+from django_redis import get_redis_connection
+from core.auth.services.captcha_image import RANDOM_LOCK, new_challenge
+
+redis = get_redis_connection("default")
+
+# PNG выданной из пула капчи (CaptchaPool), живет не дольше самой капчи: verify удаляет его вместе с ней
+IMAGE_KEY = "captcha:image:{key}"
+
+
+def new_key():
+    # 40 hex-символов, как sha1 у CaptchaStore: подходит под \w+ в URL картинки
+    return secrets.token_hex(20)
+
+
+class DatabaseCaptchaStore:
+    """
+    Таблица django-simple-captcha: строка на капчу, проверка - SELECT + DELETE.
+    Просроченные строки сами не удаляются, их пачками чистит purge_expired_captchas.
+    """
+    name = "db"
+
+    def generate_key(self):
+        # текст капчи библиотека выбирает глобальным random, см. RANDOM_LOCK
+        with RANDOM_LOCK:
+            return CaptchaStore.generate_key()
+
+    def add(self, key, challenge, response):
+        """Регистрирует готовую капчу (из пула) под заданным ключом"""
+        CaptchaStore.objects.create(hashkey=key, challenge=challenge, response=response)
+
+    def challenge(self, key):
+        """Текст капчи для картинки, None - ключа нет или он просрочен"""
+        return (
+            CaptchaStore.objects
+            .filter(hashkey=key, expiration__gt=timezone.now())
+            .values_list("challenge", flat=True)
+            .first()
+        )
+
+    def verify(self, key, value):
+        """
+        True/False - ответ верный/неверный, None - ключа нет.
+        Ключ одноразовый при любом ответе, иначе его можно перебирать.
+        Ответ засчитывает только тот запрос, чей DELETE удалил строку.
+        """
+        row = (
+            CaptchaStore.objects
+            .filter(hashkey=key, expiration__gt=timezone.now())
+            .values_list("id", "response")
+            .first()
+        )
+        if row is None:
+            return None
+        deleted, _ = CaptchaStore.objects.filter(id=row[0]).delete()
+        if deleted == 0:
+            # строку между SELECT и DELETE забрал параллельный запрос
+            return None
+        redis.delete(IMAGE_KEY.format(key=key))
+        return row[1] == value.lower()
+
+    def purge_expired(self, batch_size):
+        """Удаляет просроченные капчи пачками по batch_size, возвращает число удаленных"""
+        deleted = 0
+        while True:
+            ids = list(
+                CaptchaStore.objects
+                .filter(expiration__lte=timezone.now())
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                return deleted
+            deleted += CaptchaStore.objects.filter(id__in=ids).delete()[0]
+
+
+class RedisCaptchaStore:
+    """
+    Капча - строковый ключ в Redis с TTL = CAPTCHA_TIMEOUT: истекшие удаляет сам Redis.
+    Проверка - один GETDEL (в одном MULTI с удалением картинки из пула):
+    ключ атомарно забирается, второй запрос с ним получит None.
+    """
+    name = "redis"
+
+    KEY = "captcha:{key}"
+
+    @staticmethod
+    def timeout():
+        return int(captcha_settings.CAPTCHA_TIMEOUT) * 60
+
+    def generate_key(self):
+        challenge, response = new_challenge()
+        key = new_key()
+        self.add(key, challenge, response)
+        return key
+
+    def add(self, key, challenge, response):
+        redis.set(self.KEY.format(key=key), json.dumps([challenge, response.lower()]), ex=self.timeout())
+
+    def challenge(self, key):
+        value = redis.get(self.KEY.format(key=key))
+        if value is None:
+            return None
+        return json.loads(value)[0]
+
+    def verify(self, key, value):
+        pipe = redis.pipeline()
+        pipe.getdel(self.KEY.format(key=key))
+        pipe.delete(IMAGE_KEY.format(key=key))
+        stored, _ = pipe.execute()
+        if stored is None:
+            return None
+        return json.loads(stored)[1] == value.lower()
+
+    def purge_expired(self, batch_size):
+        return 0
+
+
+CAPTCHA_STORES = {
+    store.name: store
+    for store in (DatabaseCaptchaStore(), RedisCaptchaStore())
+}
+
+
+def get_captcha_store(name=None):
+    """Текущее хранилище капч (settings.CAPTCHA_STORE)"""
+    return CAPTCHA_STORES[name or settings.CAPTCHA_STORE]
@@ -1,6 +1,21 @@
+import json
+import random
 import pytest
+from datetime import timedelta
+from captcha.models import CaptchaStore
+from django.db.models import QuerySet
+from django.utils import timezone
+from prometheus_client import REGISTRY
 from core.fixtures.user import user_fixture
 from rest_framework import status
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from core.auth.authentication import CachedJWTAuthentication, StatelessReadJWTAuthentication
+from core.auth.services.captcha_image import render_captcha_image
+from core.auth.services.captcha_pool import POOL_KEY, CaptchaPool
+from core.auth.services.captcha_store import CAPTCHA_STORES, RedisCaptchaStore, redis
+from core.auth.serializers.login import LoginSerializer
 # Create your tests here.
 
 @pytest.mark.django_db
@@ -50,4 +65,182 @@ class TestAuthenticationViewset:
 
         response = client.post(f"{self.endpoint}refresh/", refresh_data)
         assert response.status_code == status.HTTP_200_OK
-        assert response.data['access']
\ No newline at end of file
+        assert response.data['access']
+
+@pytest.mark.django_db
+class TestCachedJWTAuthentication:
+    endpoint = "/api/comments/"
+
+    @pytest.fixture
+    def active_user(self, user_fixture):
+        user_fixture.is_active = True
+        user_fixture.save()
+        return user_fixture
+
+    @staticmethod
+    def request(user, method="get"):
+        token = LoginSerializer.get_token(user).access_token
+        return getattr(APIRequestFactory(), method)("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_user_is_loaded_once(self, active_user, django_assert_num_queries):
+        request = self.request(active_user)
+
+        user, _ = CachedJWTAuthentication().authenticate(request)
+        assert user == active_user
+        with django_assert_num_queries(0):
+            user, _ = CachedJWTAuthentication().authenticate(request)
+        assert user.pk == active_user.pk
+
+    def test_password_change_rejects_old_token(self, active_user):
+        request = self.request(active_user)
+        CachedJWTAuthentication().authenticate(request)
+
+        active_user.set_password("newpassword")
+        active_user.save()
+        with pytest.raises(AuthenticationFailed):
+            CachedJWTAuthentication().authenticate(request)
+        assert CachedJWTAuthentication().authenticate(self.request(active_user))[0] == active_user
+
+    def test_stateless_reads(self, active_user, settings, django_assert_num_queries):
+        settings.AUTH_STATELESS_READS = True
+        request = self.request(active_user)
+
+        with django_assert_num_queries(0):
+            user, _ = StatelessReadJWTAuthentication().authenticate(request)
+        assert isinstance(user, TokenUser)
+        assert int(user.id) == active_user.id
+        assert not user.is_superuser
+        # запись идет через обычный кешированный путь с настоящим пользователем
+        user, _ = StatelessReadJWTAuthentication().authenticate(self.request(active_user, "post"))
+        assert user == active_user
+
+        active_user.is_superuser = True
+        active_user.save()
+        with pytest.raises(AuthenticationFailed):
+            StatelessReadJWTAuthentication().authenticate(request)
+
+    def test_comment_list_with_token(self, client, active_user, settings):
+        settings.AUTH_STATELESS_READS = True
+        token = LoginSerializer.get_token(active_user).access_token
+        response = client.get(self.endpoint, HTTP_AUTHORIZATION=f"Bearer {token}")
+        assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+class TestCaptchaStore:
+    endpoint = "/api/captcha/"
+
+    @staticmethod
+    def answer(store, key):
+        if store.name == "redis":
+            return json.loads(redis.get(RedisCaptchaStore.KEY.format(key=key)))[1]
+        return CaptchaStore.objects.get(hashkey=key).response
+
+    @pytest.mark.parametrize("name", sorted(CAPTCHA_STORES))
+    def test_verify_is_single_use(self, name):
+        store = CAPTCHA_STORES[name]
+
+        key = store.generate_key()
+        assert store.challenge(key)
+        assert store.verify(key, "wrong") is False
+        # неверный ответ тоже сжигает ключ
+        assert store.verify(key, "wrong") is None
+        assert store.challenge(key) is None
+
+        key = store.generate_key()
+        answer = self.answer(store, key)
+        assert store.verify(key, answer.upper()) is True
+        assert store.verify(key, answer) is None
+
+    def test_db_verify_counts_only_own_delete(self, monkeypatch):
+        store = CAPTCHA_STORES["db"]
+        key = store.generate_key()
+        answer = self.answer(store, key)
+        first = QuerySet.first
+
+        def raced_first(queryset):
+            # параллельный запрос проверил тот же ключ между нашими SELECT и DELETE
+            row = first(queryset)
+            CaptchaStore.objects.filter(hashkey=key).delete()
+            return row
+
+        monkeypatch.setattr(QuerySet, "first", raced_first)
+        assert store.verify(key, answer) is None
+
+    def test_api_key_and_image(self, client, settings):
+        settings.CAPTCHA_STORE = "redis"
+        response = client.get(self.endpoint)
+        assert response.status_code == status.HTTP_200_OK
+        key = response.data["key"]
+        assert redis.ttl(RedisCaptchaStore.KEY.format(key=key)) > 0
+        assert not CaptchaStore.objects.exists()
+
+        image = client.get(response.data["image_url"])
+        assert image.status_code == status.HTTP_200_OK
+        assert image["Content-Type"] == "image/png"
+        assert image.content.startswith(b"\x89PNG")
+
+        CAPTCHA_STORES["redis"].verify(key, "wrong")
+        assert client.get(response.data["image_url"]).status_code == status.HTTP_410_GONE
+
+    def test_render_is_deterministic_and_keeps_global_random(self):
+        state = random.getstate()
+        first = render_captcha_image("key", "ABCD")
+        assert random.getstate() == state
+        assert render_captcha_image("key", "ABCD") == first
+
+    def test_purge_expired(self):
+        for i in range(5):
+            CaptchaStore.objects.create(
+                challenge="A", response="a", hashkey=f"expired{i}",
+                expiration=timezone.now() - timedelta(minutes=1),
+            )
+        alive = CAPTCHA_STORES["db"].generate_key()
+
+        assert CAPTCHA_STORES["db"].purge_expired(batch_size=2) == 5
+        assert list(CaptchaStore.objects.values_list("hashkey", flat=True)) == [alive]
+
+
+@pytest.mark.django_db
+class TestCaptchaPool:
+    endpoint = "/api/captcha/"
+
+    @pytest.fixture(autouse=True)
+    def empty_pool(self):
+        redis.delete(POOL_KEY)
+        yield
+        redis.delete(POOL_KEY)
+
+    def test_captcha_served_from_pool(self, client, settings, monkeypatch):
+        settings.CAPTCHA_STORE = "redis"
+        refilled = CaptchaPool.refilled()
+        assert CaptchaPool.refill(size=3, batch_size=2) == 3
+        assert CaptchaPool.depth() == 3
+        assert REGISTRY.get_sample_value("captcha_pool_depth") == 3
+        assert REGISTRY.get_sample_value("captcha_pool_refilled_total") == refilled + 3
+
+        response = client.get(self.endpoint)
+        assert response.status_code == status.HTTP_200_OK
+        key = response.data["key"]
+        assert CaptchaPool.depth() == 2
+
+        # картинка отдается готовыми байтами, без отрисовки
+        monkeypatch.setattr("core.auth.viewsets.captcha.render_captcha_image", None)
+        image = client.get(response.data["image_url"])
+        assert image.status_code == status.HTTP_200_OK
+        assert image.content.startswith(b"\x89PNG")
+
+        answer = json.loads(redis.get(RedisCaptchaStore.KEY.format(key=key)))[1]
+        assert CAPTCHA_STORES["redis"].verify(key, answer) is True
+        # использованная капча - 410 и без картинки в Redis
+        assert client.get(response.data["image_url"]).status_code == status.HTTP_410_GONE
+        assert CaptchaPool.image(key) is None
+
+    def test_empty_pool_falls_back(self, client, settings):
+        settings.CAPTCHA_STORE = "redis"
+        misses = REGISTRY.get_sample_value("captcha_pool_pops_total", {"result": "miss"}) or 0
+
+        response = client.get(self.endpoint)
+        assert response.status_code == status.HTTP_200_OK
+        assert CAPTCHA_STORES["redis"].challenge(response.data["key"])
+        assert REGISTRY.get_sample_value("captcha_pool_pops_total", {"result": "miss"}) == misses + 1
@@ -1,14 +1,35 @@
 # auth/views/captcha.py
+from captcha.conf import settings as captcha_settings
+from django.http import Http404, HttpResponse
+from django.urls import reverse
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from captcha.models import CaptchaStore
-from captcha.helpers import captcha_image_url
+from core.auth.services.captcha_image import render_captcha_image
+from core.auth.services.captcha_pool import CaptchaPool
+from core.auth.services.captcha_store import get_captcha_store
 
 
 class CaptchaAPIView(APIView):
     def get(self, request):
-        key = CaptchaStore.generate_key()
+        # из пула - с уже готовой картинкой; пустой пул не ломает выдачу
+        key = CaptchaPool.pop() or get_captcha_store().generate_key()
         return Response({
             "key": key,
-            "image_url": captcha_image_url(key),
-        })
\ No newline at end of file
+            "image_url": reverse("api-captcha-image", kwargs={"key": key}),
+        })
+
+
+def captcha_image(request, key, scale=1):
+    """Картинка капчи из текущего хранилища (captcha.urls умеет читать только таблицу CaptchaStore)"""
+    if scale == 2 and not captcha_settings.CAPTCHA_2X_IMAGE:
+        raise Http404
+    # сначала хранилище: использованная или просроченная капча не отдается и из пула
+    challenge = get_captcha_store().challenge(key)
+    if challenge is None:
+        # 410, чтобы поисковики не индексировали просроченные ссылки
+        return HttpResponse(status=410)
+    if scale == 1:
+        image = CaptchaPool.image(key)
+        if image is not None:
+            return HttpResponse(image, content_type="image/png")
+    return HttpResponse(render_captcha_image(key, challenge, scale), content_type="image/png")
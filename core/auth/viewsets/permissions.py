@@ -21,6 +21,12 @@ class UserPermission(BasePermission):
                 return request.method in SAFE_METHODS or request.method == 'POST'
             return bool(request.user and request.user.is_authenticated)
         return False
-            
 
-        
\ No newline at end of file
+
+class IsModerator(BasePermission):
+    """
+    Очередь модерации и скрытие/возврат веток доступны только суперпользователям.
+    """
+
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_authenticated and request.user.is_superuser)
@@ -0,0 +1,335 @@
+import logging
+import posixpath
+from datetime import datetime, timedelta
+from io import BytesIO
+from botocore.exceptions import BotoCoreError, ClientError
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError
+from rest_framework.renderers import JSONRenderer
+
+from core.comment.models import Comment, CommentAttachment
+from core.comment.services.broadcaster import CommentBroadcaster
+from core.comment.services.comment_likes_cache import CommentLikesCache
+from core.comment.services.comment_list_cache import CommentListCache
+from core.comment.services.image_variants import build_image_variants, delete_variant_files
+from core.comment.services.s3 import DELETE_BATCH_SIZE, chunked, get_s3_client
+from core.comment.upload_handlers import max_image_pixels
+from core.user.models import User
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (320, 240)
+
+WARMUP_PROGRESS_KEY = "comments:likes:warmup:progress"
+WARMUP_ORDERING = {
+    "recent": ("-created", "-id"),
+    "popular": ("-likes_count", "-id"),
+}
+
+
+def get_warmup_progress():
+    return cache.get(WARMUP_PROGRESS_KEY)
+
+
+def set_warmup_progress(**progress):
+    cache.set(WARMUP_PROGRESS_KEY, progress, timeout=settings.COMMENT_LIKES_WARMUP_TIMEOUT)
+
+
+@shared_task(bind=True, queue="comment-images", autoretry_for=(OSError,), retry_backoff=True, max_retries=3)
+def process_comment_image(self, attachment_id):
+    """
+    Уменьшает загруженную картинку до 320x240 и заменяет ею исходный файл,
+    заодно за одно декодирование строит набор вариантов разных размеров и форматов.
+    Ошибки хранилища (OSError) повторяются; после последней попытки вложение помечается failed.
+    """
+    try:
+        attachment = CommentAttachment.objects.select_related('comment', 'comment__root').get(pk=attachment_id)
+    except CommentAttachment.DoesNotExist:
+        return
+
+    if attachment.status != CommentAttachment.STATUS_PENDING:
+        return
+
+    storage = attachment.file.storage
+    raw_name = attachment.file.name
+    variants = None
+    try:
+        with attachment.file.open('rb') as raw:
+            img = Image.open(raw)
+            original_format = img.format
+            # после draft() img.size - уже уменьшенные размеры
+            original_size = img.size
+            if img.width * img.height > max_image_pixels():
+                raise Image.DecompressionBombError("Image dimensions are too large.")
+            # JPEG можно декодировать сразу в уменьшенном масштабе (1/2, 1/4, 1/8),
+            # но не меньше самого большого нужного варианта
+            largest = max(max(settings.ATTACHMENT_VARIANT_WIDTHS), THUMBNAIL_SIZE[0])
+            img.draft(img.mode, (largest, largest * img.height // img.width))
+            img.load()
+
+            variants = build_image_variants(img, original_format, storage, raw_name, original_size)
+
+            thumbnail = img.copy()
+            if thumbnail.width > THUMBNAIL_SIZE[0] or thumbnail.height > THUMBNAIL_SIZE[1]:
+                thumbnail.thumbnail(THUMBNAIL_SIZE, Image.LANCZOS)
+
+            output = BytesIO()
+            thumbnail.save(output, format=original_format)
+
+        attachment.file.save(raw_name.rsplit('/', 1)[-1], ContentFile(output.getvalue()), save=False)
+    except (UnidentifiedImageError, Image.DecompressionBombError, ValueError):
+        delete_variant_files(storage, variants)
+        mark_attachment_failed(attachment)
+        return
+    except OSError:
+        # следующая попытка построит варианты заново, файлы этой не нужны
+        delete_variant_files(storage, variants)
+        if self.request.retries >= self.max_retries:
+            logger.exception("Giving up on attachment %s after %s retries", attachment_id, self.request.retries)
+            mark_attachment_failed(attachment)
+            return
+        raise
+
+    attachment.variants = variants
+    attachment.status = CommentAttachment.STATUS_READY
+    attachment.save(update_fields=['file', 'status', 'variants'])
+    # в закешированных страницах ленты вложение еще pending и со ссылкой на удаляемый исходник
+    CommentListCache.invalidate()
+    storage.delete(raw_name)
+
+    broadcast_attachment_update(attachment)
+
+
+def mark_attachment_failed(attachment):
+    attachment.status = CommentAttachment.STATUS_FAILED
+    attachment.save(update_fields=['status'])
+    CommentListCache.invalidate()
+    broadcast_attachment_update(attachment)
+
+
+def broadcast_attachment_update(attachment):
+    from core.comment.serializers import CommentAttachmentSerializer
+
+    comment = attachment.comment
+    root = comment.root or comment
+    payload = JSONRenderer().render({
+        "type": "attachment_ready",
+        "comment_id": comment.public_id.hex,
+        "attachment": CommentAttachmentSerializer(attachment).data,
+    }).decode("utf-8")
+
+    event = {"type": "attachment_ready", "payload": payload}
+    CommentBroadcaster.publish("comments_list", event)
+    CommentBroadcaster.publish(f"comment_{root.public_id}", event)
+
+
+@shared_task(
+    bind=True,
+    queue="s3-cleanup",
+    autoretry_for=(BotoCoreError, ClientError),
+    retry_backoff=True,
+    max_retries=5,
+)
+def delete_s3_objects(self, keys):
+    """Удаляет файлы вложений из S3 одним delete_objects на пачку (до 1000 ключей)"""
+    response = get_s3_client().delete_objects(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+        Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+    )
+    failed = [error["Key"] for error in response.get("Errors", [])]
+    if failed:
+        logger.warning("Failed to delete %s of %s S3 objects, retrying", len(failed), len(keys))
+        raise self.retry(args=(failed,))
+    return len(keys)
+
+
+@shared_task(queue="s3-cleanup")
+def sweep_orphaned_attachments(prefix="comment_attachments/"):
+    """
+    Сверка бакета с БД: удаляет файлы вложений, на которые не ссылается ни одна запись.
+    Свежие объекты не трогаем - они могут принадлежать еще не закоммиченному комментарию.
+    """
+    client = get_s3_client()
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    cutoff = timezone.now() - timedelta(seconds=settings.ATTACHMENT_ORPHAN_GRACE_PERIOD)
+
+    orphans = []
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, PaginationConfig={"PageSize": DELETE_BATCH_SIZE}):
+        candidates = [obj["Key"] for obj in page.get("Contents", []) if obj["LastModified"] < cutoff]
+        if not candidates:
+            continue
+
+        known = set(CommentAttachment.objects.filter(file__in=candidates).values_list("file", flat=True))
+        unknown = set(candidates) - known
+        if unknown:
+            known |= referenced_variant_names(unknown)
+        orphans.extend(key for key in candidates if key not in known)
+
+    for batch in chunked(orphans, DELETE_BATCH_SIZE):
+        delete_s3_objects.delay(batch)
+    return len(orphans)
+
+
+def directory_date(directory):
+    """Дата из каталога вида comment_attachments/ГГГГ/ММ/ДД, None - каталог без даты"""
+    try:
+        return datetime.strptime("/".join(directory.rsplit("/", 3)[1:]), "%Y/%m/%d").date()
+    except ValueError:
+        return None
+
+
+def referenced_variant_names(keys):
+    """
+    Ключи из keys, которые записаны в variants какого-либо вложения.
+    Варианты лежат в каталоге исходника (comment_attachments/ГГГГ/ММ/ДД/), а file
+    после обработки - в каталоге того же дня или не позже ATTACHMENT_VARIANT_DIR_LAG_DAYS.
+    Поэтому хватает строк с file между самым ранним каталогом ключей и самым поздним
+    плюс этот запас; имена сверяются в Python за один проход, без JSON-запроса на каждый ключ.
+    """
+    directories = sorted({posixpath.dirname(key) for key in keys})
+    rows = CommentAttachment.objects.filter(file__gte=directories[0])
+
+    latest = directory_date(directories[-1])
+    if latest is not None:
+        base = directories[-1].rsplit("/", 3)[0]
+        upper = latest + timedelta(days=settings.ATTACHMENT_VARIANT_DIR_LAG_DAYS + 1)
+        rows = rows.filter(file__lt=f"{base}/{upper:%Y/%m/%d}/")
+
+    referenced = set()
+    rows = rows.exclude(variants={}).values_list("variants", flat=True)
+    for variants in rows.iterator(chunk_size=DELETE_BATCH_SIZE):
+        for image in variants.get("images", []):
+            if image["name"] in keys:
+                referenced.add(image["name"])
+    return referenced
+
+
+@shared_task(queue="comment-likes")
+def flush_comment_likes():
+    """
+    Переносит накопленные в Redis write-behind лайки в БД:
+    bulk_create(ignore_conflicts=True) для лайков, пачечный DELETE для снятых,
+    затем пересчет хранимого likes_count у затронутых комментариев
+    и сброс их счетчиков в Redis (см. CommentLikesCache.drop_counts).
+    """
+    lock = CommentLikesCache.flush_lock(timeout=settings.COMMENT_LIKES_FLUSH_LOCK_TIMEOUT)
+    if not lock.acquire():
+        return 0
+
+    try:
+        pending = CommentLikesCache.take_pending()
+        through = Comment.liked_by.through
+
+        for batch in chunked(list(pending.items()), settings.COMMENT_LIKES_FLUSH_BATCH_SIZE):
+            comment_ids = {comment_id for (comment_id, _), _ in batch}
+            user_ids = {user_id for (_, user_id), _ in batch}
+            # комментарий или пользователь могли быть удалены, пока лайк ждал в очереди
+            comment_ids &= set(Comment.objects.filter(id__in=comment_ids).values_list('id', flat=True))
+            user_ids &= set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+
+            likes = []
+            unlikes = {}
+            for (comment_id, user_id), liked in batch:
+                if comment_id not in comment_ids or user_id not in user_ids:
+                    continue
+                if liked:
+                    likes.append(through(comment_id=comment_id, user_id=user_id))
+                else:
+                    unlikes.setdefault(comment_id, []).append(user_id)
+
+            with transaction.atomic():
+                through.objects.bulk_create(likes, ignore_conflicts=True)
+                if unlikes:
+                    condition = Q()
+                    for comment_id, users in unlikes.items():
+                        condition |= Q(comment_id=comment_id, user_id__in=users)
+                    through.objects.filter(condition).delete()
+                Comment.objects.refresh_likes_count(comment_ids)
+            CommentLikesCache.drop_counts(comment_ids)
+
+        CommentLikesCache.ack_pending()
+        return len(pending)
+    finally:
+        lock.release()
+
+
+def warmup_batches(order, limit, batch_size):
+    """
+    Id комментариев для прогрева пачками: сначала limit активных в порядке order,
+    затем keyset по id все остальные (включая скрытые - их лайки тоже нужны в индексе).
+    """
+    first = list(
+        Comment.objects.filter(active=True)
+        .order_by(*WARMUP_ORDERING[order])
+        .values_list('id', flat=True)[:limit]
+    )
+    yield from chunked(first, batch_size)
+
+    seen = set(first)
+    last_id = 0
+    while True:
+        ids = list(Comment.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        last_id = ids[-1]
+        batch = [comment_id for comment_id in ids if comment_id not in seen]
+        if batch:
+            yield batch
+
+
+def warm_likes_cache(order="recent", limit=None, on_progress=None):
+    """
+    Прогревает SET лайков, счетчики и обратные индексы пользователей
+    пачками по COMMENT_LIKES_WARMUP_BATCH_SIZE: первыми limit последних (recent)
+    или самых залайканных (popular) комментариев, затем всю остальную таблицу.
+    Флаг "прогрето" ставится только после полного прохода: до этого
+    bulk_has_liked отвечает из БД, иначе лайки непрогретых комментариев были бы False.
+    Возвращает число прогретых комментариев или None, если прогрев уже идет.
+    """
+    if limit is None:
+        limit = settings.COMMENT_LIKES_WARMUP_LIMIT
+    if not CommentLikesCache.start_warming(settings.COMMENT_LIKES_WARMUP_TIMEOUT):
+        return None
+
+    try:
+        if settings.COMMENT_LIKES_WRITE_BEHIND:
+            # иначе прогрев из БД не увидит лайки, которые еще ждут в очереди
+            flush_comment_likes()
+
+        total = Comment.objects.count()
+        warmed = 0
+        set_warmup_progress(status="running", order=order, total=total, warmed=0)
+
+        for batch in warmup_batches(order, limit, settings.COMMENT_LIKES_WARMUP_BATCH_SIZE):
+            CommentLikesCache.warmup(batch)
+            CommentLikesCache.touch_warming(settings.COMMENT_LIKES_WARMUP_TIMEOUT)
+            warmed += len(batch)
+            set_warmup_progress(status="running", order=order, total=total, warmed=warmed)
+            if on_progress is not None:
+                on_progress(warmed, total)
+    except Exception:
+        CommentLikesCache.abort_warming()
+        set_warmup_progress(status="failed", order=order)
+        raise
+
+    CommentLikesCache.finish_warming()
+    set_warmup_progress(status="done", order=order, total=total, warmed=warmed)
+    return warmed
+
+
+@shared_task(queue="comment-likes")
+def warm_comment_likes(order="recent", limit=None, force=False):
+    """
+    По расписанию проверяет, что кеш лайков теплый, и прогревает его после
+    рестарта или failover Redis. force=True прогревает в любом случае.
+    """
+    if not force and CommentLikesCache.is_warm():
+        return 0
+    return warm_likes_cache(order=order, limit=limit)
@@ -11,10 +11,11 @@ class CommentListConsumer(AsyncJsonWebsocketConsumer):
 
     # метод, который будет вызываться через group_send
     async def comment_created(self, event):
-        await self.send_json({
-            "type": "comment_created",
-            "comment": event["comment"],
-        })
+        # payload уже готовый JSON, пересылаем без повторной сериализации
+        await self.send(text_data=event["payload"])
+
+    async def attachment_ready(self, event):
+        await self.send(text_data=event["payload"])
 
 
 class CommentThreadConsumer(AsyncJsonWebsocketConsumer):
@@ -29,7 +30,7 @@ class CommentThreadConsumer(AsyncJsonWebsocketConsumer):
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
     async def reply_created(self, event):
-        await self.send_json({
-            "type": "reply_created",
-            "comment": event["comment"],
-        })
+        await self.send(text_data=event["payload"])
+
+    async def attachment_ready(self, event):
+        await self.send(text_data=event["payload"])
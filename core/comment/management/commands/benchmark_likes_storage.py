@@ -0,0 +1,154 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from core.comment.services.comment_likes_cache import USER_LIKED_KEY
+from core.comment.services.likes_storage import LIKES_STORAGES, redis
+
+# синтетические id комментариев, которые не пересекаются с реальными
+BENCHMARK_COMMENT_BASE = 10 ** 12
+# обратные индексы синтетических пользователей: та же раскладка, что USER_LIKED_KEY, в своем префиксе,
+# чтобы не затереть индексы настоящих пользователей с теми же id
+BENCHMARK_USER_LIKED_KEY = "benchmark:" + USER_LIKED_KEY
+# флаги liked страницы ленты - один SMISMEMBER на столько комментариев
+HAS_LIKED_BATCH = 50
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает бэкенды хранения лайков: память на 1M лайков (контейнеры, счетчики "
+        "и обратный индекс user:{id}:liked) и задержку флагов liked - SMISMEMBER по индексу, "
+        "как в CommentLikesCache.bulk_has_liked. "
+        "Пишет синтетические ключи в текущий Redis и удаляет их после замера."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--likes", type=int, default=1_000_000, help="Всего лайков")
+        parser.add_argument("--comments", type=int, default=1, help="На сколько комментариев их разложить")
+        parser.add_argument("--users", type=int, default=5_000_000, help="Диапазон id пользователей")
+        parser.add_argument("--probes", type=int, default=10_000, help="Число замеров SMISMEMBER по обратному индексу")
+        parser.add_argument("--storage", action="append", choices=sorted(LIKES_STORAGES),
+                            help="Бэкенд (можно несколько), по умолчанию все")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        per_comment = max(1, options["likes"] // options["comments"])
+        comment_ids = [BENCHMARK_COMMENT_BASE + i for i in range(options["comments"])]
+        likers = {
+            comment_id: rng.sample(range(1, options["users"] + 1), per_comment)
+            for comment_id in comment_ids
+        }
+        total_likes = per_comment * len(comment_ids)
+
+        # половина проб - реальные лайки, половина - промахи
+        probes = []
+        for i in range(options["probes"]):
+            comment_id = rng.choice(comment_ids)
+            user_id = rng.choice(likers[comment_id]) if i % 2 else rng.randint(1, options["users"])
+            probes.append((comment_id, user_id))
+
+        self.stdout.write(
+            f"{total_likes} likes on {len(comment_ids)} comments, user ids up to {options['users']}"
+        )
+
+        # индекс от бэкенда не зависит: хранится и замеряется один раз
+        liked_by_user = {}
+        for comment_id, user_ids in likers.items():
+            for user_id in user_ids:
+                liked_by_user.setdefault(user_id, []).append(comment_id)
+        index_keys = [BENCHMARK_USER_LIKED_KEY.format(user_id=user_id) for user_id in liked_by_user]
+        try:
+            self.load_index(liked_by_user)
+            _, index_memory = self.memory_usage(index_keys)
+            single, batched = self.liked_latency(probes, comment_ids, rng)
+        finally:
+            self.delete(index_keys)
+
+        index_per_like = index_memory / total_likes
+        self.stdout.write(
+            f"user:{{id}}:liked index: {len(index_keys)} keys, {index_per_like:.2f} bytes/like, "
+            f"SMISMEMBER p50 {self.percentile(single, 50):.0f} us, p99 {self.percentile(single, 99):.0f} us, "
+            f"x{HAS_LIKED_BATCH} p50 {self.percentile(batched, 50):.0f} us"
+        )
+        self.stdout.write(
+            f"{'storage':<8} {'keys':>8} {'encoding':>10} {'bytes/like':>11} "
+            f"{'+index':>8} {'MB per 1M':>10}"
+        )
+
+        for name in options["storage"] or sorted(LIKES_STORAGES):
+            storage = LIKES_STORAGES[name]
+            storage.delete(comment_ids)
+            try:
+                self.load(storage, likers)
+                keys, memory = self.memory_usage(storage.keys(comment_ids))
+                encoding = self.encoding(storage.keys(comment_ids[:1]))
+            finally:
+                storage.delete(comment_ids)
+
+            per_like = memory / total_likes
+            total_per_like = per_like + index_per_like
+            self.stdout.write(
+                f"{name:<8} {keys:>8} {encoding:>10} {per_like:>11.2f} {total_per_like:>8.2f} "
+                f"{total_per_like * 1_000_000 / 1024 / 1024:>10.1f}"
+            )
+
+    def load(self, storage, likers):
+        comment_ids = list(likers)
+        for start in range(0, len(comment_ids), 100):
+            pipe = redis.pipeline(transaction=False)
+            for comment_id in comment_ids[start:start + 100]:
+                storage.queue_fill(pipe, comment_id, likers[comment_id])
+            pipe.execute()
+
+    def memory_usage(self, keys):
+        """Число существующих ключей и их суммарный размер в байтах"""
+        pipe = redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.memory_usage(key, samples=0)
+        sizes = [size for size in pipe.execute() if size is not None]
+        return len(sizes), sum(sizes)
+
+    def encoding(self, keys):
+        """Кодировка контейнера лайков первого комментария"""
+        for key in keys:
+            encoding = redis.object("encoding", key)
+            if encoding is not None:
+                return encoding.decode()
+        return "-"
+
+    def load_index(self, liked_by_user):
+        user_ids = list(liked_by_user)
+        for start in range(0, len(user_ids), 1000):
+            pipe = redis.pipeline(transaction=False)
+            for user_id in user_ids[start:start + 1000]:
+                pipe.sadd(BENCHMARK_USER_LIKED_KEY.format(user_id=user_id), *liked_by_user[user_id])
+            pipe.execute()
+
+    def delete(self, keys):
+        for start in range(0, len(keys), 1000):
+            redis.delete(*keys[start:start + 1000])
+
+    def liked_latency(self, probes, comment_ids, rng):
+        """Флаги liked: один комментарий и страница из HAS_LIKED_BATCH комментариев на запрос"""
+        single = []
+        for comment_id, user_id in probes:
+            key = BENCHMARK_USER_LIKED_KEY.format(user_id=user_id)
+            started = time.perf_counter()
+            redis.smismember(key, [comment_id])
+            single.append((time.perf_counter() - started) * 1_000_000)
+
+        batched = []
+        for _, user_id in probes[::HAS_LIKED_BATCH]:
+            key = BENCHMARK_USER_LIKED_KEY.format(user_id=user_id)
+            page = [rng.choice(comment_ids) for _ in range(HAS_LIKED_BATCH)]
+            started = time.perf_counter()
+            redis.smismember(key, page)
+            batched.append((time.perf_counter() - started) * 1_000_000)
+        return single, batched
+
+    @staticmethod
+    def percentile(values, pct):
+        if len(values) < 2:
+            return values[0] if values else 0
+        return statistics.quantiles(values, n=100)[pct - 1]
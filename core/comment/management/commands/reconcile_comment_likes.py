@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from core.comment.models import Comment
+from core.comment.services.comment_likes_cache import CommentLikesCache
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает разошедшиеся счетчики comment:{id}:likes_count в Redis"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            choices=["db", "set"],
+            default="db",
+            help="Источник истины: таблица liked_by (db) или размер множества лайков в Redis (set)",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        source = options["source"]
+        batch_size = options["batch_size"]
+
+        comment_ids = Comment.objects.order_by("id").values_list("id", flat=True)
+
+        checked = 0
+        fixed = 0
+        batch = []
+        for comment_id in comment_ids.iterator(chunk_size=batch_size):
+            batch.append(comment_id)
+            if len(batch) == batch_size:
+                fixed += len(CommentLikesCache.reconcile(batch, source=source))
+                checked += len(batch)
+                batch = []
+        if batch:
+            fixed += len(CommentLikesCache.reconcile(batch, source=source))
+            checked += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} comments, fixed {fixed} counters"))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.comment.celery_tasks.tasks import WARMUP_ORDERING, warm_comment_likes, warm_likes_cache
+
+
+class Command(BaseCommand):
+    help = "Прогревает SET лайков и счетчики comment:{id}:likes_count в Redis из БД"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--order",
+            choices=sorted(WARMUP_ORDERING),
+            default="recent",
+            help="Какие комментарии греть первыми: последние (recent) или самые залайканные (popular)",
+        )
+        parser.add_argument("--limit", type=int, default=None, help="Сколько комментариев греть первыми, по умолчанию COMMENT_LIKES_WARMUP_LIMIT")
+        parser.add_argument("--async", action="store_true", dest="run_async", help="Поставить задачу в celery")
+
+    def handle(self, *args, **options):
+        order = options["order"]
+        limit = options["limit"]
+
+        if options["run_async"]:
+            warm_comment_likes.delay(order=order, limit=limit, force=True)
+            self.stdout.write(self.style.SUCCESS("Warm-up queued"))
+            return
+
+        def report(warmed, total):
+            self.stdout.write(f"Warmed {warmed}/{total} comments")
+
+        warmed = warm_likes_cache(order=order, limit=limit, on_progress=report)
+        if warmed is None:
+            raise CommandError("Warm-up is already running")
+        self.stdout.write(self.style.SUCCESS(f"Warmed {warmed} comments"))
@@ -0,0 +1,85 @@
+import asyncio
+import json
+import statistics
+import time
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand
+from websockets.asyncio.client import connect
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест ws/comments/: постепенно открывает подписчиков и после каждого шага "
+        "рассылает пробное событие через channel layer, проверяя, сколько подписчиков его получили"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="ws://localhost:8001/ws/comments/")
+        parser.add_argument("--subscribers", type=int, default=5000, help="Максимум подписчиков")
+        parser.add_argument("--step", type=int, default=500, help="Подписчиков на шаг")
+        parser.add_argument("--timeout", type=float, default=5.0, help="Сколько ждать доставку пробы, сек")
+        parser.add_argument(
+            "--min-delivery",
+            type=float,
+            default=0.99,
+            help="Доля подписчиков, получивших пробу, ниже которой тест останавливается",
+        )
+        parser.add_argument("--max-p99", type=float, default=2000.0, help="Допустимая p99 задержка доставки, мс")
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(**options))
+
+    async def run(self, url, subscribers, step, timeout, min_delivery, max_p99, **kwargs):
+        channel_layer = get_channel_layer()
+        connections = []
+        receivers = []
+        latencies = {}
+        sustained = 0
+        seq = 0
+
+        async def subscribe():
+            websocket = await connect(url, open_timeout=30, ping_interval=None, max_queue=None)
+            connections.append(websocket)
+            receivers.append(asyncio.create_task(receive(websocket)))
+
+        async def receive(websocket):
+            async for message in websocket:
+                data = json.loads(message)
+                if data.get("type") == "load_probe":
+                    latencies.setdefault(data["seq"], []).append(time.time() - data["sent"])
+
+        try:
+            while len(connections) < subscribers:
+                batch = min(step, subscribers - len(connections))
+                results = await asyncio.gather(*(subscribe() for _ in range(batch)), return_exceptions=True)
+                failed = [result for result in results if isinstance(result, Exception)]
+                if failed:
+                    self.stdout.write(self.style.ERROR(f"{len(failed)} connections failed: {failed[0]!r}"))
+                    break
+
+                seq += 1
+                # тип load_probe фронтенд игнорирует, так что тест безопасен и для живых клиентов
+                payload = json.dumps({"type": "load_probe", "seq": seq, "sent": time.time()})
+                await channel_layer.group_send("comments_list", {"type": "comment_created", "payload": payload})
+
+                deadline = time.monotonic() + timeout
+                while len(latencies.get(seq, [])) < len(connections) and time.monotonic() < deadline:
+                    await asyncio.sleep(0.05)
+
+                received = latencies.get(seq, [])
+                delivery = len(received) / len(connections)
+                p50 = statistics.median(received) * 1000 if received else float("nan")
+                p99 = sorted(received)[int(len(received) * 0.99) - 1] * 1000 if received else float("nan")
+                self.stdout.write(
+                    f"subscribers={len(connections)} delivered={len(received)} ({delivery:.1%}) "
+                    f"p50={p50:.1f}ms p99={p99:.1f}ms"
+                )
+                if delivery < min_delivery or not p99 <= max_p99:
+                    break
+                sustained = len(connections)
+        finally:
+            for task in receivers:
+                task.cancel()
+            await asyncio.gather(*(websocket.close() for websocket in connections), return_exceptions=True)
+
+        self.stdout.write(self.style.SUCCESS(f"Sustained subscribers: {sustained}"))
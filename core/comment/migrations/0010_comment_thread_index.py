@@ -0,0 +1,66 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+BATCH_SIZE = 1000
+
+
+def build_thread_index(apps, schema_editor):
+    """Заполняет root/depth/path уровень за уровнем, bulk_update пачками по BATCH_SIZE"""
+    Comment = apps.get_model('core_comment', 'Comment')
+
+    # уровень: {id: (root_id, path)} уже проиндексированных комментариев
+    level = {
+        comment_id: (comment_id, f"{comment_id:010d}/")
+        for comment_id in Comment.objects.filter(parent__isnull=True).values_list('id', flat=True)
+    }
+    depth = 0
+    while level:
+        Comment.objects.bulk_update(
+            [
+                Comment(id=comment_id, root_id=root_id, depth=depth, path=path)
+                for comment_id, (root_id, path) in level.items()
+            ],
+            ['root_id', 'depth', 'path'],
+            batch_size=BATCH_SIZE,
+        )
+
+        parent_ids = list(level)
+        children = {}
+        for start in range(0, len(parent_ids), BATCH_SIZE):
+            rows = Comment.objects.filter(parent_id__in=parent_ids[start:start + BATCH_SIZE]).values_list('id', 'parent_id')
+            for comment_id, parent_id in rows:
+                root_id, path = level[parent_id]
+                children[comment_id] = (root_id, f"{path}{comment_id:010d}/")
+        level = children
+        depth += 1
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_comment', '0009_alter_comment_author'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='root',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='thread', to='core_comment.comment'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=1024),
+        ),
+        migrations.RunPython(build_thread_index, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['path'], name='comment_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
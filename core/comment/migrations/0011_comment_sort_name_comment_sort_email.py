@@ -0,0 +1,40 @@
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+
+
+def fill_sort_columns(apps, schema_editor):
+    Comment = apps.get_model('core_comment', 'Comment')
+    User = apps.get_model('core_user', 'User')
+
+    authors = User.objects.filter(pk=OuterRef('author_id'))
+
+    Comment.objects.filter(guest_name__isnull=False).update(sort_name=F('guest_name'))
+    Comment.objects.filter(guest_name__isnull=True, author__isnull=False).update(
+        sort_name=Subquery(authors.values('username')[:1])
+    )
+    Comment.objects.filter(guest_email__isnull=False).update(sort_email=F('guest_email'))
+    Comment.objects.filter(guest_email__isnull=True, author__isnull=False).update(
+        sort_email=Subquery(authors.values('email')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_comment', '0010_comment_thread_index'),
+        ('core_user', '0007_alter_user_is_active'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='sort_name',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=250),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='sort_email',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=254),
+        ),
+        migrations.RunPython(fill_sort_columns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_comment', '0011_comment_sort_name_comment_sort_email'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='comment',
+            name='sort_email',
+            field=models.CharField(blank=True, default='', editable=False, max_length=254),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='sort_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=250),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['active', 'parent', 'sort_name', 'id'], name='comment_feed_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['active', 'parent', 'sort_email', 'id'], name='comment_feed_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['active', 'parent', 'created', 'id'], name='comment_feed_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('active', True), ('parent__isnull', True)), fields=['-created', '-id'], name='comment_root_active_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_comment', '0012_comment_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commentattachment',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', max_length=7),
+        ),
+    ]
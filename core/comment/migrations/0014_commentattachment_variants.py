@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_comment', '0013_commentattachment_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commentattachment',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
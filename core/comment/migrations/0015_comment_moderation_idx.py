@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_comment', '0014_commentattachment_variants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('active', False)), fields=['-created', '-id'], name='comment_moderation_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:45
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_likes_count(apps, schema_editor):
+    Comment = apps.get_model('core_comment', 'Comment')
+    User = apps.get_model('core_user', 'User')
+
+    likes = (
+        User.comments_liked.through.objects
+        .filter(comment_id=OuterRef('pk'))
+        .values('comment_id')
+        .annotate(total=Count('user_id'))
+        .values('total')
+    )
+    Comment.objects.update(likes_count=Coalesce(Subquery(likes), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_comment', '0015_comment_moderation_idx'),
+        ('core_user', '0007_alter_user_is_active'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_likes_count, migrations.RunPython.noop),
+    ]
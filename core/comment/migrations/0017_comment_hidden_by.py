@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-18 21:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_hidden_comments(apps, schema_editor):
+    # как скрывали раньше, неизвестно: каждый уже скрытый комментарий восстанавливается сам по себе
+    Comment = apps.get_model('core_comment', 'Comment')
+    Comment.objects.filter(active=False).update(hidden_by=F('id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core_comment', '0016_comment_likes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='hidden_by',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core_comment.comment'),
+        ),
+        migrations.RunPython(mark_hidden_comments, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,85 @@
 from django.db import models
-from core.abstract.models import AbstractModel, AbstractModelManager
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from core.abstract.models import AbstractModel, AbstractModelManager, AbstractQuerySet
+from core.abstract.object_cache import ObjectCache
 # Create your models here.
-class CommentManager(AbstractModelManager):
+class CommentQuerySet(AbstractQuerySet):
+    def get_subtree(self, comment, max_depth=None):
+        """Все потомки комментария одним запросом по индексу path"""
+        queryset = self.filter(path__startswith=comment.path, depth__gt=comment.depth)
+        if max_depth is not None:
+            queryset = queryset.filter(depth__lte=comment.depth + max_depth)
+        return queryset
+
+    def _subtree(self, comment):
+        if not comment.path:
+            return self.filter(pk=comment.pk)
+        return self.filter(path__startswith=comment.path)
+
+    def hide_subtree(self, comment):
+        """
+        Скрывает комментарий вместе со всей веткой одним UPDATE по индексу path.
+        В hidden_by узлов записывается comment; уже скрытые раньше узлы сохраняют свой hidden_by.
+        """
+        updated = self._subtree(comment).filter(active=True).update(active=False, hidden_by=comment)
+        ObjectCache.invalidate_model(self.model)
+        return updated
+
+    def restore_subtree(self, comment):
+        """
+        Возвращает узлы ветки, скрытые тем же действием, что и comment.
+        Ответы, скрытые отдельно (своим hide или удалением), остаются скрытыми.
+        """
+        hidden_by = comment.hidden_by_id or comment.pk
+        updated = self._subtree(comment).filter(active=False, hidden_by=hidden_by).update(active=True, hidden_by=None)
+        ObjectCache.invalidate_model(self.model)
+        return updated
+
+    def change_likes_count(self, deltas):
+        """
+        Сдвигает хранимый likes_count: {comment_id: +-n}. Один UPDATE на каждое
+        значение сдвига, без COUNT по таблице лайков.
+        """
+        by_delta = {}
+        for comment_id, delta in deltas.items():
+            by_delta.setdefault(delta, []).append(comment_id)
+        for delta, comment_ids in by_delta.items():
+            self.filter(pk__in=comment_ids).update(likes_count=F('likes_count') + delta)
+
+    def refresh_likes_count(self, comment_ids):
+        """Пересчитывает хранимый likes_count по таблице лайков одним UPDATE с подзапросом"""
+        likes = (
+            self.model.liked_by.through.objects
+            .filter(comment_id=OuterRef('pk'))
+            .values('comment_id')
+            .annotate(total=Count('user_id'))
+            .values('total')
+        )
+        updated = self.filter(pk__in=comment_ids).update(likes_count=Coalesce(Subquery(likes), 0))
+        # UPDATE мимо сигналов: сбрасываем из кеша только пересчитанные комментарии
+        for public_id in self.filter(pk__in=comment_ids).values_list('public_id', flat=True):
+            ObjectCache.invalidate(self.model, public_id)
+        return updated
+
+    def with_related(self):
+        """Автор, родитель и вложения без отдельных запросов на каждую строку"""
+        return self.select_related('author', 'parent').prefetch_related('attachments')
+
+
+class CommentManager(AbstractModelManager.from_queryset(CommentQuerySet)):
     def get_root_comments(self):
         """Возвращает только корневые комментарии"""
         return self.filter(parent__isnull=True)
 
+# сегмент пути - id предка из 10 цифр и "/", поэтому глубина ветки ограничена длиной колонки path
+PATH_MAX_LENGTH = 1024
+PATH_SEGMENT_LENGTH = 11
+
+
 class Comment(AbstractModel):
+    # глубже ответы не принимаются: путь не поместится в path
+    MAX_DEPTH = PATH_MAX_LENGTH // PATH_SEGMENT_LENGTH - 1
     
     author = models.ForeignKey("core_user.User", on_delete=models.CASCADE, blank=True, null=True)
     guest_name = models.CharField(max_length=100, blank=True, null=True)
@@ -14,10 +87,23 @@ class Comment(AbstractModel):
     homepage = models.URLField(blank=True, null=True)
     # отношения с самим собой чтобы реализовать (каскадное отображение)
     parent = models.ForeignKey('self', null=True, blank=True, related_name='replies', on_delete=models.CASCADE)
+    # индекс ветки (materialized path): корень, глубина и путь из id предков
+    root = models.ForeignKey('self', null=True, blank=True, related_name='thread', on_delete=models.CASCADE, editable=False)
+    depth = models.PositiveIntegerField(default=0, editable=False)
+    path = models.CharField(max_length=PATH_MAX_LENGTH, blank=True, default='', editable=False)
+    # значения для сортировки по имени/почте автора (гость или пользователь)
+    sort_name = models.CharField(max_length=250, blank=True, default='', editable=False)
+    sort_email = models.CharField(max_length=254, blank=True, default='', editable=False)
     text = models.TextField()
     
     edited = models.BooleanField(default=False)
     active = models.BooleanField(default=True)
+    # вершина ветки, скрытием которой скрыт этот комментарий (restore возвращает только ее узлы)
+    hidden_by = models.ForeignKey(
+        'self', null=True, blank=True, related_name='+', on_delete=models.SET_NULL, editable=False
+    )
+    # число лайков, хранится в БД, чтобы холодное чтение не считало liked_by.count()
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
     
     
     objects = CommentManager()
@@ -25,11 +111,60 @@ class Comment(AbstractModel):
     
     class Meta:
         ordering = ['-created']  # LIFO default
+        indexes = [
+            models.Index(fields=['path'], name='comment_path_idx', opclasses=['varchar_pattern_ops']),
+            # под сортировки ленты: фильтр active/parent + (поле сортировки, id)
+            models.Index(fields=['active', 'parent', 'sort_name', 'id'], name='comment_feed_name_idx'),
+            models.Index(fields=['active', 'parent', 'sort_email', 'id'], name='comment_feed_email_idx'),
+            models.Index(fields=['active', 'parent', 'created', 'id'], name='comment_feed_created_idx'),
+            models.Index(
+                fields=['-created', '-id'],
+                name='comment_root_active_idx',
+                condition=models.Q(active=True, parent__isnull=True),
+            ),
+            # очередь модерации: только скрытые комментарии, их обычно немного
+            models.Index(
+                fields=['-created', '-id'],
+                name='comment_moderation_idx',
+                condition=models.Q(active=False),
+            ),
+        ]
         
     def __str__(self):
         if self.author:
             return self.author.username
         return self.guest_name or "Anonymous"
+
+    @staticmethod
+    def path_segment(comment_id):
+        return f"{comment_id:010d}/"
+
+    def save(self, *args, **kwargs):
+        self.sort_name, self.sort_email = self._sort_values()
+        is_new = self._state.adding
+        if is_new and self.parent_id and self.parent.depth >= self.MAX_DEPTH:
+            raise ValueError(f"Comment thread is deeper than {self.MAX_DEPTH} levels")
+        super().save(*args, **kwargs)
+        if is_new:
+            self._build_thread_index()
+
+    def _sort_values(self):
+        author = self.author if self.author_id else None
+        sort_name = self.guest_name if self.guest_name is not None else getattr(author, 'username', '')
+        sort_email = self.guest_email if self.guest_email is not None else getattr(author, 'email', '')
+        return sort_name or '', sort_email or ''
+
+    def _build_thread_index(self):
+        if self.parent_id:
+            parent = self.parent
+            self.root_id = parent.root_id or parent.id
+            self.depth = parent.depth + 1
+            self.path = parent.path + self.path_segment(self.id)
+        else:
+            self.root_id = self.id
+            self.depth = 0
+            self.path = self.path_segment(self.id)
+        Comment.objects.filter(pk=self.pk).update(root_id=self.root_id, depth=self.depth, path=self.path)
     
     @property
     def author_name(self):
@@ -46,6 +181,15 @@ class CommentAttachment(models.Model):
         ('image', 'Image'),
         ('text', 'Text File'),
     )
+
+    STATUS_PENDING = 'pending'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_READY, 'Ready'),
+        (STATUS_FAILED, 'Failed'),
+    )
     
     comment = models.ForeignKey(
         Comment,
@@ -56,6 +200,10 @@ class CommentAttachment(models.Model):
 
     file = models.FileField(upload_to='comment_attachments/%Y/%m/%d/')
     attachment_type = models.CharField(max_length=5, choices=ATTACHMENT_CHOICES, default='image')
+    # картинки обрабатываются в фоне (celery), до этого в file лежит исходник
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=STATUS_READY)
+    # варианты картинки: {"width", "height", "placeholder", "images": [{"width", "height", "format", "name"}]}
+    variants = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return f"{self.attachment_type} for {self.comment.author_name}"
\ No newline at end of file
@@ -0,0 +1,112 @@
+import base64
+import binascii
+import json
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CommentCursorPagination(BasePagination):
+    """
+    Keyset-пагинация по (поле сортировки, id).
+    Берет порядок из queryset.order_by(...) вида ('-sort_name', '-id'),
+    поэтому страница 10 000 стоит столько же, сколько первая.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    datetime_fields = ('created', 'updated')
+    max_pk = 2 ** 63 - 1
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        ordering = queryset.query.order_by
+        self.sort_field = ordering[0].lstrip('-')
+        self.descending = ordering[0].startswith('-')
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            value, pk = cursor
+            if self.descending:
+                queryset = queryset.filter(
+                    Q(**{f'{self.sort_field}__lt': value}) | Q(**{self.sort_field: value, 'id__lt': pk})
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(**{f'{self.sort_field}__gt': value}) | Q(**{self.sort_field: value, 'id__gt': pk})
+                )
+
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        value = getattr(last, self.sort_field)
+        if self.sort_field in self.datetime_fields:
+            value = value.isoformat()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(value, last.id))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def encode_cursor(self, value, pk):
+        payload = json.dumps([value, pk]).encode('utf-8')
+        return base64.urlsafe_b64encode(payload).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+        except (TypeError, ValueError, binascii.Error, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        # курсор приходит от клиента: до ORM доходят только строка и id в пределах bigint
+        if not isinstance(value, str) or type(pk) is not int or not 0 < pk <= self.max_pk:
+            raise NotFound(self.invalid_cursor_message)
+
+        if self.sort_field in self.datetime_fields:
+            try:
+                value = parse_datetime(value)
+            except ValueError:
+                value = None
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+        return value, pk
@@ -6,12 +6,17 @@ from core.user.serializers import UserSerializer
 from core.comment.models import Comment, CommentAttachment
 import bleach
 from django.conf import settings
+from django.db import models, transaction
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
 from PIL import Image
-from io import BytesIO
-from django.core.files.uploadedfile import InMemoryUploadedFile
-from captcha.models import CaptchaStore
 
+from core.auth.services.captcha_store import get_captcha_store
 from core.comment.services.comment_likes_cache import CommentLikesCache
+from core.comment.celery_tasks.tasks import process_comment_image
+
+logger = logging.getLogger(__name__)
 
 # Разрешенные HTML теги для поля Text
 ALLOWED_TAGS = ['a', 'code', 'i', 'strong']
@@ -21,9 +26,71 @@ ALLOWED_ATTRIBUTES = {
 
 
 class CommentAttachmentSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+    placeholder = serializers.SerializerMethodField()
+    width = serializers.SerializerMethodField()
+    height = serializers.SerializerMethodField()
+
+    def get_srcset(self, instance):
+        """{"webp": "url 160w, url 320w", "jpeg": ...} для <picture>/<source srcset>"""
+        storage = instance.file.storage
+        srcset = {}
+        for image in instance.variants.get('images', []):
+            entry = f"{storage.url(image['name'])} {image['width']}w"
+            srcset.setdefault(image['format'], []).append(entry)
+        return {fmt: ", ".join(reversed(entries)) for fmt, entries in srcset.items()}
+
+    def get_placeholder(self, instance):
+        return instance.variants.get('placeholder')
+
+    def get_width(self, instance):
+        return instance.variants.get('width')
+
+    def get_height(self, instance):
+        return instance.variants.get('height')
+
     class Meta:
         model = CommentAttachment
-        fields = ['id', 'file', 'attachment_type']
+        fields = ['id', 'file', 'attachment_type', 'status', 'srcset', 'placeholder', 'width', 'height']
+
+
+def viewer_liked(request, comment_ids):
+    """
+    Флаги liked текущего пользователя, запомненные на время запроса:
+    каждый комментарий спрашивается у Redis не больше одного раза.
+    """
+    liked = getattr(request, '_viewer_liked', None)
+    if liked is None:
+        liked = request._viewer_liked = {}
+    missing = [comment_id for comment_id in comment_ids if comment_id not in liked]
+    if missing:
+        liked.update(CommentLikesCache.bulk_has_liked(missing, request.user.id))
+    return liked
+
+
+class CommentListSerializer(serializers.ListSerializer):
+    """
+    Список комментариев: лайки и флаги liked для всей страницы
+    загружаются одной пачкой, а не по два запроса в Redis на строку.
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        comments = list(iterable)
+        comment_ids = [comment.id for comment in comments]
+
+        self.child._likes_counts = CommentLikesCache.bulk_likes_count(comment_ids)
+
+        request = self.context.get('request', None)
+        if request is not None and not request.user.is_anonymous:
+            # вся страница одним SMISMEMBER, get_liked дальше читает из памяти
+            viewer_liked(request, comment_ids)
+
+        try:
+            return super().to_representation(comments)
+        finally:
+            del self.child._likes_counts
+
 
 class CommentSerializer(AbstractSerializers):
     author = serializers.HiddenField(
@@ -57,13 +124,16 @@ class CommentSerializer(AbstractSerializers):
 
     
     def get_likes_count(self, instance):
+        likes_counts = getattr(self, '_likes_counts', None)
+        if likes_counts is not None and instance.id in likes_counts:
+            return likes_counts[instance.id]
         return CommentLikesCache.likes_count(instance.id)
     
     def get_liked(self, instance):
         request = self.context.get('request', None)
         if request is None or request.user.is_anonymous:
             return False
-        return CommentLikesCache.has_liked(instance.id, request.user.id)
+        return viewer_liked(request, [instance.id])[instance.id]
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
@@ -79,9 +149,20 @@ class CommentSerializer(AbstractSerializers):
         return representation
     
     
+    def validate_parent(self, parent):
+        if parent is not None and parent.depth >= Comment.MAX_DEPTH:
+            raise ValidationError(f"Replies are limited to {Comment.MAX_DEPTH} levels.")
+        return parent
+
     def validate(self, data):
-        user = self.context['request'].user
+        request = self.context['request']
+        user = request.user
         is_authenticated = user and user.is_authenticated
+
+        # файлы, отклоненные AttachmentUploadHandler еще во время загрузки
+        upload_errors = getattr(request, 'upload_errors', None)
+        if upload_errors:
+            raise ValidationError({"files": upload_errors})
         
         
         if not is_authenticated:
@@ -93,12 +174,11 @@ class CommentSerializer(AbstractSerializers):
             if not data.get('captcha_key') or not data.get('captcha_value'):
                 raise serializers.ValidationError({"captcha": "Капча обязательна"})
             
-            try:
-                captcha = CaptchaStore.objects.get(hashkey=data['captcha_key'])
-            except CaptchaStore.DoesNotExist:
+            verified = get_captcha_store().verify(data['captcha_key'], data['captcha_value'])
+            if verified is None:
                 raise serializers.ValidationError({"captcha": "Неверный ключ капчи"})
 
-            if captcha.response != data['captcha_value'].lower():
+            if not verified:
                 raise serializers.ValidationError({"captcha": "Неверное значение капчи"})
 
             
@@ -132,63 +212,90 @@ class CommentSerializer(AbstractSerializers):
             validated_data.pop('author', None)
             
 
-        
-        comment = Comment.objects.create(**validated_data)
+        # сначала проверяем все файлы, потом грузим их в хранилище и только потом пишем в БД
+        files = self._validate_files(request_files)
+        uploaded_names = self._upload_files([uploaded_file for uploaded_file, _ in files])
+
+        try:
+            with transaction.atomic():
+                comment = Comment.objects.create(**validated_data)
+                attachments = CommentAttachment.objects.bulk_create([
+                    CommentAttachment(
+                        comment=comment,
+                        file=name,
+                        attachment_type=file_type,
+                        status=CommentAttachment.STATUS_PENDING if file_type == 'image' else CommentAttachment.STATUS_READY,
+                    )
+                    for name, (_, file_type) in zip(uploaded_names, files)
+                ])
+                for attachment in attachments:
+                    if attachment.attachment_type == 'image':
+                        transaction.on_commit(partial(process_comment_image.delay, attachment.id))
+        except Exception:
+            # комментарий не сохранился - убираем уже загруженные файлы
+            self._delete_uploaded(uploaded_names)
+            raise
+
+        return comment
 
+    def _validate_files(self, request_files):
+        files = []
         for uploaded_file in request_files:
             file_type = 'image' if uploaded_file.content_type.startswith('image/') else 'text'
             
             if file_type == 'image':
-                if uploaded_file.size > 10 * 1024 * 1024: 
+                if uploaded_file.size > settings.ATTACHMENT_MAX_IMAGE_SIZE:
                     raise ValidationError("Image file is too large.")
 
                 if uploaded_file.content_type not in ['image/jpeg', 'image/gif', 'image/png']:
                     raise ValidationError("Image must be in JPG, GIF, or PNG format.")
 
                 try:
-                    img = Image.open(uploaded_file)
-                    original_format = img.format
+                    # читаем только заголовок, уменьшение делает celery-задача
+                    Image.open(uploaded_file)
                 except Exception:
                     raise ValidationError("Invalid image file.")
-                
-                max_width, max_height = 320, 240
-                if img.width > max_width or img.height > max_height:
-                    img.thumbnail((max_width, max_height), Image.LANCZOS)
-                
-                output = BytesIO()
-                if original_format in ['JPEG', 'JPG']:
-                    img.save(output, format='JPEG')
-                elif original_format == 'PNG':
-                    img.save(output, format='PNG')
-                elif original_format == 'GIF':
-                    img.save(output, format='GIF')
-                
-                output.seek(0)
-                
-                uploaded_file = InMemoryUploadedFile(
-                    output, 
-                    'FileField', 
-                    uploaded_file.name, 
-                    uploaded_file.content_type, 
-                    output.tell(), 
-                    None
-                )
             
             elif file_type == 'text':
                 if not uploaded_file.name.lower().endswith('.txt'):
                     raise ValidationError("Text file must be in TXT format.")
-                if uploaded_file.size > 100 * 1024:
+                if uploaded_file.size > settings.ATTACHMENT_MAX_TEXT_SIZE:
                     raise ValidationError("Text file is too large (max 100kb).")
-            
-            CommentAttachment.objects.create(
-                comment=comment, 
-                file=uploaded_file,
-                attachment_type=file_type
-            )
 
-        return comment
+            files.append((uploaded_file, file_type))
+        return files
+
+    def _upload_files(self, request_files):
+        """Параллельная загрузка в хранилище, при любой ошибке загруженное удаляется"""
+        if not request_files:
+            return []
 
+        field = CommentAttachment._meta.get_field('file')
 
+        def upload(uploaded_file):
+            name = field.generate_filename(None, uploaded_file.name)
+            return field.storage.save(name, uploaded_file, max_length=field.max_length)
+
+        workers = min(settings.ATTACHMENT_UPLOAD_WORKERS, len(request_files))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(upload, uploaded_file) for uploaded_file in request_files]
+            wait(futures)
+
+        uploaded_names = [future.result() for future in futures if future.exception() is None]
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            self._delete_uploaded(uploaded_names)
+            raise errors[0]
+        return uploaded_names
+
+    @staticmethod
+    def _delete_uploaded(names):
+        storage = CommentAttachment._meta.get_field('file').storage
+        for name in names:
+            try:
+                storage.delete(name)
+            except Exception:
+                logger.exception("Failed to delete orphaned attachment %s", name)
 
     
     def update(self, instance, validated_data):
@@ -203,4 +310,5 @@ class CommentSerializer(AbstractSerializers):
             'id', 'author', 'guest_name', 'guest_email', 'parent', 'author_name', 'author_email', 'liked', 'likes_count', 
             'text', 'attachments', 'edited', 'created', 'updated', 'captcha_key', 'captcha_value'
         ]
-        read_only_fields = ['edited']
\ No newline at end of file
+        read_only_fields = ['edited']
+        list_serializer_class = CommentListSerializer
\ No newline at end of file
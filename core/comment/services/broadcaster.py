@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+PUBLISH_LAG = Histogram(
+    "comment_broadcast_publish_lag_seconds",
+    "Время от коммита транзакции до отправки события в channel layer",
+)
+PUBLISHED = Counter("comment_broadcast_published_total", "Отправленные WebSocket события")
+FAILED = Counter("comment_broadcast_failed_total", "События, которые не удалось отправить")
+DROPPED = Counter("comment_broadcast_dropped_total", "События, отброшенные из-за переполнения очереди")
+QUEUE_DEPTH = Gauge("comment_broadcast_queue_depth", "Событий в очереди на отправку", multiprocess_mode="livesum")
+
+
+class CommentBroadcaster:
+    """
+    Отправка WebSocket событий вне потока запроса.
+    publish() ставит событие в очередь после коммита транзакции, фоновый поток
+    забирает накопившиеся события пачкой и шлет их в channel layer одним
+    проходом своего event loop.
+    """
+
+    _lock = threading.Lock()
+    _queue = None
+    _thread = None
+    _pid = None
+
+    @classmethod
+    def publish(cls, group, event):
+        transaction.on_commit(lambda: cls._enqueue(group, event))
+
+    @classmethod
+    def _enqueue(cls, group, event):
+        events = cls._ensure_worker()
+        try:
+            events.put_nowait((time.monotonic(), group, event))
+        except queue.Full:
+            DROPPED.inc()
+            logger.warning("Broadcast queue is full, dropping %s for %s", event.get("type"), group)
+            return
+        QUEUE_DEPTH.set(events.qsize())
+
+    @classmethod
+    def _ensure_worker(cls):
+        with cls._lock:
+            # после fork поток родителя в дочернем процессе не существует
+            if cls._thread is None or not cls._thread.is_alive() or cls._pid != os.getpid():
+                cls._queue = queue.Queue(maxsize=settings.COMMENT_BROADCAST_QUEUE_SIZE)
+                cls._pid = os.getpid()
+                cls._thread = threading.Thread(
+                    target=cls._run,
+                    args=(cls._queue,),
+                    name="comment-broadcaster",
+                    daemon=True,
+                )
+                cls._thread.start()
+            return cls._queue
+
+    @classmethod
+    def _run(cls, events):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        channel_layer = get_channel_layer()
+        batch_size = settings.COMMENT_BROADCAST_BATCH_SIZE
+
+        while True:
+            batch = [events.get()]
+            while len(batch) < batch_size:
+                try:
+                    batch.append(events.get_nowait())
+                except queue.Empty:
+                    break
+            QUEUE_DEPTH.set(events.qsize())
+
+            try:
+                loop.run_until_complete(cls._send_batch(channel_layer, batch))
+            except Exception:
+                FAILED.inc(len(batch))
+                logger.exception("Failed to publish %s broadcast events", len(batch))
+
+    @staticmethod
+    async def _send_batch(channel_layer, batch):
+        results = await asyncio.gather(
+            *(channel_layer.group_send(group, event) for _, group, event in batch),
+            return_exceptions=True,
+        )
+        sent_at = time.monotonic()
+        for (enqueued_at, group, event), result in zip(batch, results):
+            if isinstance(result, Exception):
+                FAILED.inc()
+                logger.error("Failed to publish %s to %s: %s", event.get("type"), group, result)
+            else:
+                PUBLISHED.inc()
+                PUBLISH_LAG.observe(sent_at - enqueued_at)
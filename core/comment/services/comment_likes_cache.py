@@ -1,53 +1,307 @@
-from django_redis import get_redis_connection
+from django.db.models import Count
+from redis.exceptions import ResponseError
 from core.comment.models import Comment
+from core.comment.services.likes_storage import get_likes_storage, redis
 
-redis = get_redis_connection("default")
+# write-behind: лайки копятся в hash "comment_id:user_id" -> 1/0 (последнее действие),
+# celery забирает его RENAME-ом и переносит в БД пачками
+PENDING_KEY = "comments:likes:pending"
+FLUSHING_KEY = "comments:likes:pending:flushing"
+
+# Ключ "прогрето" ставится прогревом и пропадает вместе с данными при рестарте/failover Redis.
+# Пока его нет, отсутствие лайка в Redis ничего не значит и has_liked спрашивает БД.
+# Ключ свой у каждого бэкенда хранения, так что смена COMMENT_LIKES_STORAGE тоже требует прогрева.
+# WARM_VERSION повышается, когда прогрев начинает заполнять что-то новое: со старым флагом
+# кеш считался бы теплым без этих данных. 2 - обратные индексы user:{id}:liked.
+WARM_VERSION = 2
+WARM_KEY = "comments:likes:warm:v{version}:{storage}"
+WARMING_KEY = "comments:likes:warming"
+
+# обратный индекс: SET id комментариев, которые лайкнул пользователь.
+# Флаги liked для целой страницы - один SMISMEMBER вместо SISMEMBER на комментарий.
+# Цена - каждый лайк хранится второй раз (intset/hashtable на пользователя),
+# что съедает экономию памяти битовых карт COMMENT_LIKES_STORAGE="bitmap".
+USER_LIKED_KEY = "user:{user_id}:liked"
 
 
 class CommentLikesCache:
 
     @staticmethod
-    def like(comment_id, user_id):
-        user_id_str = str(user_id)
-        key = f"comment:{comment_id}:likes"
-        count_key = f"comment:{comment_id}:likes_count"
-        # Only add and increment if not already liked
-        if not redis.sismember(key, user_id_str):
-            redis.sadd(key, user_id_str)
-            redis.incr(count_key)
+    def like(comment_id, user_id, write_behind=False):
+        pending_key = PENDING_KEY if write_behind else None
+        # MULTI: лайк комментария и обратный индекс пользователя меняются вместе
+        pipe = redis.pipeline()
+        get_likes_storage().like(comment_id, user_id, pending_key=pending_key, client=pipe)
+        pipe.sadd(USER_LIKED_KEY.format(user_id=user_id), comment_id)
+        added, _ = pipe.execute()
+        return bool(added)
+
+    @staticmethod
+    def unlike(comment_id, user_id, write_behind=False):
+        pending_key = PENDING_KEY if write_behind else None
+        pipe = redis.pipeline()
+        get_likes_storage().unlike(comment_id, user_id, pending_key=pending_key, client=pipe)
+        pipe.srem(USER_LIKED_KEY.format(user_id=user_id), comment_id)
+        removed, _ = pipe.execute()
+        return bool(removed)
+
+    @staticmethod
+    def take_pending():
+        """
+        Забирает накопленные write-behind лайки: {(comment_id, user_id): liked}.
+        Очередь атомарно переименовывается, новые лайки копятся уже в свежий ключ.
+        Если прошлый сброс упал до ack_pending, сначала повторно отдается его пачка.
+        """
+        if not redis.exists(FLUSHING_KEY):
+            try:
+                redis.rename(PENDING_KEY, FLUSHING_KEY)
+            except ResponseError:
+                # очередь пуста
+                return {}
+
+        pending = {}
+        for field, value in redis.hscan_iter(FLUSHING_KEY, count=1000):
+            comment_id, user_id = field.decode().split(":")
+            pending[(int(comment_id), int(user_id))] = value == b"1"
+        return pending
+
+    @staticmethod
+    def pending_unlikes(pairs, chunk_size=1000):
+        """
+        Пары (comment_id, user_id) из pairs, чье последнее действие в очереди write-behind -
+        unlike: строка лайка в БД еще есть, но возвращать ее в Redis нельзя.
+        Свежая очередь важнее забранной на сброс.
+        """
+        if not pairs or not redis.exists(PENDING_KEY, FLUSHING_KEY):
+            return set()
+
+        pipe = redis.pipeline(transaction=False)
+        for start in range(0, len(pairs), chunk_size):
+            fields = [f"{comment_id}:{user_id}" for comment_id, user_id in pairs[start:start + chunk_size]]
+            pipe.hmget(PENDING_KEY, fields)
+            pipe.hmget(FLUSHING_KEY, fields)
+        results = pipe.execute()
+
+        unliked = set()
+        for index, start in enumerate(range(0, len(pairs), chunk_size)):
+            chunk = pairs[start:start + chunk_size]
+            for pair, pending, flushing in zip(chunk, results[2 * index], results[2 * index + 1]):
+                last = pending if pending is not None else flushing
+                if last == b"0":
+                    unliked.add(pair)
+        return unliked
 
     @staticmethod
-    def unlike(comment_id, user_id):
-        user_id_str = str(user_id)
-        key = f"comment:{comment_id}:likes"
-        count_key = f"comment:{comment_id}:likes_count"
-        # Only remove and decrement if user has liked
-        if redis.sismember(key, user_id_str):
-            redis.srem(key, user_id_str)
-            redis.decr(count_key)
+    def ack_pending():
+        """Пачка из take_pending записана в БД"""
+        redis.delete(FLUSHING_KEY)
+
+    @staticmethod
+    def drop_counts(comment_ids):
+        """
+        Сбрасывает счетчики после переноса лайков в БД. Пока счетчика нет, like/unlike
+        его не трогают, и загруженный в это время из likes_count счетчик не учитывал
+        лайки из очереди. Следующее чтение возьмет уже пересчитанный likes_count.
+        """
+        comment_ids = list(comment_ids)
+        if not comment_ids:
+            return
+        storage = get_likes_storage()
+        pipe = redis.pipeline(transaction=False)
+        for comment_id in comment_ids:
+            storage.queue_drop_count(pipe, comment_id)
+        pipe.execute()
+
+    @staticmethod
+    def flush_lock(timeout):
+        return redis.lock("comments:likes:flush-lock", timeout=timeout, blocking=False)
+
+    @staticmethod
+    def bulk_unlike(comment_ids, user_id):
+        """Снимает лайки пользователя с пачки комментариев одним pipeline"""
+        comment_ids = list(comment_ids)
+        if not comment_ids:
+            return
+        storage = get_likes_storage()
+        pipe = redis.pipeline(transaction=False)
+        for comment_id in comment_ids:
+            storage.unlike(comment_id, user_id, client=pipe)
+        pipe.srem(USER_LIKED_KEY.format(user_id=user_id), *comment_ids)
+        pipe.execute()
+
+    @staticmethod
+    def purge(comment_ids):
+        """Удаляет ключи лайков удаленных комментариев"""
+        get_likes_storage().delete(list(comment_ids))
 
     @staticmethod
     def has_liked(comment_id, user_id):
-        user_id_str = str(user_id)
-        return bool(redis.sismember(f"comment:{comment_id}:likes", user_id_str))
+        return CommentLikesCache.bulk_has_liked([comment_id], user_id)[comment_id]
 
     @staticmethod
     def likes_count(comment_id):
-        count = redis.get(f"comment:{comment_id}:likes_count")
-        if count is None:
-            # загрузка в кеш из БД при первом запросе
-            real_count = Comment.objects.get(id=comment_id).liked_by.count()
-            redis.set(f"comment:{comment_id}:likes_count", real_count)
-            return real_count
-        return int(count)
-
-    @staticmethod
-    def warmup(comment_id):
-        # Инициализация SET лайков из БД
-        comment = Comment.objects.get(id=comment_id)
-        user_ids = comment.liked_by.values_list("id", flat=True)
-        key = f"comment:{comment_id}:likes"
-
-        redis.delete(key)
-        if user_ids:
-            redis.sadd(key, *user_ids)
+        return CommentLikesCache.bulk_likes_count([comment_id])[comment_id]
+
+    @staticmethod
+    def bulk_likes_count(comment_ids):
+        """
+        Счетчики лайков для пачки комментариев: одно чтение из Redis,
+        промахи добираются одним запросом по колонке likes_count.
+        """
+        comment_ids = list(comment_ids)
+        if not comment_ids:
+            return {}
+
+        storage = get_likes_storage()
+        values = storage.get_counts(comment_ids)
+
+        counts = {}
+        missing = []
+        for comment_id, value in zip(comment_ids, values):
+            if value is None:
+                missing.append(comment_id)
+            else:
+                counts[comment_id] = int(value)
+
+        if missing:
+            real_counts = dict(Comment.objects.filter(id__in=missing).values_list("id", "likes_count"))
+
+            pipe = redis.pipeline(transaction=False)
+            for comment_id in missing:
+                counts[comment_id] = real_counts.get(comment_id, 0)
+                storage.queue_set_count(pipe, comment_id, counts[comment_id])
+            pipe.execute()
+
+        return counts
+
+    @staticmethod
+    def bulk_has_liked(comment_ids, user_id):
+        """Флаги "лайкнул ли пользователь" для пачки комментариев: один SMISMEMBER по обратному индексу."""
+        comment_ids = list(comment_ids)
+        if not comment_ids:
+            return {}
+
+        pipe = redis.pipeline(transaction=False)
+        pipe.exists(CommentLikesCache.warm_key())
+        pipe.smismember(USER_LIKED_KEY.format(user_id=user_id), comment_ids)
+        is_warm, results = pipe.execute()
+
+        if not is_warm:
+            # кеш холодный или прогревается - один пачечный запрос в БД вместо ложных False
+            liked = set(
+                Comment.liked_by.through.objects
+                .filter(user_id=user_id, comment_id__in=comment_ids)
+                .values_list("comment_id", flat=True)
+            )
+            return {comment_id: comment_id in liked for comment_id in comment_ids}
+
+        return {
+            comment_id: bool(result)
+            for comment_id, result in zip(comment_ids, results)
+        }
+
+    @staticmethod
+    def reconcile(comment_ids, source="db"):
+        """
+        Пересчитывает счетчики лайков для пачки комментариев.
+        source="db" - из таблицы liked_by, source="set" - по размеру множества лайков в Redis.
+        Возвращает список id, у которых счетчик разошелся с источником.
+        """
+        comment_ids = list(comment_ids)
+        if not comment_ids:
+            return []
+
+        storage = get_likes_storage()
+        if source == "db":
+            rows = (
+                Comment.liked_by.through.objects
+                .filter(comment_id__in=comment_ids)
+                .values("comment_id")
+                .annotate(total=Count("user_id"))
+            )
+            real_counts = {row["comment_id"]: row["total"] for row in rows}
+        elif source == "set":
+            pipe = redis.pipeline(transaction=False)
+            for comment_id in comment_ids:
+                storage.queue_cardinality(pipe, comment_id)
+            real_counts = dict(zip(comment_ids, pipe.execute()))
+        else:
+            raise ValueError(f"Unknown reconcile source: {source}")
+
+        values = storage.get_counts(comment_ids)
+
+        drifted = []
+        pipe = redis.pipeline(transaction=False)
+        for comment_id, value in zip(comment_ids, values):
+            real_count = real_counts.get(comment_id, 0)
+            if value is None or int(value) != real_count:
+                drifted.append(comment_id)
+                storage.queue_set_count(pipe, comment_id, real_count)
+        if drifted:
+            pipe.execute()
+
+        return drifted
+
+    @staticmethod
+    def warm_key():
+        return WARM_KEY.format(version=WARM_VERSION, storage=get_likes_storage().name)
+
+    @staticmethod
+    def is_warm():
+        return bool(redis.exists(CommentLikesCache.warm_key()))
+
+    @staticmethod
+    def start_warming(timeout):
+        """Флаг "идет прогрев", заодно не дает запустить два прогрева сразу"""
+        return bool(redis.set(WARMING_KEY, 1, nx=True, ex=timeout))
+
+    @staticmethod
+    def touch_warming(timeout):
+        """Продлевает флаг прогрева: проход по всей таблице может идти дольше timeout"""
+        redis.expire(WARMING_KEY, timeout)
+
+    @staticmethod
+    def finish_warming():
+        """Вызывается после прогрева всей таблицы: с этого момента отсутствие лайка в Redis значит False"""
+        pipe = redis.pipeline()
+        pipe.set(CommentLikesCache.warm_key(), 1)
+        pipe.delete(WARMING_KEY)
+        pipe.execute()
+
+    @staticmethod
+    def abort_warming():
+        redis.delete(WARMING_KEY)
+
+    @staticmethod
+    def warmup(comment_ids):
+        """
+        Заполняет лайки, счетчики и обратные индексы пользователей для пачки комментариев:
+        один запрос в БД и один pipeline, счетчик = фактическому размеру множества.
+        Существующие ключи не стираются, чтобы не потерять лайки, пришедшие во время прогрева,
+        а лайки, снятые в еще не сброшенной очереди write-behind, пропускаются.
+        """
+        comment_ids = list(comment_ids)
+        if not comment_ids:
+            return
+
+        members = {}
+        liked_by_user = {}
+        rows = list(
+            Comment.liked_by.through.objects
+            .filter(comment_id__in=comment_ids)
+            .values_list("comment_id", "user_id")
+        )
+        unliked = CommentLikesCache.pending_unlikes(rows)
+        for comment_id, user_id in rows:
+            if (comment_id, user_id) in unliked:
+                continue
+            members.setdefault(comment_id, []).append(user_id)
+            liked_by_user.setdefault(user_id, []).append(comment_id)
+
+        storage = get_likes_storage()
+        pipe = redis.pipeline(transaction=False)
+        for comment_id in comment_ids:
+            storage.queue_fill(pipe, comment_id, members.get(comment_id, []))
+        for user_id, liked_ids in liked_by_user.items():
+            pipe.sadd(USER_LIKED_KEY.format(user_id=user_id), *liked_ids)
+        pipe.execute()
@@ -0,0 +1,78 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+GENERATION_KEY = "comments:list:generation"
+
+
+class CommentListCache:
+    """
+    Кеш страниц ленты комментариев для анонимов.
+    Ключ содержит номер поколения: любое изменение комментариев или лайков
+    увеличивает его, и все старые страницы разом становятся недоступны.
+    Последняя посчитанная версия страницы живет еще и под ключом без поколения:
+    пока новую считает один запрос, остальные получают ее вместо ожидания.
+    """
+
+    cached_params = ("sort_by", "order", "limit", "offset", "cursor", "pagination")
+
+    @staticmethod
+    def generation():
+        generation = cache.get(GENERATION_KEY)
+        if generation is None:
+            cache.add(GENERATION_KEY, 1, timeout=None)
+            generation = cache.get(GENERATION_KEY, 1)
+        return generation
+
+    @staticmethod
+    def invalidate():
+        try:
+            cache.incr(GENERATION_KEY)
+        except ValueError:
+            cache.add(GENERATION_KEY, 1, timeout=None)
+
+    @classmethod
+    def page_digest(cls, request):
+        params = request.query_params
+        parts = [request.get_host()] + [f"{name}={params.get(name, '')}" for name in cls.cached_params]
+        return hashlib.md5("&".join(parts).encode("utf-8")).hexdigest()
+
+    @classmethod
+    def page_key(cls, request):
+        return f"comments:list:v{cls.generation()}:{cls.page_digest(request)}"
+
+    @classmethod
+    def stale_key(cls, request):
+        return f"comments:list:stale:{cls.page_digest(request)}"
+
+    @classmethod
+    def get_or_set(cls, request, compute):
+        key = cls.page_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return data
+
+        # защита от stampede: страницу считает один запрос, остальные отдают прошлую версию,
+        # а если ее нет - ждут не дольше COMMENT_LIST_CACHE_WAIT и считают сами
+        lock_key = f"{key}:lock"
+        stale_key = cls.stale_key(request)
+        if not cache.add(lock_key, 1, timeout=settings.COMMENT_LIST_CACHE_LOCK_TIMEOUT):
+            data = cache.get(stale_key)
+            if data is not None:
+                return data
+            deadline = time.monotonic() + settings.COMMENT_LIST_CACHE_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                data = cache.get(key)
+                if data is not None:
+                    return data
+            return compute()
+
+        try:
+            data = compute()
+            cache.set(key, data, timeout=settings.COMMENT_LIST_CACHE_TIMEOUT)
+            cache.set(stale_key, data, timeout=settings.COMMENT_LIST_CACHE_STALE_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+        return data
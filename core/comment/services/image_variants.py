@@ -0,0 +1,94 @@
+import base64
+import posixpath
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageFilter, features
+
+EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+    'AVIF': 'avif',
+}
+
+PLACEHOLDER_WIDTH = 16
+
+
+def variant_formats(original_format):
+    formats = [original_format]
+    for extra in settings.ATTACHMENT_VARIANT_FORMATS:
+        extra = extra.upper()
+        if extra != original_format and features.check(extra.lower()):
+            formats.append(extra)
+    return formats
+
+
+def encode(img, fmt):
+    if fmt == 'JPEG' and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    output = BytesIO()
+    img.save(output, format=fmt)
+    return output.getvalue()
+
+
+def resize_to_width(img, width):
+    height = max(1, round(img.height * width / img.width))
+    return img.resize((width, height), Image.LANCZOS)
+
+
+def delete_variant_files(storage, variants):
+    """Удаляет файлы вариантов, записанные попыткой обработки, которая не завершилась"""
+    for image in (variants or {}).get("images", []):
+        storage.delete(image["name"])
+
+
+def build_image_variants(img, original_format, storage, base_name, original_size=None):
+    """
+    Из одной декодированной картинки строит набор размеров (ATTACHMENT_VARIANT_WIDTHS)
+    в исходном кодеке и дополнительных форматах, плюс размытый placeholder.
+    original_size - размеры файла, если img декодирована в уменьшенном масштабе (draft).
+    Возвращает описание для CommentAttachment.variants.
+    Если сохранить все варианты не удалось, уже записанные файлы удаляются.
+    """
+    if img.mode == 'P':
+        img = img.convert('RGBA')
+
+    widths = [width for width in settings.ATTACHMENT_VARIANT_WIDTHS if width < img.width]
+    if not widths:
+        widths = [img.width]
+
+    stem = posixpath.splitext(base_name)[0]
+    formats = variant_formats(original_format)
+
+    images = []
+    # от большего к меньшему: каждый следующий размер режется из предыдущего, а не из оригинала
+    source = img
+    try:
+        for width in sorted(widths, reverse=True):
+            resized = source if width == source.width else resize_to_width(source, width)
+            for fmt in formats:
+                name = storage.save(f"{stem}_{width}w.{EXTENSIONS[fmt]}", ContentFile(encode(resized, fmt)))
+                images.append({
+                    "width": resized.width,
+                    "height": resized.height,
+                    "format": fmt.lower(),
+                    "name": name,
+                })
+            source = resized
+    except Exception:
+        delete_variant_files(storage, {"images": images})
+        raise
+
+    placeholder = resize_to_width(source, min(PLACEHOLDER_WIDTH, source.width)).filter(ImageFilter.GaussianBlur(1))
+    placeholder_bytes = encode(placeholder.convert('RGB'), 'WEBP' if features.check('webp') else 'JPEG')
+    placeholder_mime = 'image/webp' if features.check('webp') else 'image/jpeg'
+
+    width, height = original_size or img.size
+    return {
+        "width": width,
+        "height": height,
+        "placeholder": f"data:{placeholder_mime};base64,{base64.b64encode(placeholder_bytes).decode('ascii')}",
+        "images": images,
+    }
@@ -0,0 +1,276 @@
+from django.conf import settings
+from django_redis import get_redis_connection
+
+redis = get_redis_connection("default")
+
+
+class SetLikesStorage:
+    """
+    SET id пользователей + отдельный ключ-счетчик на комментарий.
+    Пока лайков меньше set-max-intset-entries (512), SET хранится как intset
+    (несколько байт на лайк), дальше превращается в hashtable с десятками байт на лайк.
+    """
+    name = "set"
+
+    # SADD/SREM и счетчик меняются одним атомарным вызовом на стороне Redis.
+    # Счетчик трогаем только если он уже в кеше: холодный ключ лениво
+    # заполнится из БД в likes_count, иначе INCR начнет отсчет с нуля.
+    # Если передан KEYS[3], действие дописывается в очередь write-behind.
+    like_script = redis.register_script("""
+local added = redis.call('SADD', KEYS[1], ARGV[1])
+if added == 1 and redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('INCR', KEYS[2])
+end
+if KEYS[3] then
+    redis.call('HSET', KEYS[3], ARGV[2], '1')
+end
+return added
+""")
+
+    unlike_script = redis.register_script("""
+local removed = redis.call('SREM', KEYS[1], ARGV[1])
+if removed == 1 and redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('DECR', KEYS[2])
+end
+if KEYS[3] then
+    redis.call('HSET', KEYS[3], ARGV[2], '0')
+end
+return removed
+""")
+
+    # счетчик прогреваемого комментария выставляется по SCARD уже заполненного SET
+    fill_count_script = redis.register_script("""
+redis.call('SET', KEYS[2], redis.call('SCARD', KEYS[1]))
+""")
+
+    fill_chunk = 1000
+
+    def members_key(self, comment_id):
+        return f"comment:{comment_id}:likes"
+
+    def count_key(self, comment_id):
+        return f"comment:{comment_id}:likes_count"
+
+    def _script_args(self, comment_id, user_id, pending_key):
+        keys = [self.members_key(comment_id), self.count_key(comment_id)]
+        args = [str(user_id)]
+        if pending_key:
+            keys.append(pending_key)
+            args.append(f"{comment_id}:{user_id}")
+        return keys, args
+
+    def like(self, comment_id, user_id, pending_key=None, client=None):
+        keys, args = self._script_args(comment_id, user_id, pending_key)
+        return self.like_script(keys=keys, args=args, client=client)
+
+    def unlike(self, comment_id, user_id, pending_key=None, client=None):
+        keys, args = self._script_args(comment_id, user_id, pending_key)
+        return self.unlike_script(keys=keys, args=args, client=client)
+
+    def queue_cardinality(self, pipe, comment_id):
+        pipe.scard(self.members_key(comment_id))
+
+    def get_counts(self, comment_ids):
+        """Сырые значения счетчиков в порядке comment_ids, None - промах"""
+        return redis.mget([self.count_key(comment_id) for comment_id in comment_ids])
+
+    def queue_set_count(self, pipe, comment_id, count):
+        pipe.set(self.count_key(comment_id), count)
+
+    def queue_drop_count(self, pipe, comment_id):
+        pipe.delete(self.count_key(comment_id))
+
+    def queue_fill(self, pipe, comment_id, user_ids):
+        """Добавляет лайкнувших и выставляет счетчик по фактическому размеру"""
+        key = self.members_key(comment_id)
+        for start in range(0, len(user_ids), self.fill_chunk):
+            pipe.sadd(key, *user_ids[start:start + self.fill_chunk])
+        self._queue_fill_count(pipe, comment_id)
+
+    def _queue_fill_count(self, pipe, comment_id):
+        self.fill_count_script(keys=[self.members_key(comment_id), self.count_key(comment_id)], client=pipe)
+
+    def keys(self, comment_ids):
+        keys = []
+        for comment_id in comment_ids:
+            keys += [self.members_key(comment_id), self.count_key(comment_id)]
+        return keys
+
+    def delete(self, comment_ids):
+        keys = self.keys(comment_ids)
+        if keys:
+            redis.delete(*keys)
+
+
+# переводит SET лайков в битовую карту и удаляет SET
+PROMOTE_LUA = """
+local function promote(set_key, bits_key)
+    for _, member in ipairs(redis.call('SMEMBERS', set_key)) do
+        redis.call('SETBIT', bits_key, member, 1)
+    end
+    redis.call('DEL', set_key)
+end
+"""
+
+
+class BitmapLikesStorage(SetLikesStorage):
+    """
+    Контейнер выбирается по размеру, как в Roaring bitmap: пока лайков меньше
+    COMMENT_LIKES_BITMAP_THRESHOLD, это обычный SET (intset, несколько байт на лайк),
+    дальше он атомарно переводится в битовую карту по id пользователя
+    (max(id) / 8 байт независимо от числа лайков).
+    Счетчики лежат в общих hash-бакетах по COUNT_BUCKET комментариев в компактной
+    listpack-кодировке, так что на комментарий приходится ~1 ключ вместо 2.
+    """
+    name = "bitmap"
+
+    # не больше hash-max-listpack-entries (128 по умолчанию)
+    COUNT_BUCKET = 100
+
+    # KEYS: SET, битовая карта, бакет счетчиков, [очередь write-behind]
+    # ARGV: id пользователя, id комментария, порог перевода в карту, [поле write-behind]
+    like_script = redis.register_script(PROMOTE_LUA + """
+local added
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    added = 1 - redis.call('SETBIT', KEYS[2], ARGV[1], 1)
+else
+    added = redis.call('SADD', KEYS[1], ARGV[1])
+    if added == 1 and redis.call('SCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+        promote(KEYS[1], KEYS[2])
+    end
+end
+if added == 1 and redis.call('HEXISTS', KEYS[3], ARGV[2]) == 1 then
+    redis.call('HINCRBY', KEYS[3], ARGV[2], 1)
+end
+if KEYS[4] then
+    redis.call('HSET', KEYS[4], ARGV[4], '1')
+end
+return added
+""")
+
+    unlike_script = redis.register_script("""
+local removed
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    removed = redis.call('SETBIT', KEYS[2], ARGV[1], 0)
+else
+    removed = redis.call('SREM', KEYS[1], ARGV[1])
+end
+if removed == 1 and redis.call('HEXISTS', KEYS[3], ARGV[2]) == 1 then
+    redis.call('HINCRBY', KEYS[3], ARGV[2], -1)
+end
+if KEYS[4] then
+    redis.call('HSET', KEYS[4], ARGV[4], '0')
+end
+return removed
+""")
+
+    cardinality_script = redis.register_script("""
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return redis.call('BITCOUNT', KEYS[2])
+end
+return redis.call('SCARD', KEYS[1])
+""")
+
+    # после прогрева: доводит контейнер до нужного вида и выставляет счетчик
+    fill_count_script = redis.register_script(PROMOTE_LUA + """
+local has_bits = redis.call('EXISTS', KEYS[2]) == 1
+if (has_bits and redis.call('EXISTS', KEYS[1]) == 1)
+        or redis.call('SCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+    promote(KEYS[1], KEYS[2])
+    has_bits = true
+end
+local count
+if has_bits then
+    count = redis.call('BITCOUNT', KEYS[2])
+else
+    count = redis.call('SCARD', KEYS[1])
+end
+redis.call('HSET', KEYS[3], ARGV[1], count)
+""")
+
+    @property
+    def threshold(self):
+        return settings.COMMENT_LIKES_BITMAP_THRESHOLD
+
+    def bits_key(self, comment_id):
+        return f"comment:{comment_id}:likes:bits"
+
+    def count_key(self, comment_id):
+        return f"comment:likes:counts:{comment_id // self.COUNT_BUCKET}"
+
+    def _container_keys(self, comment_id):
+        return [self.members_key(comment_id), self.bits_key(comment_id), self.count_key(comment_id)]
+
+    def _script_args(self, comment_id, user_id, pending_key):
+        keys = self._container_keys(comment_id)
+        args = [int(user_id), comment_id, self.threshold]
+        if pending_key:
+            keys.append(pending_key)
+            args.append(f"{comment_id}:{user_id}")
+        return keys, args
+
+    def queue_cardinality(self, pipe, comment_id):
+        self.cardinality_script(keys=self._container_keys(comment_id)[:2], client=pipe)
+
+    def get_counts(self, comment_ids):
+        buckets = {}
+        for comment_id in comment_ids:
+            buckets.setdefault(self.count_key(comment_id), []).append(comment_id)
+
+        pipe = redis.pipeline(transaction=False)
+        for key, bucket_ids in buckets.items():
+            pipe.hmget(key, bucket_ids)
+
+        values = {}
+        for bucket_ids, bucket_values in zip(buckets.values(), pipe.execute()):
+            values.update(zip(bucket_ids, bucket_values))
+        return [values[comment_id] for comment_id in comment_ids]
+
+    def queue_set_count(self, pipe, comment_id, count):
+        pipe.hset(self.count_key(comment_id), comment_id, count)
+
+    def queue_drop_count(self, pipe, comment_id):
+        pipe.hdel(self.count_key(comment_id), comment_id)
+
+    def queue_fill(self, pipe, comment_id, user_ids):
+        if len(user_ids) < self.threshold:
+            super().queue_fill(pipe, comment_id, user_ids)
+            return
+
+        # большие комментарии сразу пишутся в карту через BITFIELD, без промежуточного SET
+        key = self.bits_key(comment_id)
+        for start in range(0, len(user_ids), self.fill_chunk):
+            ops = []
+            for user_id in user_ids[start:start + self.fill_chunk]:
+                ops += ["SET", "u1", int(user_id), 1]
+            pipe.execute_command("BITFIELD", key, *ops)
+        self._queue_fill_count(pipe, comment_id)
+
+    def _queue_fill_count(self, pipe, comment_id):
+        self.fill_count_script(keys=self._container_keys(comment_id), args=[comment_id, self.threshold], client=pipe)
+
+    def keys(self, comment_ids):
+        keys = []
+        for comment_id in comment_ids:
+            keys += [self.members_key(comment_id), self.bits_key(comment_id)]
+        return keys + sorted({self.count_key(comment_id) for comment_id in comment_ids})
+
+    def delete(self, comment_ids):
+        if not comment_ids:
+            return
+        pipe = redis.pipeline(transaction=False)
+        pipe.delete(*[key for comment_id in comment_ids for key in self._container_keys(comment_id)[:2]])
+        for comment_id in comment_ids:
+            pipe.hdel(self.count_key(comment_id), comment_id)
+        pipe.execute()
+
+
+LIKES_STORAGES = {
+    storage.name: storage
+    for storage in (SetLikesStorage(), BitmapLikesStorage())
+}
+
+
+def get_likes_storage(name=None):
+    """Текущий бэкенд хранения лайков (settings.COMMENT_LIKES_STORAGE)"""
+    return LIKES_STORAGES[name or settings.COMMENT_LIKES_STORAGE]
@@ -0,0 +1,84 @@
+import threading
+import boto3
+from botocore.config import Config
+from django.conf import settings
+from django.db import transaction
+
+# delete_objects принимает не больше 1000 ключей за вызов
+DELETE_BATCH_SIZE = 1000
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_s3_client():
+    """Один клиент boto3 на процесс (клиенты потокобезопасны и держат пул соединений)"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = boto3.client(
+                    "s3",
+                    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                    region_name=settings.AWS_S3_REGION_NAME,
+                    config=Config(
+                        max_pool_connections=settings.AWS_S3_MAX_POOL_CONNECTIONS,
+                        retries={"max_attempts": 5, "mode": "standard"},
+                    ),
+                )
+    return _client
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class S3DeletionQueue:
+    """
+    Копит ключи файлов удаляемых вложений в рамках транзакции и после коммита
+    отправляет их в celery пачками по DELETE_BATCH_SIZE.
+    При откате транзакции Django выбрасывает on_commit колбэк, и накопленные
+    ключи отбрасываются при следующем add(). Откат вложенного savepoint'а колбэк
+    не трогает, поэтому flush пропускает вложения, строки которых остались в БД.
+    """
+
+    _local = threading.local()
+
+    @classmethod
+    def add(cls, attachment_id, keys):
+        keys = [key for key in keys if key]
+        if not keys:
+            return
+
+        pending = getattr(cls._local, "pending", None)
+        if pending is not None and cls._flush_scheduled():
+            pending[attachment_id] = keys
+            return
+
+        cls._local.pending = {attachment_id: keys}
+        transaction.on_commit(cls.flush)
+
+    @classmethod
+    def _flush_scheduled(cls):
+        connection = transaction.get_connection()
+        return connection.in_atomic_block and any(
+            func == cls.flush for _, func, _ in connection.run_on_commit
+        )
+
+    @classmethod
+    def flush(cls):
+        from core.comment.celery_tasks.tasks import delete_s3_objects
+        from core.comment.models import CommentAttachment
+
+        pending = getattr(cls._local, "pending", None) or {}
+        cls._local.pending = None
+
+        restored = set()
+        for ids in chunked(list(pending), DELETE_BATCH_SIZE):
+            restored.update(CommentAttachment.objects.filter(id__in=ids).values_list("id", flat=True))
+
+        keys = [key for attachment_id, keys in pending.items() if attachment_id not in restored for key in keys]
+        for batch in chunked(keys, DELETE_BATCH_SIZE):
+            delete_s3_objects.delay(batch)
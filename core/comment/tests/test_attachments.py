@@ -0,0 +1,310 @@
+import io
+import pytest
+from datetime import timedelta
+from types import SimpleNamespace
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+from PIL import Image
+from rest_framework import status
+from core.fixtures.user import user_fixture
+from core.fixtures.comment import comment_fixture
+from core.comment.models import Comment, CommentAttachment
+from core.comment.celery_tasks.tasks import process_comment_image, sweep_orphaned_attachments
+from core.comment.serializers import CommentAttachmentSerializer
+from core.comment.services.comment_list_cache import CommentListCache
+
+
+def create_image(width=200, height=150, fmt="PNG"):
+    img = Image.new("RGB", (width, height), "blue")
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt)
+    buffer.name = f"test.{fmt.lower()}"
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.fixture
+def local_storage(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.STORAGES = {
+        **settings.STORAGES,
+        "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    }
+    return tmp_path
+
+
+@pytest.mark.django_db
+class TestCommentAttachments:
+    endpoint = "/api/comments/"
+
+    def test_image_is_stored_raw_and_queued(self, client, user_fixture, local_storage,
+                                            django_capture_on_commit_callbacks):
+        client.force_authenticate(user=user_fixture)
+
+        with django_capture_on_commit_callbacks() as callbacks:
+            response = client.post(self.endpoint, {
+                "text": "Comment with image.",
+                "files": [create_image(1200, 900, "JPEG")],
+            }, format="multipart")
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data["attachments"][0]["status"] == CommentAttachment.STATUS_PENDING
+        queued = [c for c in callbacks if getattr(c, "func", None) == process_comment_image.delay]
+        assert len(queued) == 1
+
+    def test_process_comment_image(self, comment_fixture, local_storage, monkeypatch):
+        attachment = CommentAttachment(comment=comment_fixture, status=CommentAttachment.STATUS_PENDING)
+        attachment.file.save("big.jpg", ContentFile(create_image(1200, 900, "JPEG").read()))
+        raw_name = attachment.file.name
+        invalidations = []
+        monkeypatch.setattr(CommentListCache, "invalidate", lambda: invalidations.append(True))
+
+        process_comment_image(attachment.id)
+
+        # анонимная лента перестает отдавать pending и ссылку на исходник
+        assert invalidations
+
+        attachment.refresh_from_db()
+        assert attachment.status == CommentAttachment.STATUS_READY
+        assert not attachment.file.storage.exists(raw_name)
+        with attachment.file.open("rb") as f:
+            img = Image.open(f)
+            assert img.format == "JPEG"
+            assert img.width <= 320 and img.height <= 240
+
+        images = attachment.variants["images"]
+        assert {image["width"] for image in images} == {160, 320, 640}
+        assert {"jpeg", "webp"} <= {image["format"] for image in images}
+        assert all(attachment.file.storage.exists(image["name"]) for image in images)
+        assert attachment.variants["placeholder"].startswith("data:image/")
+
+        data = CommentAttachmentSerializer(attachment).data
+        assert data["srcset"]["webp"].count("w,") == 2
+        assert data["width"] == 1200
+
+    def test_process_invalid_image(self, comment_fixture, local_storage, monkeypatch):
+        attachment = CommentAttachment(comment=comment_fixture, status=CommentAttachment.STATUS_PENDING)
+        attachment.file.save("broken.png", ContentFile(b"not an image"))
+        invalidations = []
+        monkeypatch.setattr(CommentListCache, "invalidate", lambda: invalidations.append(True))
+
+        process_comment_image(attachment.id)
+
+        attachment.refresh_from_db()
+        assert attachment.status == CommentAttachment.STATUS_FAILED
+        assert invalidations
+
+
+    def test_variants_keep_original_dimensions(self, comment_fixture, local_storage):
+        attachment = CommentAttachment(comment=comment_fixture, status=CommentAttachment.STATUS_PENDING)
+        # 2000px JPEG декодируется в масштабе 1/2
+        attachment.file.save("huge.jpg", ContentFile(create_image(2000, 1500, "JPEG").read()))
+
+        process_comment_image(attachment.id)
+
+        attachment.refresh_from_db()
+        assert (attachment.variants["width"], attachment.variants["height"]) == (2000, 1500)
+
+    def test_storage_failure_after_last_retry(self, comment_fixture, local_storage, monkeypatch):
+        attachment = CommentAttachment(comment=comment_fixture, status=CommentAttachment.STATUS_PENDING)
+        attachment.file.save("big.jpg", ContentFile(create_image(1200, 900, "JPEG").read()))
+        raw_name = attachment.file.name
+
+        def fail(*args, **kwargs):
+            raise OSError("storage is down")
+
+        monkeypatch.setattr(FieldFile, "save", fail)
+        process_comment_image.apply(args=(attachment.id,), retries=process_comment_image.max_retries)
+
+        attachment.refresh_from_db()
+        assert attachment.status == CommentAttachment.STATUS_FAILED
+        # варианты неудачной попытки удалены, исходный файл на месте
+        files = [path for path in local_storage.rglob("*") if path.is_file()]
+        assert [path.relative_to(local_storage).as_posix() for path in files] == [raw_name]
+
+
+@pytest.mark.django_db
+class TestAttachmentUploadHandler:
+    endpoint = "/api/comments/"
+
+    def post_files(self, client, *files):
+        return client.post(self.endpoint, {"text": "Comment with files.", "files": list(files)}, format="multipart")
+
+    def test_rejects_oversized_image_dimensions(self, client, user_fixture, settings, local_storage):
+        settings.ATTACHMENT_MAX_DECODE_BYTES = 4 * 100 * 100
+        client.force_authenticate(user=user_fixture)
+
+        response = self.post_files(client, create_image(200, 150, "PNG"))
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "dimensions" in str(response.data["files"])
+        assert not CommentAttachment.objects.exists()
+
+    def test_rejects_content_not_matching_type(self, client, user_fixture, local_storage):
+        client.force_authenticate(user=user_fixture)
+        fake = io.BytesIO(b"definitely not a png")
+        fake.name = "fake.png"
+
+        response = self.post_files(client, fake)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_rejects_large_text_file_while_streaming(self, client, user_fixture, local_storage):
+        client.force_authenticate(user=user_fixture)
+        text = io.BytesIO(b"a" * (200 * 1024))
+        text.name = "big.txt"
+
+        response = self.post_files(client, text)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "too large" in str(response.data["files"])
+
+    def test_accepts_valid_files(self, client, user_fixture, local_storage):
+        client.force_authenticate(user=user_fixture)
+        text = io.BytesIO(b"hello")
+        text.name = "hello.txt"
+
+        response = self.post_files(client, create_image(200, 150, "GIF"), text)
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert len(response.data["attachments"]) == 2
+
+
+@pytest.mark.django_db
+class TestTransactionalAttachmentCreate:
+    endpoint = "/api/comments/"
+
+    def stored_files(self, root):
+        return [path for path in root.rglob("*") if path.is_file()]
+
+    def test_uploads_are_removed_when_create_fails(self, client, user_fixture, local_storage, monkeypatch):
+        client.force_authenticate(user=user_fixture)
+
+        def fail(*args, **kwargs):
+            raise RuntimeError("database is gone")
+
+        monkeypatch.setattr(CommentAttachment.objects, "bulk_create", fail)
+        text = io.BytesIO(b"hello")
+        text.name = "hello.txt"
+
+        with pytest.raises(RuntimeError):
+            client.post(self.endpoint, {
+                "text": "Comment with files.",
+                "files": [create_image(200, 150, "PNG"), create_image(200, 150, "JPEG"), text],
+            }, format="multipart")
+
+        assert not Comment.objects.exists()
+        assert self.stored_files(local_storage) == []
+
+    def test_invalid_file_prevents_any_write(self, client, user_fixture, local_storage):
+        client.force_authenticate(user=user_fixture)
+        text = io.BytesIO(b"hello")
+        text.name = "hello.txt"
+        broken = io.BytesIO(b"\x89PNG\r\n\x1a\n not really")
+        broken.name = "broken.png"
+
+        response = client.post(self.endpoint, {
+            "text": "Comment with files.",
+            "files": [create_image(200, 150, "PNG"), text, broken],
+        }, format="multipart")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not Comment.objects.exists()
+        assert self.stored_files(local_storage) == []
+
+
+@pytest.mark.django_db
+class TestAttachmentFileDeletion:
+
+    def test_deleted_files_are_batched_after_commit(self, user_fixture, monkeypatch,
+                                                    django_capture_on_commit_callbacks):
+        batches = []
+        monkeypatch.setattr("core.comment.celery_tasks.tasks.delete_s3_objects.delay", batches.append)
+
+        comments = [Comment.objects.create(author=user_fixture, text=f"Comment {i}") for i in range(3)]
+        for comment in comments:
+            CommentAttachment.objects.create(
+                comment=comment,
+                file=f"comment_attachments/{comment.id}.png",
+                variants={"images": [{"name": f"comment_attachments/{comment.id}_160w.webp"}]},
+            )
+
+        with django_capture_on_commit_callbacks(execute=True):
+            user_fixture.delete()
+            assert batches == []
+
+        assert len(batches) == 1
+        assert len(batches[0]) == 6
+
+    def test_rolled_back_deletes_are_dropped(self, user_fixture, monkeypatch,
+                                             django_capture_on_commit_callbacks):
+        batches = []
+        monkeypatch.setattr("core.comment.celery_tasks.tasks.delete_s3_objects.delay", batches.append)
+        comment = Comment.objects.create(author=user_fixture, text="Comment")
+        CommentAttachment.objects.create(comment=comment, file="comment_attachments/kept.png")
+
+        with pytest.raises(RuntimeError):
+            with transaction.atomic():
+                comment.delete()
+                raise RuntimeError("rollback")
+
+        other = Comment.objects.create(author=user_fixture, text="Other")
+        CommentAttachment.objects.create(comment=other, file="comment_attachments/deleted.png")
+        with django_capture_on_commit_callbacks(execute=True):
+            other.delete()
+
+        assert batches == [["comment_attachments/deleted.png"]]
+
+    def test_keys_of_rolled_back_savepoint_are_kept(self, user_fixture, monkeypatch,
+                                                    django_capture_on_commit_callbacks):
+        batches = []
+        monkeypatch.setattr("core.comment.celery_tasks.tasks.delete_s3_objects.delay", batches.append)
+        deleted = Comment.objects.create(author=user_fixture, text="Deleted")
+        CommentAttachment.objects.create(comment=deleted, file="comment_attachments/deleted.png")
+        kept = Comment.objects.create(author=user_fixture, text="Kept")
+        CommentAttachment.objects.create(comment=kept, file="comment_attachments/kept.png")
+
+        with django_capture_on_commit_callbacks(execute=True):
+            with transaction.atomic():
+                deleted.delete()
+                with pytest.raises(RuntimeError):
+                    with transaction.atomic():
+                        kept.delete()
+                        raise RuntimeError("rollback")
+
+        assert batches == [["comment_attachments/deleted.png"]]
+
+    def test_sweep_deletes_only_unreferenced_keys(self, comment_fixture, monkeypatch):
+        old = timezone.now() - timedelta(days=1)
+        keys = [
+            "comment_attachments/2026/01/01/a.jpg",
+            "comment_attachments/2026/01/01/a_320w.webp",
+            "comment_attachments/2026/01/01/lost.jpg",
+            "comment_attachments/2026/01/01/lost_320w.webp",
+        ]
+        page = {"Contents": [{"Key": key, "LastModified": old} for key in keys]}
+        client = SimpleNamespace(get_paginator=lambda name: SimpleNamespace(paginate=lambda **kwargs: [page]))
+        monkeypatch.setattr("core.comment.celery_tasks.tasks.get_s3_client", lambda: client)
+        batches = []
+        monkeypatch.setattr("core.comment.celery_tasks.tasks.delete_s3_objects.delay", batches.append)
+        # обработано на следующий день: уменьшенный файл в другом каталоге, варианты - в каталоге исходника
+        CommentAttachment.objects.create(
+            comment=comment_fixture,
+            file="comment_attachments/2026/01/02/a.jpg",
+            variants={"images": [{"name": "comment_attachments/2026/01/01/a_320w.webp"}]},
+        )
+        # вне окна ATTACHMENT_VARIANT_DIR_LAG_DAYS строки не читаются
+        CommentAttachment.objects.create(
+            comment=comment_fixture,
+            file="comment_attachments/2026/03/01/b.jpg",
+            variants={"images": [{"name": "comment_attachments/2026/01/01/lost_320w.webp"}]},
+        )
+
+        assert sweep_orphaned_attachments() == 3
+        assert batches == [[
+            "comment_attachments/2026/01/01/a.jpg",
+            "comment_attachments/2026/01/01/lost.jpg",
+            "comment_attachments/2026/01/01/lost_320w.webp",
+        ]]
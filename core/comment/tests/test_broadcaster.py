@@ -0,0 +1,61 @@
+import time
+import pytest
+from prometheus_client import REGISTRY, generate_latest
+from core.auth.services.captcha_pool import CaptchaPoolCollector
+from core.comment.services.broadcaster import CommentBroadcaster, PUBLISHED, QUEUE_DEPTH
+from core.metrics import metrics_registry, shared_collectors
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.mark.django_db
+class TestCommentBroadcaster:
+
+    def test_publish_waits_for_commit(self, django_capture_on_commit_callbacks):
+        published = PUBLISHED._value.get()
+
+        with django_capture_on_commit_callbacks() as callbacks:
+            CommentBroadcaster.publish("comments_list", {"type": "comment_created", "payload": "{}"})
+
+        assert len(callbacks) == 1
+        assert PUBLISHED._value.get() == published
+
+    def test_publish_sends_in_background(self, django_capture_on_commit_callbacks):
+        published = PUBLISHED._value.get()
+
+        with django_capture_on_commit_callbacks(execute=True):
+            for _ in range(3):
+                CommentBroadcaster.publish("comments_list", {"type": "comment_created", "payload": "{}"})
+
+        assert wait_for(lambda: PUBLISHED._value.get() == published + 3)
+        assert QUEUE_DEPTH._value.get() == 0
+
+
+class TestMetricsEndpoint:
+
+    def test_metrics_require_token_or_allowed_ip(self, client, settings):
+        settings.METRICS_TOKEN = ""
+        settings.METRICS_ALLOWED_IPS = ["127.0.0.1"]
+        response = client.get("/metrics/")
+        assert response.status_code == 200
+        assert b"comment_broadcast_published_total" in response.content
+        assert client.get("/metrics/", REMOTE_ADDR="10.0.0.5").status_code == 403
+
+        settings.METRICS_TOKEN = "secret"
+        assert client.get("/metrics/").status_code == 403
+        assert client.get("/metrics/", HTTP_AUTHORIZATION="Bearer secret").status_code == 200
+
+    def test_multiprocess_registry(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+        registry = metrics_registry()
+        assert registry is not REGISTRY
+        # общие коллекторы (из Redis) есть и в сводном реестре
+        assert any(isinstance(collector, CaptchaPoolCollector) for collector in shared_collectors)
+        assert b"captcha_pool_depth" in generate_latest(registry)
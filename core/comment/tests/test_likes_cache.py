@@ -0,0 +1,321 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from core.fixtures.user import user_fixture
+from core.fixtures.comment import comment_fixture
+from core.comment.models import Comment
+from django.core.management import call_command
+from core.comment.celery_tasks.tasks import flush_comment_likes, get_warmup_progress, warm_comment_likes
+from core.comment.services.comment_likes_cache import (
+    FLUSHING_KEY, PENDING_KEY, USER_LIKED_KEY, WARMING_KEY, CommentLikesCache, redis,
+)
+from core.comment.services.likes_storage import LIKES_STORAGES
+from core.user.models import User
+
+
+def clear_likes_keys(*comments):
+    for comment in comments:
+        redis.delete(f"comment:{comment.id}:likes", f"comment:{comment.id}:likes_count")
+
+
+@pytest.mark.django_db
+class TestCommentLikesCache:
+
+    def test_bulk_likes_count_fills_misses_from_db(self, user_fixture, comment_fixture):
+        other = Comment.objects.create(author=user_fixture, text="Other comment.")
+        clear_likes_keys(comment_fixture, other)
+        user_fixture.comments_liked.add(comment_fixture)
+
+        counts = CommentLikesCache.bulk_likes_count([comment_fixture.id, other.id])
+
+        assert counts == {comment_fixture.id: 1, other.id: 0}
+        assert int(redis.get(f"comment:{comment_fixture.id}:likes_count")) == 1
+        assert int(redis.get(f"comment:{other.id}:likes_count")) == 0
+
+    def test_bulk_has_liked(self, user_fixture, comment_fixture):
+        other = Comment.objects.create(author=user_fixture, text="Other comment.")
+        clear_likes_keys(comment_fixture, other)
+        user_fixture.like(comment_fixture)
+
+        liked = CommentLikesCache.bulk_has_liked([comment_fixture.id, other.id], user_fixture.id)
+
+        assert liked == {comment_fixture.id: True, other.id: False}
+
+    def test_like_is_idempotent(self, user_fixture, comment_fixture):
+        clear_likes_keys(comment_fixture)
+        redis.set(f"comment:{comment_fixture.id}:likes_count", 0)
+
+        assert CommentLikesCache.like(comment_fixture.id, user_fixture.id)
+        assert not CommentLikesCache.like(comment_fixture.id, user_fixture.id)
+        assert CommentLikesCache.likes_count(comment_fixture.id) == 1
+
+        assert CommentLikesCache.unlike(comment_fixture.id, user_fixture.id)
+        assert not CommentLikesCache.unlike(comment_fixture.id, user_fixture.id)
+        assert CommentLikesCache.likes_count(comment_fixture.id) == 0
+
+    def test_reconcile_fixes_drifted_counter(self, user_fixture, comment_fixture):
+        clear_likes_keys(comment_fixture)
+        user_fixture.comments_liked.add(comment_fixture)
+        redis.set(f"comment:{comment_fixture.id}:likes_count", 5)
+
+        drifted = CommentLikesCache.reconcile([comment_fixture.id], source="db")
+
+        assert drifted == [comment_fixture.id]
+        assert CommentLikesCache.likes_count(comment_fixture.id) == 1
+
+
+@pytest.mark.django_db
+class TestWriteBehindLikes:
+
+    @pytest.fixture(autouse=True)
+    def write_behind(self, settings):
+        settings.COMMENT_LIKES_WRITE_BEHIND = True
+        redis.delete(PENDING_KEY, FLUSHING_KEY)
+        # в write-behind источник истины - Redis, поэтому кеш должен быть прогрет
+        redis.set(CommentLikesCache.warm_key(), 1)
+        yield
+        redis.delete(PENDING_KEY, FLUSHING_KEY, CommentLikesCache.warm_key())
+
+    def test_like_touches_only_redis_until_flush(self, user_fixture, comment_fixture,
+                                                 django_assert_num_queries):
+        clear_likes_keys(comment_fixture)
+        with django_assert_num_queries(0):
+            user_fixture.like(comment_fixture)
+        assert user_fixture.has_liked(comment_fixture)
+        assert not comment_fixture.liked_by.exists()
+
+        assert flush_comment_likes() == 1
+
+        comment_fixture.refresh_from_db()
+        assert list(comment_fixture.liked_by.all()) == [user_fixture]
+        assert comment_fixture.likes_count == 1
+        assert not redis.exists(PENDING_KEY, FLUSHING_KEY)
+
+    def test_last_action_wins(self, user_fixture, comment_fixture):
+        other = User.objects.create_user(username="other", email="other@example.com", password="testpassword")
+        user_fixture.comments_liked.add(comment_fixture)
+        clear_likes_keys(comment_fixture)
+
+        user_fixture.unlike(comment_fixture)
+        other.like(comment_fixture)
+        other.unlike(comment_fixture)
+        other.like(comment_fixture)
+        flush_comment_likes()
+
+        comment_fixture.refresh_from_db()
+        assert list(comment_fixture.liked_by.all()) == [other]
+        assert comment_fixture.likes_count == 1
+
+    def test_flush_corrects_counter_read_before_flush(self, user_fixture, comment_fixture):
+        clear_likes_keys(comment_fixture)
+        user_fixture.like(comment_fixture)
+        # счетчика не было, лайк его не тронул; чтение до сброса берет likes_count без лайка из очереди
+        assert CommentLikesCache.likes_count(comment_fixture.id) == 0
+
+        flush_comment_likes()
+
+        assert CommentLikesCache.likes_count(comment_fixture.id) == 1
+
+    def test_warmup_skips_unlikes_waiting_in_queue(self, user_fixture, comment_fixture):
+        user_fixture.comments_liked.add(comment_fixture)
+        clear_likes_keys(comment_fixture)
+        redis.delete(USER_LIKED_KEY.format(user_id=user_fixture.id))
+        user_fixture.unlike(comment_fixture)
+
+        CommentLikesCache.warmup([comment_fixture.id])
+
+        assert not CommentLikesCache.has_liked(comment_fixture.id, user_fixture.id)
+        assert CommentLikesCache.likes_count(comment_fixture.id) == 0
+
+    def test_flush_skips_deleted_rows_and_retries_unacked_batch(self, user_fixture, comment_fixture):
+        gone = Comment.objects.create(author=user_fixture, text="Deleted before flush.")
+        user_fixture.like(gone)
+        gone.delete()
+        redis.rename(PENDING_KEY, FLUSHING_KEY)
+        user_fixture.like(comment_fixture)
+
+        # сначала дожимается зависшая пачка, затем новая очередь
+        assert flush_comment_likes() == 1
+        assert not comment_fixture.liked_by.exists()
+        assert flush_comment_likes() == 1
+        assert comment_fixture.liked_by.count() == 1
+
+
+@pytest.mark.django_db
+def test_orm_likes_keep_likes_count_column(user_fixture, comment_fixture):
+    with CaptureQueriesContext(connection) as queries:
+        user_fixture.like(comment_fixture)
+    # счетчик сдвигается, а не пересчитывается по всем лайкам комментария
+    assert not any("COUNT(" in query["sql"] for query in queries.captured_queries)
+    comment_fixture.refresh_from_db()
+    assert comment_fixture.likes_count == 1
+
+    # повторный лайк и снятие несуществующего не меняют счетчик
+    user_fixture.comments_liked.add(comment_fixture)
+    other = Comment.objects.create(author=user_fixture, text="Other comment.")
+    user_fixture.comments_liked.remove(other)
+    comment_fixture.refresh_from_db()
+    other.refresh_from_db()
+    assert (comment_fixture.likes_count, other.likes_count) == (1, 0)
+
+    second = User.objects.create_user(username="second", email="second@example.com", password="testpassword")
+    comment_fixture.liked_by.add(second)
+    comment_fixture.liked_by.remove(second, user_fixture)
+    comment_fixture.refresh_from_db()
+    assert comment_fixture.likes_count == 0
+    user_fixture.like(comment_fixture)
+
+    user_fixture.comments_liked.clear()
+    comment_fixture.refresh_from_db()
+    assert comment_fixture.likes_count == 0
+
+
+@pytest.mark.django_db
+class TestLikesCacheWarmup:
+
+    @pytest.fixture(autouse=True)
+    def cold_cache(self):
+        redis.delete(CommentLikesCache.warm_key(), WARMING_KEY)
+        yield
+        redis.delete(CommentLikesCache.warm_key(), WARMING_KEY)
+
+    def test_cold_cache_reads_likes_from_db(self, user_fixture, comment_fixture,
+                                            django_assert_num_queries):
+        other = Comment.objects.create(author=user_fixture, text="Other comment.")
+        user_fixture.comments_liked.add(comment_fixture)
+        clear_likes_keys(comment_fixture, other)
+
+        with django_assert_num_queries(1):
+            liked = CommentLikesCache.bulk_has_liked([comment_fixture.id, other.id], user_fixture.id)
+        assert liked == {comment_fixture.id: True, other.id: False}
+
+    def test_warmup_fills_sets_and_counters(self, user_fixture, comment_fixture,
+                                            django_assert_num_queries):
+        other = Comment.objects.create(author=user_fixture, text="Other comment.")
+        user_fixture.comments_liked.add(comment_fixture)
+        clear_likes_keys(comment_fixture, other)
+        redis.set(f"comment:{other.id}:likes_count", 7)
+
+        assert warm_comment_likes(order="popular") == 2
+        assert get_warmup_progress() == {"status": "done", "order": "popular", "total": 2, "warmed": 2}
+        assert CommentLikesCache.is_warm()
+
+        with django_assert_num_queries(0):
+            liked = CommentLikesCache.bulk_has_liked([comment_fixture.id, other.id], user_fixture.id)
+            counts = CommentLikesCache.bulk_likes_count([comment_fixture.id, other.id])
+        assert liked == {comment_fixture.id: True, other.id: False}
+        assert counts == {comment_fixture.id: 1, other.id: 0}
+
+        # теплый кеш повторно не греется
+        assert warm_comment_likes() == 0
+
+    def test_warmup_covers_comments_beyond_limit(self, user_fixture, comment_fixture):
+        other = Comment.objects.create(author=user_fixture, text="Newer comment.")
+        user_fixture.comments_liked.add(comment_fixture)
+        clear_likes_keys(comment_fixture, other)
+        redis.delete(USER_LIKED_KEY.format(user_id=user_fixture.id))
+
+        assert warm_comment_likes(order="recent", limit=1) == 2
+
+        liked = CommentLikesCache.bulk_has_liked([comment_fixture.id, other.id], user_fixture.id)
+        assert liked == {comment_fixture.id: True, other.id: False}
+
+    def test_flag_of_previous_version_is_not_warm(self, settings):
+        legacy_key = f"comments:likes:warm:{settings.COMMENT_LIKES_STORAGE}"
+        redis.set(legacy_key, 1)
+        try:
+            assert not CommentLikesCache.is_warm()
+        finally:
+            redis.delete(legacy_key)
+
+    def test_command_refuses_concurrent_warmup(self, comment_fixture):
+        CommentLikesCache.start_warming(timeout=60)
+        with pytest.raises(Exception, match="already running"):
+            call_command("warm_comment_likes")
+        assert not CommentLikesCache.is_warm()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("storage", sorted(LIKES_STORAGES))
+def test_storage_backends_behave_the_same(settings, storage, user_fixture, comment_fixture):
+    settings.COMMENT_LIKES_STORAGE = storage
+    other = Comment.objects.create(author=user_fixture, text="Other comment.")
+    ids = [comment_fixture.id, other.id]
+    CommentLikesCache.purge(ids)
+    redis.set(CommentLikesCache.warm_key(), 1)
+
+    try:
+        assert CommentLikesCache.bulk_likes_count(ids) == {comment_fixture.id: 0, other.id: 0}
+        assert CommentLikesCache.like(comment_fixture.id, user_fixture.id)
+        assert not CommentLikesCache.like(comment_fixture.id, user_fixture.id)
+        assert CommentLikesCache.bulk_has_liked(ids, user_fixture.id) == {comment_fixture.id: True, other.id: False}
+        assert CommentLikesCache.bulk_likes_count(ids) == {comment_fixture.id: 1, other.id: 0}
+
+        CommentLikesCache.bulk_unlike(ids, user_fixture.id)
+        assert not CommentLikesCache.has_liked(comment_fixture.id, user_fixture.id)
+        assert CommentLikesCache.likes_count(comment_fixture.id) == 0
+
+        user_fixture.comments_liked.add(other)
+        CommentLikesCache.purge(ids)
+        CommentLikesCache.warmup(ids)
+        assert CommentLikesCache.bulk_has_liked(ids, user_fixture.id) == {comment_fixture.id: False, other.id: True}
+        assert CommentLikesCache.reconcile(ids, source="set") == []
+    finally:
+        CommentLikesCache.purge(ids)
+        redis.delete(CommentLikesCache.warm_key())
+
+
+@pytest.mark.django_db
+def test_bitmap_storage_promotes_large_sets(settings, comment_fixture):
+    settings.COMMENT_LIKES_STORAGE = "bitmap"
+    settings.COMMENT_LIKES_BITMAP_THRESHOLD = 3
+    storage = LIKES_STORAGES["bitmap"]
+    comment_id = comment_fixture.id
+    CommentLikesCache.purge([comment_id])
+    redis.set(CommentLikesCache.warm_key(), 1)
+
+    try:
+        CommentLikesCache.bulk_likes_count([comment_id])
+        for user_id in (5, 7, 1000):
+            assert CommentLikesCache.like(comment_id, user_id)
+
+        assert not redis.exists(storage.members_key(comment_id))
+        assert redis.exists(storage.bits_key(comment_id))
+        assert CommentLikesCache.has_liked(comment_id, 1000)
+        assert not CommentLikesCache.has_liked(comment_id, 6)
+        assert CommentLikesCache.likes_count(comment_id) == 3
+
+        assert CommentLikesCache.unlike(comment_id, 7)
+        assert not CommentLikesCache.unlike(comment_id, 7)
+        assert CommentLikesCache.likes_count(comment_id) == 2
+        assert CommentLikesCache.reconcile([comment_id], source="set") == []
+    finally:
+        CommentLikesCache.purge([comment_id])
+        redis.delete(CommentLikesCache.warm_key())
+
+
+@pytest.mark.django_db
+def test_user_liked_index_answers_has_liked(user_fixture, comment_fixture):
+    other = Comment.objects.create(author=user_fixture, text="Other comment.")
+    index_key = USER_LIKED_KEY.format(user_id=user_fixture.id)
+    clear_likes_keys(comment_fixture, other)
+    redis.delete(index_key)
+    redis.set(CommentLikesCache.warm_key(), 1)
+
+    try:
+        user_fixture.like(comment_fixture)
+        user_fixture.like(other)
+        user_fixture.unlike(other)
+        assert redis.smembers(index_key) == {str(comment_fixture.id).encode()}
+
+        # флаги берутся из обратного индекса, а не из множеств комментариев
+        clear_likes_keys(comment_fixture, other)
+        assert CommentLikesCache.bulk_has_liked([comment_fixture.id, other.id], user_fixture.id) == {
+            comment_fixture.id: True, other.id: False,
+        }
+
+        redis.delete(index_key)
+        CommentLikesCache.warmup([comment_fixture.id, other.id])
+        assert redis.smembers(index_key) == {str(comment_fixture.id).encode()}
+    finally:
+        redis.delete(index_key, CommentLikesCache.warm_key())
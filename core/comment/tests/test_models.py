@@ -2,6 +2,7 @@ import pytest
 from core.comment.models import Comment,CommentAttachment
 from core.fixtures.user import user_fixture
 from core.fixtures.comment import comment_fixture
+from core.user.models import User
 from rest_framework import status
 from PIL import Image as PILImage
 
@@ -76,6 +77,85 @@ class TestCommentViewSet:
         
         
 
+@pytest.mark.django_db
+class TestCommentThreadIndex:
+
+    def test_thread_index_on_create(self, user_fixture, comment_fixture):
+        reply = Comment.objects.create(author=user_fixture, parent=comment_fixture, text="Reply.")
+        nested = Comment.objects.create(author=user_fixture, parent=reply, text="Nested reply.")
+
+        comment_fixture.refresh_from_db()
+        assert comment_fixture.root_id == comment_fixture.id
+        assert comment_fixture.depth == 0
+        assert nested.root_id == comment_fixture.id
+        assert nested.depth == 2
+        assert nested.path == f"{comment_fixture.path}{reply.id:010d}/{nested.id:010d}/"
+
+    def test_get_subtree(self, user_fixture, comment_fixture):
+        reply = Comment.objects.create(author=user_fixture, parent=comment_fixture, text="Reply.")
+        nested = Comment.objects.create(author=user_fixture, parent=reply, text="Nested reply.")
+        Comment.objects.create(author=user_fixture, text="Another thread.")
+
+        assert set(Comment.objects.get_subtree(comment_fixture)) == {reply, nested}
+        assert list(Comment.objects.get_subtree(comment_fixture, max_depth=1)) == [reply]
+
+    def test_replies_tree(self, client, user_fixture, comment_fixture):
+        reply = Comment.objects.create(author=user_fixture, parent=comment_fixture, text="Reply.")
+        Comment.objects.create(author=user_fixture, parent=reply, text="Nested reply.")
+
+        response = client.get(f"/api/comments/{comment_fixture.public_id}/replies/", {"tree": 1})
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data) == 1
+        assert response.data[0]['replies'][0]['text'] == "Nested reply."
+
+        response = client.get(f"/api/comments/{comment_fixture.public_id}/replies/", {"depth": 1})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data[0]['replies'] == []
+
+    def test_tree_skips_replies_under_hidden_parents(self, client, user_fixture, comment_fixture):
+        other = User.objects.create_user(username="other", email="other@example.com", password="testpassword")
+        moderator = User.objects.create_superuser(
+            username="moderator", email="moderator@example.com", password="testpassword"
+        )
+        url = f"/api/comments/{comment_fixture.public_id}/replies/"
+
+        # фоновое удаление автора скрывает только его комментарии, чужие ответы под ними активны
+        reply = Comment.objects.create(author=other, parent=comment_fixture, text="Reply.")
+        Comment.objects.create(author=user_fixture, parent=reply, text="Nested reply.")
+        client.force_authenticate(user=other)
+        response = client.delete(f"/api/users/{other.public_id}/?mode=async")
+        assert response.status_code == status.HTTP_202_ACCEPTED
+
+        client.force_authenticate(user=None)
+        for params in ({"tree": 1}, {"depth": 2}):
+            response = client.get(url, params)
+            assert response.status_code == status.HTTP_200_OK
+            assert response.data == []
+
+        # restore ответа внутри скрытой ветки: его родитель остается скрытым
+        hidden = Comment.objects.create(author=user_fixture, parent=comment_fixture, text="Hidden.")
+        child = Comment.objects.create(author=user_fixture, parent=hidden, text="Child.")
+        client.force_authenticate(user=moderator)
+        client.post(f"/api/comments/{hidden.public_id}/hide/")
+        client.post(f"/api/comments/{child.public_id}/restore/")
+        assert Comment.objects.get(pk=child.pk).active
+
+        client.force_authenticate(user=None)
+        response = client.get(url, {"tree": 1})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == []
+
+    def test_reply_depth_is_limited(self, client, user_fixture, comment_fixture):
+        # path на MAX_DEPTH уровнях должен помещаться в колонку
+        assert (Comment.MAX_DEPTH + 1) * len(Comment.path_segment(comment_fixture.id)) <= Comment._meta.get_field('path').max_length
+        Comment.objects.filter(pk=comment_fixture.pk).update(depth=Comment.MAX_DEPTH)
+        client.force_authenticate(user=user_fixture)
+
+        response = client.post("/api/comments/", {"text": "Too deep.", "parent": comment_fixture.public_id})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "parent" in response.data
+
+
 def create_image(width=200, height=150, fmt="PNG"):
     """Создаёт изображение в памяти."""
     img = Image.new("RGB", (width, height), "blue")
@@ -93,3 +173,24 @@ def create_text(size=50 * 1024):
     buf.seek(0)
     return buf
 
+
+
+@pytest.mark.django_db
+class TestCommentSortColumns:
+
+    def test_sort_columns_on_create(self, user_fixture, comment_fixture):
+        guest_comment = Comment.objects.create(guest_name="guest", guest_email="guest@example.com", text="Hi.")
+
+        assert comment_fixture.sort_name == user_fixture.username
+        assert comment_fixture.sort_email == user_fixture.email
+        assert guest_comment.sort_name == "guest"
+        assert guest_comment.sort_email == "guest@example.com"
+
+    def test_sort_columns_follow_user_changes(self, user_fixture, comment_fixture):
+        user_fixture.username = "renamed"
+        user_fixture.email = "renamed@example.com"
+        user_fixture.save()
+
+        comment_fixture.refresh_from_db()
+        assert comment_fixture.sort_name == "renamed"
+        assert comment_fixture.sort_email == "renamed@example.com"
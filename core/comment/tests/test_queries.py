@@ -0,0 +1,88 @@
+import pytest
+from rest_framework import status
+from core.fixtures.user import user_fixture
+from core.fixtures.comment import comment_fixture
+from core.comment.models import Comment, CommentAttachment
+from core.comment.services.comment_likes_cache import CommentLikesCache
+from core.user.models import User
+
+# Страница комментариев должна грузиться за постоянное число запросов,
+# независимо от количества строк, авторов и вложений.
+MAX_LIST_QUERIES = 5
+MAX_REPLIES_QUERIES = 6
+
+
+def create_comments(parent=None, count=10):
+    comments = []
+    for i in range(count):
+        author = User.objects.create_user(
+            username=f"author{i}-{parent.id if parent else 'root'}",
+            email=f"author{i}-{parent.id if parent else 'root'}@example.com",
+            password="testpassword",
+        )
+        comment = Comment.objects.create(author=author, parent=parent, text=f"Comment {i}")
+        CommentAttachment.objects.create(
+            comment=comment,
+            file=f"comment_attachments/test_{i}.txt",
+            attachment_type="text",
+        )
+        comments.append(comment)
+    return comments
+
+
+@pytest.mark.django_db
+class TestCommentQueries:
+    endpoint = "/api/comments/"
+
+    def test_list_query_count(self, client, user_fixture, django_assert_max_num_queries):
+        create_comments()
+        client.force_authenticate(user=user_fixture)
+
+        with django_assert_max_num_queries(MAX_LIST_QUERIES):
+            response = client.get(self.endpoint, {"sort_by": "username"})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["count"] == 10
+
+    def test_list_anonymous_query_count(self, client, django_assert_max_num_queries):
+        create_comments()
+
+        with django_assert_max_num_queries(MAX_LIST_QUERIES):
+            response = client.get(self.endpoint)
+
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_retrieve_query_count(self, client, comment_fixture, django_assert_max_num_queries):
+        with django_assert_max_num_queries(MAX_LIST_QUERIES):
+            response = client.get(f"{self.endpoint}{comment_fixture.public_id}/")
+
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_replies_query_count(self, client, comment_fixture, django_assert_max_num_queries):
+        create_comments(parent=comment_fixture)
+
+        with django_assert_max_num_queries(MAX_REPLIES_QUERIES):
+            response = client.get(f"{self.endpoint}{comment_fixture.public_id}/replies/")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data) == 10
+
+    def test_replies_tree_loads_viewer_likes_once(self, client, user_fixture, comment_fixture, monkeypatch):
+        replies = create_comments(parent=comment_fixture, count=3)
+        create_comments(parent=replies[0], count=3)
+        user_fixture.like(replies[1])
+
+        calls = []
+        original = CommentLikesCache.bulk_has_liked
+        monkeypatch.setattr(
+            CommentLikesCache, "bulk_has_liked",
+            staticmethod(lambda ids, user_id: calls.append(list(ids)) or original(ids, user_id)),
+        )
+
+        client.force_authenticate(user=user_fixture)
+        response = client.get(f"{self.endpoint}{comment_fixture.public_id}/replies/", {"tree": 1})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert len(calls) == 1 and len(calls[0]) == 6
+        liked = {reply["id"]: reply["liked"] for reply in response.data}
+        assert liked == {reply.public_id.hex: reply == replies[1] for reply in replies}
@@ -1,8 +1,20 @@
+import base64
+import json
+import time
+from django.core.cache import cache
 
 from core.fixtures.user import user_fixture
 from core.fixtures.comment import comment_fixture
+from prometheus_client import REGISTRY
+from core.abstract.object_cache import ObjectCache
+from core.comment.models import Comment
+from core.comment.services.comment_list_cache import CommentListCache
+from core.comment.services.comment_likes_cache import CommentLikesCache, redis
+from core.user.models import User
 import pytest
 from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
 
 class TestCommentViewSet:
     endpoint = "/api"
@@ -82,3 +94,254 @@ class TestCommentViewSet:
     
     
 
+
+
+@pytest.mark.django_db
+class TestCommentCursorPagination:
+    endpoint = "/api/comments/"
+
+    @pytest.mark.parametrize("sort_by", ["username", "email", "created"])
+    @pytest.mark.parametrize("order", ["asc", "desc"])
+    def test_cursor_pages_cover_all_comments(self, client, user_fixture, sort_by, order):
+        for i in range(5):
+            Comment.objects.create(author=user_fixture, text=f"Comment {i}")
+            Comment.objects.create(guest_name=f"guest{i}", guest_email=f"guest{i}@example.com", text=f"Guest {i}")
+
+        params = {"pagination": "cursor", "limit": 3, "sort_by": sort_by, "order": order}
+        response = client.get(self.endpoint, params)
+        seen = []
+        while True:
+            assert response.status_code == status.HTTP_200_OK
+            seen.extend(item["id"] for item in response.data["results"])
+            if not response.data["next"]:
+                break
+            response = client.get(response.data["next"])
+
+        assert len(seen) == 10
+        assert len(set(seen)) == 10
+
+    def test_invalid_cursor(self, client):
+        response = client.get(self.endpoint, {"cursor": "not-a-cursor"})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    @pytest.mark.parametrize("payload, sort_by", [
+        ([{"a": 1}, 1], "username"),
+        (["name", 2 ** 70], "username"),
+        (["name", True], "email"),
+        (["2024-13-45T00:00:00", 1], "created"),
+        ([None, 1], "created"),
+    ])
+    def test_crafted_cursor(self, client, payload, sort_by):
+        cursor = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        response = client.get(self.endpoint, {"cursor": cursor, "sort_by": sort_by})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestCommentListCache:
+    endpoint = "/api/comments/"
+
+    def test_anonymous_list_is_cached_until_change(self, client, user_fixture, comment_fixture,
+                                                   django_assert_num_queries):
+        response = client.get(self.endpoint)
+        assert response.data["count"] == 1
+
+        with django_assert_num_queries(0):
+            response = client.get(self.endpoint)
+        assert response.data["count"] == 1
+
+        author = APIClient()
+        author.force_authenticate(user=user_fixture)
+        response = author.post(self.endpoint, {"text": "Fresh comment."})
+        assert response.status_code == status.HTTP_201_CREATED
+
+        response = client.get(self.endpoint)
+        assert response.data["count"] == 2
+
+    def test_waiters_get_stale_page_or_render(self, settings):
+        settings.COMMENT_LIST_CACHE_WAIT = 0.1
+        request = Request(APIRequestFactory().get(self.endpoint))
+        cache.delete(CommentListCache.stale_key(request))
+
+        assert CommentListCache.get_or_set(request, lambda: {"page": 1}) == {"page": 1}
+        CommentListCache.invalidate()
+        # страницу нового поколения уже считает другой запрос
+        cache.add(f"{CommentListCache.page_key(request)}:lock", 1)
+        assert CommentListCache.get_or_set(request, lambda: {"page": 2}) == {"page": 1}
+
+        cache.delete(CommentListCache.stale_key(request))
+        started = time.monotonic()
+        assert CommentListCache.get_or_set(request, lambda: {"page": 3}) == {"page": 3}
+        assert time.monotonic() - started < 1
+
+
+@pytest.mark.django_db
+class TestCommentModeration:
+    endpoint = "/api/comments/"
+
+    @pytest.fixture
+    def moderator(self, db):
+        return User.objects.create_superuser(
+            username="moderator", email="moderator@example.com", password="testpassword"
+        )
+
+    @pytest.fixture
+    def thread(self, user_fixture):
+        root = Comment.objects.create(author=user_fixture, text="Root")
+        reply = Comment.objects.create(author=user_fixture, parent=root, text="Reply")
+        nested = Comment.objects.create(author=user_fixture, parent=reply, text="Nested")
+        other = Comment.objects.create(author=user_fixture, text="Other thread")
+        return root, reply, nested, other
+
+    def test_delete_removes_subtree_by_default(self, client, user_fixture, thread):
+        root, reply, nested, other = thread
+        client.force_authenticate(user=user_fixture)
+        response = client.delete(f"{self.endpoint}{reply.public_id}/")
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert set(Comment.objects.values_list("pk", flat=True)) == {root.pk, other.pk}
+
+    def test_delete_hides_whole_subtree(self, client, user_fixture, thread, settings,
+                                        django_assert_max_num_queries):
+        settings.COMMENT_SOFT_DELETE = True
+        root, reply, nested, other = thread
+        client.force_authenticate(user=user_fixture)
+        with django_assert_max_num_queries(6):
+            response = client.delete(f"{self.endpoint}{reply.public_id}/")
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+
+        active = dict(Comment.objects.values_list("pk", "active"))
+        assert active == {root.pk: True, reply.pk: False, nested.pk: False, other.pk: True}
+
+        response = client.get(f"{self.endpoint}{reply.public_id}/")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        response = client.get(f"{self.endpoint}{root.public_id}/replies/", {"tree": 1})
+        assert response.data == []
+
+    def test_superuser_hard_delete(self, client, moderator, thread, settings):
+        settings.COMMENT_SOFT_DELETE = True
+        root, reply, nested, other = thread
+        client.force_authenticate(user=moderator)
+        response = client.delete(f"{self.endpoint}{reply.public_id}/?hard=1")
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert set(Comment.objects.values_list("pk", flat=True)) == {root.pk, other.pk}
+
+    def test_queue_hide_and_restore(self, client, moderator, thread):
+        root, reply, nested, other = thread
+        client.force_authenticate(user=moderator)
+
+        response = client.post(f"{self.endpoint}{root.public_id}/hide/")
+        assert response.data == {"hidden": 3}
+
+        seen = []
+        url = f"{self.endpoint}moderation/?limit=2"
+        while url:
+            response = client.get(url)
+            assert response.status_code == status.HTTP_200_OK
+            seen.extend(item["id"] for item in response.data["results"])
+            url = response.data["next"]
+        assert sorted(seen) == sorted(c.public_id.hex for c in (root, reply, nested))
+
+        response = client.post(f"{self.endpoint}{root.public_id}/restore/")
+        assert response.data == {"restored": 3}
+        assert not Comment.objects.filter(active=False).exists()
+
+    def test_restore_keeps_separately_hidden_replies(self, client, moderator, thread):
+        root, reply, nested, other = thread
+        client.force_authenticate(user=moderator)
+
+        client.post(f"{self.endpoint}{nested.public_id}/hide/")
+        response = client.post(f"{self.endpoint}{root.public_id}/hide/")
+        assert response.data == {"hidden": 2}
+
+        # ответ внутри скрытой ветки возвращает только свою часть того же скрытия
+        response = client.post(f"{self.endpoint}{reply.public_id}/restore/")
+        assert response.data == {"restored": 1}
+        response = client.post(f"{self.endpoint}{root.public_id}/restore/")
+        assert response.data == {"restored": 1}
+
+        active = dict(Comment.objects.values_list("pk", "active"))
+        assert active == {root.pk: True, reply.pk: True, nested.pk: False, other.pk: True}
+
+    def test_queue_is_superuser_only(self, client, user_fixture, thread):
+        client.force_authenticate(user=user_fixture)
+        response = client.get(f"{self.endpoint}moderation/")
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        response = client.post(f"{self.endpoint}{thread[0].public_id}/hide/")
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+class TestCommentObjectCache:
+    endpoint = "/api/comments/"
+
+    @pytest.fixture(autouse=True)
+    def object_cache(self, settings):
+        settings.OBJECT_CACHE_ENABLED = True
+        ObjectCache.local.clear("object:")
+        ObjectCache.invalidate_model(Comment)
+        # liked тоже без БД: кеш лайков считается прогретым
+        redis.set(CommentLikesCache.warm_key(), 1)
+        yield
+        redis.delete(CommentLikesCache.warm_key())
+
+    @staticmethod
+    def lookups(result):
+        return REGISTRY.get_sample_value(
+            "object_cache_lookups_total", {"model": "core_comment.comment", "result": result}
+        ) or 0
+
+    def test_retrieve_is_served_from_cache(self, client, user_fixture, comment_fixture,
+                                           django_assert_num_queries):
+        client.force_authenticate(user=user_fixture)
+        misses, local_hits = self.lookups("miss"), self.lookups("local_hit")
+
+        client.get(f"{self.endpoint}{comment_fixture.public_id}/")
+        with django_assert_num_queries(0):
+            response = client.get(f"{self.endpoint}{comment_fixture.public_id}/")
+        assert response.data["id"] == comment_fixture.public_id.hex
+        assert self.lookups("miss") == misses + 1
+        assert self.lookups("local_hit") == local_hits + 1
+
+        # другой процесс: LRU пуст, объект приходит из Redis
+        ObjectCache.local.clear("object:")
+        with django_assert_num_queries(0):
+            client.get(f"{self.endpoint}{comment_fixture.public_id}/")
+
+    def test_update_and_soft_delete_invalidate(self, client, user_fixture, comment_fixture, settings):
+        settings.COMMENT_SOFT_DELETE = True
+        client.force_authenticate(user=user_fixture)
+        url = f"{self.endpoint}{comment_fixture.public_id}/"
+        client.get(url)
+
+        client.put(url, {"text": "Edited text."})
+        assert client.get(url).data["text"] == "Edited text."
+
+        assert client.delete(url).status_code == status.HTTP_204_NO_CONTENT
+        assert client.get(url).status_code == status.HTTP_404_NOT_FOUND
+
+    def test_writes_load_fresh_rows(self, client, user_fixture, comment_fixture):
+        client.force_authenticate(user=user_fixture)
+        url = f"{self.endpoint}{comment_fixture.public_id}/"
+        client.get(url)
+        # UPDATE мимо сигналов: закешированная копия устарела
+        Comment.objects.filter(pk=comment_fixture.pk).update(likes_count=5)
+
+        client.put(url, {"text": "Edited text."})
+
+        comment_fixture.refresh_from_db()
+        assert comment_fixture.text == "Edited text."
+        assert comment_fixture.likes_count == 5
+
+    def test_refresh_likes_count_invalidates(self, client, user_fixture, comment_fixture):
+        url = f"{self.endpoint}{comment_fixture.public_id}/"
+        client.get(url)
+        generation_key = ObjectCache.generation_key(Comment)
+        generation = cache.get(generation_key, 0)
+        key = ObjectCache.key(Comment, comment_fixture.public_id)
+        assert cache.get(key) is not None
+
+        Comment.objects.refresh_likes_count([comment_fixture.pk])
+
+        # сбрасывается только пересчитанный комментарий, остальной кеш модели остается
+        assert cache.get(key) is None
+        assert cache.get(generation_key, 0) == generation
@@ -0,0 +1,109 @@
+from io import BytesIO
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from PIL import Image, UnidentifiedImageError
+
+IMAGE_SIGNATURES = {
+    'image/jpeg': (b'\xff\xd8\xff',),
+    'image/png': (b'\x89PNG\r\n\x1a\n',),
+    'image/gif': (b'GIF87a', b'GIF89a'),
+}
+
+# Байт на пиксель после декодирования (RGBA) - по нему считаем память на картинку
+BYTES_PER_PIXEL = 4
+
+
+def max_image_pixels():
+    return settings.ATTACHMENT_MAX_DECODE_BYTES // BYTES_PER_PIXEL
+
+
+class AttachmentUploadHandler(FileUploadHandler):
+    """
+    Проверяет вложения комментариев (поле files) прямо во время загрузки:
+    лимиты размера, сигнатура файла и размеры картинки из заголовка.
+    Файл, не прошедший проверку, пропускается, а ошибка сохраняется в
+    request.upload_errors - ее поднимает CommentSerializer.validate.
+    Сами данные дальше пишут стандартные обработчики (память/временный файл).
+    """
+    field_name = 'files'
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.active = field_name == self.field_name
+        if not self.active:
+            return
+
+        self.is_image = (content_type or '').startswith('image/')
+        self.max_size = settings.ATTACHMENT_MAX_IMAGE_SIZE if self.is_image else settings.ATTACHMENT_MAX_TEXT_SIZE
+        self.received = 0
+        self.head = BytesIO()
+        self.header_checked = False
+
+        if self.is_image and content_type not in IMAGE_SIGNATURES:
+            self.reject("Image must be in JPG, GIF, or PNG format.")
+        if not self.is_image and not file_name.lower().endswith('.txt'):
+            self.reject("Text file must be in TXT format.")
+        if content_length is not None and content_length > self.max_size:
+            self.reject_too_large()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+
+        if self.received == 0:
+            self.sniff(raw_data)
+
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self.reject_too_large()
+
+        if self.is_image and not self.header_checked:
+            self.check_image_header(raw_data)
+
+        return raw_data
+
+    def file_complete(self, file_size):
+        # SkipFile отсюда Django уже не обрабатывает, поэтому только записываем ошибку
+        if self.active and self.is_image and not self.header_checked:
+            self.record_error("Invalid image file.")
+        return None
+
+    def sniff(self, raw_data):
+        if self.is_image:
+            if not raw_data.startswith(IMAGE_SIGNATURES[self.content_type]):
+                self.reject("Image content does not match its type.")
+        elif b'\x00' in raw_data[:1024]:
+            self.reject("Text file must be in TXT format.")
+
+    def check_image_header(self, raw_data):
+        # размеры читаются из заголовка без декодирования пикселей
+        self.head.write(raw_data)
+        try:
+            width, height = Image.open(BytesIO(self.head.getvalue())).size
+        except (UnidentifiedImageError, OSError, SyntaxError):
+            if self.head.tell() >= settings.ATTACHMENT_MAX_HEADER_SIZE:
+                self.reject("Invalid image file.")
+            return
+        except Image.DecompressionBombError:
+            self.reject("Image dimensions are too large.")
+
+        self.header_checked = True
+        self.head = None
+        if width * height > max_image_pixels():
+            self.reject("Image dimensions are too large.")
+
+    def reject_too_large(self):
+        if self.is_image:
+            self.reject("Image file is too large.")
+        self.reject("Text file is too large (max 100kb).")
+
+    def reject(self, message):
+        self.record_error(message)
+        raise SkipFile(message)
+
+    def record_error(self, message):
+        errors = getattr(self.request, 'upload_errors', None)
+        if errors is None:
+            errors = self.request.upload_errors = []
+        errors.append(f"{self.file_name}: {message}")
+        self.active = False
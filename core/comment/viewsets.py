@@ -1,22 +1,44 @@
+from django.conf import settings
+from django.http import Http404
 from rest_framework.response import Response
 from rest_framework import status
 from core.abstract.viewsets import AbstractViewSet
 from core.comment.models import Comment
 from core.comment.serializers import CommentSerializer
-from core.auth.viewsets.permissions  import UserPermission
+from core.comment.pagination import CommentCursorPagination
+from core.comment.services.comment_list_cache import CommentListCache
+from core.auth.authentication import StatelessReadJWTAuthentication
+from core.auth.viewsets.permissions  import UserPermission, IsModerator
 from rest_framework.decorators import action
-from django.db.models import Case, When, CharField, F
-from rest_framework.permissions import AllowAny
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS, AllowAny
+from rest_framework.renderers import JSONRenderer
+from core.comment.services.broadcaster import CommentBroadcaster
 
 class CommentViewSet(AbstractViewSet):
-    queryset = Comment.objects.all()
+    queryset = Comment.objects.with_related()
     http_method_names = ['get', 'post', 'put', 'delete']
     serializer_class = CommentSerializer
     permission_classes = (UserPermission,)
+    authentication_classes = (StatelessReadJWTAuthentication,)
     filter_backends = [] 
     ordering = None
+    sort_fields = {
+        'username': 'sort_name',
+        'email': 'sort_email',
+        'created': 'created',
+    }
+
+    @property
+    def paginator(self):
+        # ?cursor=... или ?pagination=cursor включают keyset-пагинацию вместо limit/offset
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if 'cursor' in params or params.get('pagination') == 'cursor':
+                self._paginator = CommentCursorPagination()
+            else:
+                return super().paginator
+        return self._paginator
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -26,78 +48,112 @@ class CommentViewSet(AbstractViewSet):
         if not user.is_authenticated or not user.is_superuser:
             queryset = queryset.filter(active=True, parent__isnull=True)
             
-        # Аннотация для sortable_name
-        queryset = queryset.annotate(
-            sortable_name=Case(
-                When(guest_name__isnull=False, then=F('guest_name')),
-                default=F('author__username'), 
-                output_field=CharField(),
-            )
-        )
-        
-        # Аннотация для sortable_email
-        queryset = queryset.annotate(
-            sortable_email=Case(
-                When(guest_email__isnull=False, then=F('guest_email')),
-                default=F('author__email'),
-                output_field=CharField(),
-            )
-        )
-        
         sort_by = self.request.query_params.get('sort_by')
         order = self.request.query_params.get('order', 'desc')
         
-        sort_field = None
-        
-        if sort_by == 'username':
-            sort_field = 'sortable_name' if order == 'asc' else '-sortable_name'
-        elif sort_by == 'email':
-            sort_field = 'sortable_email' if order == 'asc' else '-sortable_email'
-        elif sort_by == 'created':
-            sort_field = 'created' if order == 'asc' else '-created'
-            
-        if sort_field:
-            queryset = queryset.order_by(sort_field)
+        # сортировка по хранимым колонкам, id - для однозначного порядка (keyset)
+        sort_field = self.sort_fields.get(sort_by)
+        if sort_field is None:
+            queryset = queryset.order_by('-created', '-id')
+        elif order == 'asc':
+            queryset = queryset.order_by(sort_field, 'id')
+        else:
+            queryset = queryset.order_by(f'-{sort_field}', '-id')
 
         return queryset
 
     
     
+    def list(self, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return super().list(request, *args, **kwargs)
+        data = CommentListCache.get_or_set(
+            request,
+            lambda: super(CommentViewSet, self).list(request, *args, **kwargs).data,
+        )
+        return Response(data)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        CommentListCache.invalidate()
+
+    def perform_destroy(self, instance):
+        # с COMMENT_SOFT_DELETE ветка скрывается и попадает в очередь модерации,
+        # суперпользователь может удалить физически через ?hard=1
+        hard = self.request.query_params.get('hard') in ('1', 'true') and self.request.user.is_superuser
+        if settings.COMMENT_SOFT_DELETE and not hard:
+            Comment.objects.hide_subtree(instance)
+        else:
+            instance.delete()
+        CommentListCache.invalidate()
+
+    def _is_moderator(self):
+        user = self.request.user
+        return user.is_authenticated and user.is_superuser
+    
     def get_object(self):
-        obj = Comment.objects.get_object_by_public_id(self.kwargs['pk'])
+        queryset = Comment.objects.with_related()
+        # кеш только для чтения: save() по закешированной копии вернул бы в БД устаревшие active/likes_count
+        if self.request.method in SAFE_METHODS:
+            obj = queryset.get_cached_by_public_id(self.kwargs['pk'])
+        else:
+            obj = queryset.get_object_by_public_id(self.kwargs['pk'])
+        if not obj.active and not self._is_moderator():
+            raise Http404("Comment does not exist")
         self.check_object_permissions(self.request, obj)
         return obj
     
-    def _broadcast_comment_created(self, comment, request):
-        channel_layer = get_channel_layer()
-        data = CommentSerializer(comment, context={'request': request}).data
-        async_to_sync(channel_layer.group_send)(
+    @staticmethod
+    def _render_event(event_type, data):
+        # JSON собирается один раз и уходит подписчикам как есть, без повторного кодирования
+        return JSONRenderer().render({"type": event_type, "comment": data}).decode("utf-8")
+
+    def _broadcast_comment_created(self, data):
+        CommentBroadcaster.publish(
             "comments_list",
             {
                 "type": "comment_created",
-                "comment": data,
+                "payload": self._render_event("comment_created", data),
             }
         )
 
-    def _broadcast_reply_created(self, root_comment, reply, request):
-        channel_layer = get_channel_layer()
-        data = CommentSerializer(reply, context={'request': request}).data
-        async_to_sync(channel_layer.group_send)(
+    def _broadcast_reply_created(self, root_comment, data):
+        CommentBroadcaster.publish(
             f"comment_{root_comment.public_id}",
             {
                 "type": "reply_created",
-                "comment": data,
+                "payload": self._render_event("reply_created", data),
             }
         )
     
+    @staticmethod
+    def _build_tree(comment, replies, data):
+        nodes = {}
+        for reply, item in zip(replies, data):
+            item['replies'] = []
+            nodes[reply.id] = item
+
+        tree = []
+        for reply in replies:
+            if reply.parent_id == comment.id:
+                tree.append(nodes[reply.id])
+                continue
+            # родитель скрыт (hide, фоновое удаление автора) - ответ уходит вместе с его веткой
+            parent = nodes.get(reply.parent_id)
+            if parent is not None:
+                parent['replies'].append(nodes[reply.id])
+        return tree
+    
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         comment = serializer.save()
-        self._broadcast_comment_created(comment, request)
+        CommentListCache.invalidate()
+
+        data = CommentSerializer(comment, context={'request': request}).data
+        self._broadcast_comment_created(data)
 
-        return Response(CommentSerializer(comment, context={'request': request}).data,
-                        status=status.HTTP_201_CREATED)
+        return Response(data, status=status.HTTP_201_CREATED)
     
     
     @action(detail=True, methods=['get', 'post'], permission_classes=[AllowAny])
@@ -105,9 +161,31 @@ class CommentViewSet(AbstractViewSet):
         comment = self.get_object()
 
         if request.method == 'GET':
-            replies = comment.replies.all()
+            tree = request.query_params.get('tree') in ('1', 'true')
+            depth = request.query_params.get('depth')
+
+            if depth is not None:
+                try:
+                    depth = int(depth)
+                except ValueError:
+                    raise ValidationError({"depth": "Must be an integer."})
+                if depth < 1:
+                    raise ValidationError({"depth": "Must be at least 1."})
+                tree = True
+
+            queryset = Comment.objects.with_related()
+            if not self._is_moderator():
+                queryset = queryset.filter(active=True)
+
+            if not tree:
+                replies = queryset.filter(parent=comment)
+                serializer = self.get_serializer(replies, many=True)
+                return Response(serializer.data)
+
+            # вся ветка одним запросом по path, дальше собираем вложенность в памяти
+            replies = list(queryset.get_subtree(comment, max_depth=depth))
             serializer = self.get_serializer(replies, many=True)
-            return Response(serializer.data)
+            return Response(self._build_tree(comment, replies, serializer.data))
 
         elif request.method == 'POST':
             data = request.data.copy()
@@ -115,18 +193,17 @@ class CommentViewSet(AbstractViewSet):
             serializer = self.get_serializer(data=data, context={'request': request})
             if serializer.is_valid():
                 reply = serializer.save()
+                CommentListCache.invalidate()
 
                 # находим корневой коммент (чтобы вся ветка жила в одной WS-группе)
                 root = comment
-                while root.parent_id:
-                    root = root.parent
+                if comment.root_id and comment.root_id != comment.id:
+                    root = Comment.objects.only('public_id').get(pk=comment.root_id)
 
-                self._broadcast_reply_created(root, reply, request)
+                data = CommentSerializer(reply, context={'request': request}).data
+                self._broadcast_reply_created(root, data)
 
-                return Response(
-                    CommentSerializer(reply, context={'request': request}).data,
-                    status=status.HTTP_201_CREATED
-                )
+                return Response(data, status=status.HTTP_201_CREATED)
 
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -137,6 +214,7 @@ class CommentViewSet(AbstractViewSet):
         comment = self.get_object()
         user = request.user
         user.like(comment)
+        CommentListCache.invalidate()
         serializer = self.serializer_class(comment, context={'request': request})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -146,5 +224,31 @@ class CommentViewSet(AbstractViewSet):
         comment = self.get_object()
         user = request.user
         user.unlike(comment)
+        CommentListCache.invalidate()
         serializer = self.serializer_class(comment, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsModerator])
+    def moderation(self, request):
+        # очередь скрытых комментариев, keyset по (created, id) на частичном индексе
+        queryset = Comment.objects.with_related().filter(active=False).order_by('-created', '-id')
+        paginator = CommentCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
+    @action(detail=True, methods=['post'], permission_classes=[IsModerator])
+    def hide(self, request, pk=None):
+        comment = self.get_object()
+        hidden = Comment.objects.hide_subtree(comment)
+        CommentListCache.invalidate()
+        return Response({"hidden": hidden}, status=status.HTTP_200_OK)
+
+
+    @action(detail=True, methods=['post'], permission_classes=[IsModerator])
+    def restore(self, request, pk=None):
+        comment = self.get_object()
+        restored = Comment.objects.restore_subtree(comment)
+        CommentListCache.invalidate()
+        return Response({"restored": restored}, status=status.HTTP_200_OK)
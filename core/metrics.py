@@ -0,0 +1,42 @@
+import hmac
+import os
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest, multiprocess
+
+# коллекторы, которые читают общее состояние (Redis) и не зависят от процесса
+shared_collectors = []
+
+
+def register_shared_collector(collector):
+    shared_collectors.append(collector)
+    REGISTRY.register(collector)
+
+
+def metrics_registry():
+    """
+    Счетчики prometheus_client живут в памяти процесса. Под gunicorn/uvicorn с несколькими
+    воркерами entrypoint задает PROMETHEUS_MULTIPROC_DIR, воркеры пишут значения в файлы,
+    и любой из них отдает сумму по всем процессам.
+    """
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    for collector in shared_collectors:
+        registry.register(collector)
+    return registry
+
+
+def metrics_allowed(request):
+    """Bearer METRICS_TOKEN, а без токена - только адреса из METRICS_ALLOWED_IPS"""
+    if settings.METRICS_TOKEN:
+        header = request.META.get("HTTP_AUTHORIZATION", "")
+        return hmac.compare_digest(header, f"Bearer {settings.METRICS_TOKEN}")
+    return request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS
+
+
+def metrics_view(request):
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(metrics_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,77 @@
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from core.comment.models import Comment
+from core.comment.services.comment_likes_cache import CommentLikesCache
+from core.comment.services.comment_list_cache import CommentListCache
+from core.user.models import User
+
+
+def deletion_progress_key(public_id):
+    return f"user:{public_id}:deletion"
+
+
+def get_deletion_progress(public_id):
+    return cache.get(deletion_progress_key(public_id))
+
+
+def set_deletion_progress(public_id, **progress):
+    cache.set(deletion_progress_key(public_id), progress, timeout=settings.USER_DELETE_PROGRESS_TIMEOUT)
+
+
+@shared_task(queue="user-cleanup", autoretry_for=(Exception,), retry_backoff=True, max_retries=5)
+def purge_user(user_id):
+    """
+    Удаляет пользователя с большим количеством комментариев по частям:
+    каждая пачка комментариев (вместе с ветками ответов и вложениями) в своей
+    короткой транзакции, затем лайки пользователя, затем сама запись User.
+    Задачу можно перезапускать - она продолжает с того, что осталось.
+    """
+    try:
+        user = User.objects.get(pk=user_id)
+    except User.DoesNotExist:
+        return
+
+    batch_size = settings.USER_DELETE_BATCH_SIZE
+    total = Comment.objects.filter(author=user).count()
+    deleted = 0
+    set_deletion_progress(user.public_id, status="running", total_comments=total, deleted_comments=0)
+
+    while True:
+        batch = list(
+            Comment.objects.filter(author=user).order_by('id').values_list('id', 'path')[:batch_size]
+        )
+        if not batch:
+            break
+
+        # ветки ответов к комментариям пачки находим по индексу path
+        subtree = Q(id__in=[comment_id for comment_id, _ in batch])
+        for _, path in batch:
+            if path:
+                subtree |= Q(path__startswith=path)
+        comment_ids = list(Comment.objects.filter(subtree).values_list('id', flat=True))
+
+        with transaction.atomic():
+            Comment.objects.filter(id__in=comment_ids).delete()
+        CommentLikesCache.purge(comment_ids)
+        CommentListCache.invalidate()
+
+        deleted += len(batch)
+        set_deletion_progress(user.public_id, status="running", total_comments=total, deleted_comments=deleted)
+
+    # лайки пользователя на чужих комментариях
+    liked = User.comments_liked.through.objects.filter(user_id=user.id)
+    while True:
+        comment_ids = list(liked.values_list('comment_id', flat=True)[:batch_size])
+        if not comment_ids:
+            break
+        liked.filter(comment_id__in=comment_ids).delete()
+        Comment.objects.refresh_likes_count(comment_ids)
+        CommentLikesCache.bulk_unlike(comment_ids, user.id)
+
+    user.delete()
+    CommentListCache.invalidate()
+    set_deletion_progress(user.public_id, status="done", total_comments=total, deleted_comments=deleted)
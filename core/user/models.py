@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from core.abstract.models import AbstractModel, AbstractModelManager
@@ -66,10 +67,17 @@ class User(AbstractModel, AbstractBaseUser, PermissionsMixin):
         return f"{self.first_name} {self.last_name}"
     
     def like(self, comment):
+        if settings.COMMENT_LIKES_WRITE_BEHIND:
+            # в БД лайк попадет при следующем flush_comment_likes
+            CommentLikesCache.like(comment.id, self.id, write_behind=True)
+            return
         self.comments_liked.add(comment)
         CommentLikesCache.like(comment.id, self.id)
 
     def unlike(self, comment):
+        if settings.COMMENT_LIKES_WRITE_BEHIND:
+            CommentLikesCache.unlike(comment.id, self.id, write_behind=True)
+            return
         self.comments_liked.remove(comment)
         CommentLikesCache.unlike(comment.id, self.id)
 
@@ -1,28 +1,97 @@
-import boto3
-from django.conf import settings
-from django.db.models.signals import post_delete
+from collections import Counter
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
-from core.comment.models import CommentAttachment
+from core.abstract.object_cache import ObjectCache
+from core.auth.authentication import DELETED_VERSION, AuthUserCache, auth_version
+from core.comment.models import Comment, CommentAttachment
+from core.comment.services.s3 import S3DeletionQueue
+from core.user.models import User
 
 
 @receiver(post_delete, sender=CommentAttachment)
 def delete_comment_attachment_file_from_s3(sender, instance, **kwargs):
     """
-    Удаляет файл вложения комментария из AWS S3 после удаления юзера.
+    Ставит файл вложения (и его варианты) в очередь на удаление из AWS S3.
+    Ключи копятся до коммита транзакции и удаляются пачками в celery.
     """
     if instance.file:
-        s3 = boto3.client(
-            "s3",
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_S3_REGION_NAME,
-        )
-
-        bucket_name = settings.AWS_STORAGE_BUCKET_NAME
-        file_path = instance.file.name   # comment_attachments/2025/11/...
-
-        try:
-            s3.delete_object(Bucket=bucket_name, Key=file_path)
-            print(f"Deleted comment attachment from S3: {file_path}")
-        except Exception as e:
-            print(f"Error deleting attachment file from S3: {e}")
\ No newline at end of file
+        variant_paths = [image["name"] for image in instance.variants.get("images", [])]
+        S3DeletionQueue.add(instance.pk, [instance.file.name, *variant_paths])
+
+
+@receiver(post_save, sender=User)
+def sync_comment_sort_columns(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Обновляет sort_name/sort_email в комментариях пользователя после смены username/email.
+    """
+    if created:
+        return
+    if update_fields is not None and not {"username", "email"} & set(update_fields):
+        return
+
+    updated = Comment.objects.filter(author=instance, guest_name__isnull=True).exclude(
+        sort_name=instance.username
+    ).update(sort_name=instance.username)
+    updated += Comment.objects.filter(author=instance, guest_email__isnull=True).exclude(
+        sort_email=instance.email
+    ).update(sort_email=instance.email)
+    if updated:
+        # в закешированных комментариях автор лежит вместе с комментарием
+        ObjectCache.invalidate_model(Comment)
+
+
+@receiver(m2m_changed, sender=User.comments_liked.through)
+def sync_comment_likes_count(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Поддерживает хранимый likes_count при add/remove/clear лайков через ORM:
+    likes_count = likes_count ± n, без пересчета COUNT по всем лайкам комментария.
+    """
+    if action == "post_add" and pk_set:
+        # в post_add pk_set - только реально вставленные строки
+        if reverse:
+            # comment.liked_by.add(user) и т.п. - меняется один комментарий
+            deltas = {instance.pk: len(pk_set)}
+        else:
+            deltas = dict.fromkeys(pk_set, 1)
+        Comment.objects.change_likes_count(deltas)
+    elif action in ("pre_remove", "pre_clear"):
+        # remove передает запрошенные id, clear - никаких: удаляемые строки считаем заранее
+        rows = sender.objects.filter(**{"comment_id" if reverse else "user_id": instance.pk})
+        if action == "pre_remove":
+            rows = rows.filter(**{"user_id__in" if reverse else "comment_id__in": pk_set})
+        instance._removed_likes = Counter(rows.values_list("comment_id", flat=True))
+    elif action in ("post_remove", "post_clear"):
+        removed = instance.__dict__.pop("_removed_likes", None)
+        if removed:
+            Comment.objects.change_likes_count({comment_id: -count for comment_id, count in removed.items()})
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_object(sender, instance, **kwargs):
+    """Сбрасывает объект в ObjectCache после сохранения/удаления"""
+    ObjectCache.invalidate(sender, instance.public_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_auth_user(sender, instance, signal, **kwargs):
+    """
+    Сбрасывает пользователя в кеше JWT-аутентификации и записывает его новую версию:
+    после смены пароля, is_active или is_superuser старые токены перестают приниматься.
+    """
+    version = DELETED_VERSION if signal is post_delete else auth_version(instance)
+    AuthUserCache.invalidate(instance.pk, version)
+
+
+@receiver(post_save, sender=CommentAttachment)
+@receiver(post_delete, sender=CommentAttachment)
+def invalidate_cached_attachment_comment(sender, instance, **kwargs):
+    """Вложения закешированы вместе с комментарием"""
+    if not ObjectCache.enabled():
+        return
+    public_id = Comment.objects.filter(pk=instance.comment_id).values_list("public_id", flat=True).first()
+    if public_id is not None:
+        ObjectCache.invalidate(Comment, public_id)
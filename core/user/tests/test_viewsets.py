@@ -1,5 +1,12 @@
 
+import pytest
 from core.fixtures.user import user_fixture
+from core.fixtures.comment import comment_fixture
+from core.comment.models import Comment
+from core.comment.services.comment_likes_cache import CommentLikesCache
+from core.user.models import User
+from core.user.celery_tasks.tasks import purge_user, get_deletion_progress
+from functools import partial
 
 
 
@@ -43,3 +50,46 @@ class TestUserViewSet:
         response = client.patch(f"{self.endpoint}{user_fixture.public_id}/", data)
         assert response.status_code == status.HTTP_200_OK
         
+
+
+@pytest.mark.django_db
+class TestUserAsyncDelete:
+    endpoint = "/api/users/"
+
+    def test_async_delete_deactivates_and_queues(self, client, user_fixture, comment_fixture,
+                                                 django_capture_on_commit_callbacks):
+        client.force_authenticate(user=user_fixture)
+
+        with django_capture_on_commit_callbacks() as callbacks:
+            response = client.delete(f"{self.endpoint}{user_fixture.public_id}/?mode=async")
+
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        user_fixture.refresh_from_db()
+        comment_fixture.refresh_from_db()
+        assert not user_fixture.is_active
+        assert not comment_fixture.active
+        # кроме задачи после коммита сбрасывается и кеш аутентификации пользователя
+        assert [callback.args for callback in callbacks if isinstance(callback, partial)] == [(user_fixture.id,)]
+
+        response = client.get(f"{self.endpoint}{user_fixture.public_id}/deletion/")
+        assert response.data["status"] == "queued"
+
+    def test_purge_user(self, user_fixture, comment_fixture, settings):
+        settings.USER_DELETE_BATCH_SIZE = 2
+        other = User.objects.create_user(username="other", email="other@example.com", password="testpassword")
+        reply = Comment.objects.create(author=other, parent=comment_fixture, text="Reply.")
+        for i in range(4):
+            Comment.objects.create(author=user_fixture, text=f"Comment {i}")
+        other_comment = Comment.objects.create(author=other, text="Stays.")
+        user_fixture.like(other_comment)
+
+        purge_user(user_fixture.id)
+
+        assert not User.objects.filter(pk=user_fixture.pk).exists()
+        assert not Comment.objects.filter(pk=reply.pk).exists()
+        assert list(Comment.objects.all()) == [other_comment]
+        assert CommentLikesCache.likes_count(other_comment.id) == 0
+        assert not CommentLikesCache.has_liked(other_comment.id, user_fixture.id)
+        assert get_deletion_progress(user_fixture.public_id) == {
+            "status": "done", "total_comments": 5, "deleted_comments": 5,
+        }
@@ -1,10 +1,18 @@
 from rest_framework import viewsets
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 from core.abstract.viewsets import AbstractViewSet
 from core.user.models import User
 from core.user.serializers import UserSerializer
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.decorators import action
+from django.db import transaction
+from functools import partial
+from uuid import UUID
+from core.abstract.object_cache import ObjectCache
+from core.comment.models import Comment
+from core.comment.services.comment_list_cache import CommentListCache
+from core.user.celery_tasks.tasks import purge_user, get_deletion_progress, set_deletion_progress
 # Create your views here.
 
 class UserViewSet(AbstractViewSet):
@@ -18,7 +26,11 @@ class UserViewSet(AbstractViewSet):
         return User.objects.exclude(is_superuser=True)
     
     def get_object(self):
-        obj = User.objects.get_object_by_public_id(self.kwargs['pk'])
+        # кеш только для чтения: изменения и удаление идут по свежей строке из БД
+        if self.request.method in SAFE_METHODS:
+            obj = User.objects.get_cached_by_public_id(self.kwargs['pk'])
+        else:
+            obj = User.objects.get_object_by_public_id(self.kwargs['pk'])
         self.check_object_permissions(self.request, obj)
         return obj
     
@@ -26,4 +38,32 @@ class UserViewSet(AbstractViewSet):
         user = self.get_object()
         if not request.user.is_superuser and request.user != user:
             return Response(status=status.HTTP_403_FORBIDDEN)
-        return super().destroy(request, *args, **kwargs)
\ No newline at end of file
+
+        if request.query_params.get('mode') != 'async':
+            return super().destroy(request, *args, **kwargs)
+
+        # ?mode=async: сразу отключаем аккаунт и прячем комментарии, удаление - в фоне
+        with transaction.atomic():
+            user.is_active = False
+            user.save(update_fields=['is_active'])
+            Comment.objects.filter(author=user, active=True).update(active=False)
+            ObjectCache.invalidate_model(Comment)
+            transaction.on_commit(partial(purge_user.delay, user.id))
+        CommentListCache.invalidate()
+
+        set_deletion_progress(user.public_id, status="queued")
+        return Response({"status": "queued"}, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'])
+    def deletion(self, request, pk=None):
+        """Прогресс фонового удаления пользователя"""
+        try:
+            public_id = UUID(str(pk))
+        except ValueError:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        if not request.user.is_superuser and request.user.public_id != public_id:
+            return Response(status=status.HTTP_403_FORBIDDEN)
+        progress = get_deletion_progress(public_id)
+        if progress is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response(progress)
\ No newline at end of file
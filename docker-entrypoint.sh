@@ -1,16 +1,48 @@
 #!/bin/bash
 set -e
 
+# SERVER_MODE=wsgi (по умолчанию) - gunicorn, только HTTP
+# SERVER_MODE=asgi - uvicorn, HTTP + WebSocket в одних процессах
+WEB_CONCURRENCY=${WEB_CONCURRENCY:-4}
+WS_CONCURRENCY=${WS_CONCURRENCY:-2}
+
+# метрики нескольких воркеров одного контейнера складываются через файлы (см. core/metrics.py)
+prepare_metrics_dir() {
+    export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+}
 
 if [ "$CONTAINER_TYPE" = "master" ]; then
 #    python manage.py collectstatic --noinput
 #    echo "collected static"
     python manage.py migrate | tee migration_logs.txt
     echo "migrated"
-    gunicorn --timeout 100 --bind 0.0.0.0:8000 CoreRoot.wsgi:application
+    prepare_metrics_dir
+    if [ "$SERVER_MODE" = "asgi" ]; then
+        uvicorn CoreRoot.asgi:application --host 0.0.0.0 --port 8000 --workers "$WEB_CONCURRENCY" --proxy-headers
+    else
+        gunicorn --timeout 100 --bind 0.0.0.0:8000 -c CoreRoot/gunicorn_conf.py CoreRoot.wsgi:application
+    fi
+fi
+
+# отдельные процессы только под WebSocket (nginx проксирует на них /ws/)
+if [ "$CONTAINER_TYPE" = "ws" ]; then
+    prepare_metrics_dir
+    uvicorn CoreRoot.asgi:application --host 0.0.0.0 --port 8001 --workers "$WS_CONCURRENCY" --proxy-headers \
+        --ws websockets-sansio --ws-ping-interval 20 --ws-ping-timeout 20 --limit-concurrency "${WS_MAX_CONNECTIONS:-10000}"
 fi
 
 if [ "$CONTAINER_TYPE" = "c-worker" ]; then
-    celery -A "CoreRoot" worker -l info -Q "test-task" --concurrency=3
+    celery -A "CoreRoot" worker -l info -Q "test-task,s3-cleanup,user-cleanup,comment-likes" --concurrency=3
 fi
 
+# периодические задачи (CELERY_BEAT_SCHEDULE)
+if [ "$CONTAINER_TYPE" = "c-beat" ]; then
+    celery -A "CoreRoot" beat -l info
+fi
+
+# обработка картинок вложений (CPU), отдельно от почтовых задач
+if [ "$CONTAINER_TYPE" = "c-images" ]; then
+    celery -A "CoreRoot" worker -l info -Q "comment-images" --concurrency="${IMAGE_WORKER_CONCURRENCY:-2}"
+fi
@@ -59,13 +59,26 @@ const Comment = ({ comment, onLike, onDislike, onReplyCreated }) => {
             <div className="attachments">
               {comment.attachments.map((att) => {
                 if (att.attachment_type === "image") {
+                  const srcset = att.srcset || {};
                   return (
-                    <img
-                      key={att.id}
-                      src={att.file}
-                      alt="Вложение-изображение"
-                      onClick={() => setLightboxImg(att.file)}
-                    />
+                    <picture key={att.id}>
+                      {srcset.avif && (
+                        <source type="image/avif" srcSet={srcset.avif} sizes="320px" />
+                      )}
+                      {srcset.webp && (
+                        <source type="image/webp" srcSet={srcset.webp} sizes="320px" />
+                      )}
+                      <img
+                        src={att.file}
+                        alt="Вложение-изображение"
+                        style={
+                          att.placeholder
+                            ? { backgroundImage: `url(${att.placeholder})`, backgroundSize: "cover" }
+                            : undefined
+                        }
+                        onClick={() => setLightboxImg(att.file)}
+                      />
+                    </picture>
                   );
                 } else if (att.attachment_type === "text") {
                   return (
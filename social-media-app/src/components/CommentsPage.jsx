@@ -98,7 +98,7 @@ export default function CommentsPage({ commentId, onBack }) {
         const data = JSON.parse(event.data);
         console.log("WS message:", data);
 
-        if (data.type === "reply_created") {
+        if (data.type === "reply_created" || data.type === "attachment_ready") {
           // Просто перезагружаем тред
           fetchComment();
         }
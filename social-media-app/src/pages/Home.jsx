@@ -121,6 +121,22 @@ function Home() {
             setComments((prev) => [mapped, ...prev]);
           }
         }
+
+        // картинка обработана в фоне — подменяем вложение у комментария
+        if (data.type === "attachment_ready") {
+          setComments((prev) =>
+            prev.map((c) =>
+              c.id === data.comment_id
+                ? {
+                    ...c,
+                    attachments: (c.attachments || []).map((att) =>
+                      att.id === data.attachment.id ? data.attachment : att
+                    ),
+                  }
+                : c
+            )
+          );
+        }
       } catch (e) {
         console.error("Ошибка парсинга WS:", e);
       }